@@ -0,0 +1,110 @@
+import argparse
+import csv
+import logging
+import os
+import sys
+from itertools import islice
+
+from file_handlers.pickle import PickleFileHandler
+from file_handlers.prefix_table import INPUT_SUFFIX as TABLE_SUFFIX
+from file_handlers.prefix_table import PrefixTable
+
+DEFAULT_RIB = 'raw/routeviews/latest-rib.pfx2as'
+FALLBACK_RIB = 'raw/routeviews/latest-rib.pickle.bz2'
+OUTPUT_DIR = 'parsed/'
+OUTPUT_SUFFIX = '-origin-as.csv'
+ORIGIN_COLUMN = 'origin_as'
+# Number of rows looked up at once.
+BATCH_SIZE = 1000000
+
+
+def load_rib(rib: str) -> PrefixTable:
+    if rib.endswith(TABLE_SUFFIX):
+        logging.info(f'Reading file: {rib}')
+        return PrefixTable.load(rib)
+    return PrefixTable.from_rtree(PickleFileHandler(rib).read())
+
+
+def get_column_index(header: list, column: str) -> int:
+    """Return the index of column, which is either a name in header or
+    a zero-based index. Return -1 if the column does not exist."""
+    if column in header:
+        return header.index(column)
+    if column.isdigit() and int(column) < len(header):
+        return int(column)
+    return -1
+
+
+def annotate(table: PrefixTable, reader, writer, column: str) -> int:
+    """Copy the CSV rows from reader to writer and append the origin AS
+    of the address in column. Return the number of rows."""
+    header = next(reader, None)
+    if header is None:
+        logging.error('Input is empty.')
+        return 0
+    column_idx = get_column_index(header, column)
+    if column_idx < 0:
+        logging.error(f'Column {column} not found in header: {header}')
+        return 0
+    writer.writerow(header + [ORIGIN_COLUMN])
+    row_count = 0
+    no_match_count = 0
+    while True:
+        rows = list(islice(reader, BATCH_SIZE))
+        if not rows:
+            break
+        addresses = [row[column_idx] if column_idx < len(row) else str()
+                     for row in rows]
+        origins = table.get_origins(table.lookup(addresses))
+        for row, origin in zip(rows, origins):
+            if origin is None:
+                no_match_count += 1
+                origin = str()
+            writer.writerow(row + [origin])
+        row_count += len(rows)
+        logging.info(f'Annotated {row_count} rows')
+    logging.info(f'No match for {no_match_count} of {row_count} addresses')
+    return row_count
+
+
+def main() -> None:
+    log_format = '%(asctime)s %(levelname)s %(message)s'
+    logging.basicConfig(
+        format=log_format,
+        level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser(
+        description='Append the origin AS of the longest matching prefix '
+                    'of the addresses in a CSV column.')
+    parser.add_argument('input', help='CSV file with a header line')
+    parser.add_argument('-c', '--column', default='address',
+                        help='name or zero-based index of the address column')
+    parser.add_argument('-r', '--rib',
+                        help='prefix table or pickled radix tree. Defaults '
+                             f'to {DEFAULT_RIB} or {FALLBACK_RIB}')
+    parser.add_argument('-o', '--output',
+                        help='Manually specify output file')
+    args = parser.parse_args()
+
+    rib = args.rib
+    if not rib:
+        rib = DEFAULT_RIB if os.path.exists(DEFAULT_RIB) else FALLBACK_RIB
+    table = load_rib(rib)
+    if not len(table):
+        logging.error(f'No prefixes found in {rib}')
+        sys.exit(1)
+
+    output = args.output
+    if not output:
+        output_name = os.path.splitext(os.path.basename(args.input))[0]
+        output = OUTPUT_DIR + output_name + OUTPUT_SUFFIX
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    logging.info(f'Writing file: {output}')
+    with open(args.input, 'r', newline='') as i, \
+            open(output, 'w', newline='') as o:
+        annotate(table, csv.reader(i), csv.writer(o, lineterminator='\n'),
+                 args.column)
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
@@ -0,0 +1,315 @@
+import bz2
+import ipaddress
+import os
+import pickle
+import random
+import socket
+import string
+import struct
+import sys
+
+import radix
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from file_handlers.compression import open_file
+from file_handlers.mrt import (MRT_HEADER, RIB_IPV4_UNICAST, RIB_IPV6_UNICAST,
+                               TABLE_DUMP_V2)
+from file_handlers.msgpack import write_records
+
+PEER_INDEX_TABLE = 1
+PEER_TYPE_AS4 = 0x02
+TIMESTAMP = 1618531200
+
+
+def make_record(subtype: int, body: bytes) -> bytes:
+    return MRT_HEADER.pack(TIMESTAMP, TABLE_DUMP_V2, subtype, len(body)) + body
+
+
+def make_peer_index_table(peer_count: int) -> bytes:
+    body = socket.inet_aton('192.0.2.1') + struct.pack('!H', 0) \
+           + struct.pack('!H', peer_count)
+    for peer in range(peer_count):
+        peer_ip = socket.inet_aton(f'198.51.100.{peer % 256}')
+        body += struct.pack('!B', PEER_TYPE_AS4) + peer_ip + peer_ip \
+                + struct.pack('!I', 64512 + peer)
+    return make_record(PEER_INDEX_TABLE, body)
+
+
+def make_attributes(as_path: list, ipv6: bool) -> bytes:
+    # ORIGIN
+    attrs = struct.pack('!BBBB', 0x40, 1, 1, 0)
+    segment = struct.pack('!BB', 2, len(as_path)) \
+              + struct.pack(f'!{len(as_path)}I', *as_path)
+    attrs += struct.pack('!BBB', 0x40, 2, len(segment)) + segment
+    if ipv6:
+        # Abbreviated MP_REACH_NLRI as used by TABLE_DUMP_V2.
+        next_hop = socket.inet_pton(socket.AF_INET6, '2001:db8::1')
+        attrs += struct.pack('!BBBB', 0x80, 14, len(next_hop) + 1,
+                             len(next_hop)) + next_hop
+    else:
+        attrs += struct.pack('!BBB', 0x40, 3, 4) \
+                 + socket.inet_aton('198.51.100.1')
+    return attrs
+
+
+def make_rib_record(seq: int,
+                    family: int,
+                    addr: bytes,
+                    pfx_len: int,
+                    paths: list) -> bytes:
+    pfx_bytes = (pfx_len + 7) // 8
+    body = struct.pack('!IB', seq, pfx_len) + addr[:pfx_bytes] \
+           + struct.pack('!H', len(paths))
+    ipv6 = family == socket.AF_INET6
+    for peer, as_path in enumerate(paths):
+        attrs = make_attributes(as_path, ipv6)
+        body += struct.pack('!HIH', peer, TIMESTAMP, len(attrs)) + attrs
+    subtype = RIB_IPV6_UNICAST if ipv6 else RIB_IPV4_UNICAST
+    return make_record(subtype, body)
+
+
+def generate_rib(output: str,
+                 prefix_count: int,
+                 peer_count: int,
+                 ipv6_share: float = 0.15,
+                 seed: int = 0) -> int:
+    """Write a synthetic bz2-compressed TABLE_DUMP_V2 RIB to output and
+    return the number of (prefix, peer) entries."""
+    rng = random.Random(seed)
+    v6_count = int(prefix_count * ipv6_share)
+    v4_count = prefix_count - v6_count
+    entry_count = 0
+    with bz2.open(output, 'wb') as f:
+        f.write(make_peer_index_table(peer_count))
+        seq = 0
+        for family, count, addr_len in ((socket.AF_INET, v4_count, 4),
+                                        (socket.AF_INET6, v6_count, 16)):
+            for idx in range(count):
+                if family == socket.AF_INET:
+                    pfx_len = rng.choice((16, 20, 22, 23, 24, 24, 24))
+                    addr = struct.pack('!I', (idx << 8) + (1 << 24))
+                else:
+                    pfx_len = rng.choice((32, 36, 40, 44, 48, 48))
+                    addr = struct.pack('!HIH', 0x2001, idx, 0) \
+                           + bytes(addr_len - 8)
+                origin = rng.randint(1, 400000)
+                paths = [[64512 + peer,
+                          rng.randint(1, 400000),
+                          origin]
+                         for peer in range(rng.randint(1, peer_count))]
+                f.write(make_rib_record(seq, family, addr, pfx_len, paths))
+                entry_count += len(paths)
+                seq += 1
+    return entry_count
+
+
+def generate_rib_pickle(output: str,
+                        prefix_count: int,
+                        ipv6_share: float = 0.15,
+                        seed: int = 0) -> int:
+    """Write a synthetic pickled radix tree as created by
+    get_rib_snapshot.py to output and return the number of prefixes."""
+    rng = random.Random(seed)
+    v6_count = int(prefix_count * ipv6_share)
+    rtree = radix.Radix()
+    for idx in range(prefix_count - v6_count):
+        pfx_len = rng.choice((16, 20, 22, 23, 24, 24, 24))
+        network = ((idx << 8) + (1 << 24)) & ~((1 << (32 - pfx_len)) - 1)
+        node = rtree.add(network=str(ipaddress.IPv4Address(network)),
+                         masklen=pfx_len)
+        node.data['as'] = make_origin(rng)
+    for idx in range(v6_count):
+        pfx_len = rng.choice((32, 36, 40, 44, 48, 48))
+        network = ((0x2001 << 112) + (idx << 80)) \
+            & ~((1 << (128 - pfx_len)) - 1)
+        node = rtree.add(network=str(ipaddress.IPv6Address(network)),
+                         masklen=pfx_len)
+        node.data['as'] = make_origin(rng)
+    with open_file(output, 'wb') as f:
+        pickle.dump(rtree, f, pickle.HIGHEST_PROTOCOL)
+    return len(rtree.nodes())
+
+
+def make_origin(rng: random.Random) -> str:
+    # Roughly 1 % of the prefixes have an AS_SET origin.
+    if rng.random() < 0.01:
+        return '{' + ','.join(str(rng.randint(1, 400000))
+                              for _ in range(rng.randint(2, 4))) + '}'
+    return str(rng.randint(1, 400000))
+
+
+REGISTRIES = ('afrinic', 'apnic', 'arin', 'lacnic', 'ripencc')
+COUNTRIES = ('AU', 'BR', 'CN', 'DE', 'FR', 'GB', 'IN', 'JP', 'NL', 'RU', 'US',
+             'ZA')
+DELEGATION_STATUS = ('assigned', 'assigned', 'assigned', 'assigned',
+                     'available', 'reserved')
+
+
+def generate_nro(output: str,
+                 asn_count: int,
+                 ipv4_count: int,
+                 ipv6_count: int,
+                 seed: int = 0) -> int:
+    """Write a synthetic bz2-compressed NRO extended delegation file to
+    output and return the number of lines."""
+    rng = random.Random(seed)
+    record_count = asn_count + ipv4_count + ipv6_count
+    line_count = 0
+    with bz2.open(output, 'wt') as f:
+        f.write(f'2.3|nro|20210715|{record_count}|19830705|20210714|+0000\n')
+        for record_type, count in (('asn', asn_count),
+                                   ('ipv4', ipv4_count),
+                                   ('ipv6', ipv6_count)):
+            f.write(f'nro|*|{record_type}|*|{count}|summary\n')
+        line_count += 4
+        asn = 1
+        for idx in range(asn_count):
+            value = 1 if rng.random() < 0.95 else rng.randint(2, 10)
+            f.write(make_delegation_line(rng, 'asn', asn, value))
+            asn += value
+        for idx in range(ipv4_count):
+            start = ipaddress.IPv4Address((1 << 24) + (idx << 10))
+            f.write(make_delegation_line(rng, 'ipv4', start, 1024))
+        for idx in range(ipv6_count):
+            start = ipaddress.IPv6Address((0x2001 << 112) + (idx << 96))
+            f.write(make_delegation_line(rng, 'ipv6', start, 32))
+        line_count += record_count
+    return line_count
+
+
+def make_delegation_line(rng: random.Random,
+                         record_type: str,
+                         start,
+                         value: int) -> str:
+    status = rng.choice(DELEGATION_STATUS)
+    cc = rng.choice(COUNTRIES) if status == 'assigned' else ''
+    opaque_id = ''.join(rng.choices(string.hexdigits, k=16))
+    return f'{rng.choice(REGISTRIES)}|{cc}|{record_type}|{start}|{value}|' \
+           f'20100101|{status}|{opaque_id}|e-stats\n'
+
+
+def generate_probes(output: str,
+                    probe_count: int,
+                    max_asn: int = 400000,
+                    seed: int = 0) -> int:
+    """Write a synthetic bz2-compressed msgpack probe dump to output and
+    return the number of probes."""
+    rng = random.Random(seed)
+
+    def probes():
+        for probe_id in range(1, probe_count + 1):
+            asn_v4 = rng.randint(1, max_asn) if rng.random() < 0.9 else None
+            asn_v6 = asn_v4 if asn_v4 and rng.random() < 0.4 else None
+            connected = rng.random() < 0.4
+            yield {'address_v4': f'192.0.2.{probe_id % 256}'
+                                 if asn_v4 else None,
+                   'address_v6': f'2001:db8::{probe_id:x}' if asn_v6 else None,
+                   'asn_v4': asn_v4,
+                   'asn_v6': asn_v6,
+                   'country_code': rng.choice(COUNTRIES)
+                                   if rng.random() < 0.98 else None,
+                   'description': f'Probe {probe_id}',
+                   'first_connected': 1288367583 + probe_id,
+                   'geometry': {'type': 'Point',
+                                'coordinates': [rng.uniform(-180, 180),
+                                                rng.uniform(-90, 90)]},
+                   'id': probe_id,
+                   'is_anchor': rng.random() < 0.1,
+                   'is_public': rng.random() < 0.8,
+                   'last_connected': 1618548732,
+                   'prefix_v4': '192.0.2.0/24' if asn_v4 else None,
+                   'prefix_v6': '2001:db8::/32' if asn_v6 else None,
+                   'status': {'id': 1 if connected else 2,
+                              'name': 'Connected' if connected
+                                      else 'Disconnected',
+                              'since': '2021-04-09T08:40:48Z'},
+                   'status_since': 1617957648,
+                   'total_uptime': rng.randint(0, 318510508),
+                   'type': 'Probe'}
+
+    return write_records(output, probes())
+
+
+def generate_peeringdb_ixp(output: str, ix_count: int, seed: int = 0) -> int:
+    """Write a synthetic PeeringDB IXP snapshot with one ixlan and two
+    prefixes per IXP to output and return the number of objects."""
+    rng = random.Random(seed)
+    data = {'ix': list(), 'ixlan': list(), 'ixpfx': list()}
+    for ix_id in range(1, ix_count + 1):
+        data['ix'].append({'id': ix_id,
+                           'org_id': ix_id,
+                           'name': f'IX {ix_id}',
+                           'name_long': f'Internet Exchange {ix_id}, Inc.',
+                           'city': 'City',
+                           'country': rng.choice(COUNTRIES),
+                           'status': 'ok'})
+        data['ixlan'].append({'id': ix_id, 'ix_id': ix_id, 'status': 'ok'})
+        data['ixpfx'].append(
+            {'id': 2 * ix_id,
+             'ixlan_id': ix_id,
+             'protocol': 'IPv4',
+             'prefix': f'{ipaddress.IPv4Address((10 << 24) + (ix_id << 8))}'
+                       f'/24',
+             'status': 'ok'})
+        data['ixpfx'].append(
+            {'id': 2 * ix_id + 1,
+             'ixlan_id': ix_id,
+             'protocol': 'IPv6',
+             'prefix': f'2001:7f8:{ix_id:x}::/64',
+             'status': 'ok'})
+    with open_file(output, 'wb') as f:
+        pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+    return sum(len(objects) for objects in data.values())
+
+
+def generate_peeringdb_netixlan(output: str,
+                                netixlan_count: int,
+                                ix_count: int,
+                                seed: int = 0) -> int:
+    """Write a synthetic PeeringDB netixlan snapshot to output and return
+    the number of objects."""
+    rng = random.Random(seed)
+    data = list()
+    for netixlan_id in range(1, netixlan_count + 1):
+        ix_id = rng.randint(1, ix_count)
+        has_v6 = rng.random() < 0.7
+        data.append({'id': netixlan_id,
+                     'net_id': rng.randint(1, 30000),
+                     'ix_id': ix_id,
+                     'name': f'IX {ix_id}',
+                     'ixlan_id': ix_id,
+                     'speed': 10000,
+                     'asn': rng.randint(1, 400000),
+                     'ipaddr4': str(ipaddress.IPv4Address(
+                         (10 << 24) + (ix_id << 8) + netixlan_id % 256)),
+                     'ipaddr6': f'2001:7f8:{ix_id:x}::{netixlan_id:x}'
+                                if has_v6 else None,
+                     'status': 'ok'})
+    with open_file(output, 'wb') as f:
+        pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+    return len(data)
+
+
+THYME_REGIONS = ('AfriNIC', 'APNIC', 'ARIN', 'LACNIC', 'RIPE')
+
+
+def generate_thyme(output: str, filler_lines: int, seed: int = 0) -> int:
+    """Write a synthetic thyme BGP analysis summary to output and return
+    the number of lines."""
+    rng = random.Random(seed)
+    lines = [f'Total ASes present in the Internet Routing Table:'
+             f'{rng.randint(60000, 80000):>20}',
+             f'Average AS path length visible in the Internet Routing Table:'
+             f'{rng.uniform(3, 6):>10.1f}']
+    for region in THYME_REGIONS:
+        lines.append(f'{region} Region origin ASes present in the Internet '
+                     f'Routing Table:{rng.randint(1000, 30000):>10}')
+        lines.append(f'Average {region} Region AS path length visible:'
+                     f'{rng.uniform(3, 6):>20.1f}')
+    for idx in range(filler_lines):
+        lines.insert(rng.randint(0, len(lines)),
+                     f'Prefixes from unregistered ASNs in the Routing Table:'
+                     f'{rng.randint(0, 1000):>10}')
+    with open(output, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return len(lines)
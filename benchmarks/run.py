@@ -0,0 +1,437 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, 'downloaders'))
+import generators
+
+DEFAULT_DATA_DIR = os.path.join(BENCHMARK_DIR, 'data')
+DEFAULT_RESULT_DIR = os.path.join(BENCHMARK_DIR, 'results')
+MANIFEST_FILE = 'manifest.json'
+# Input sizes at realistic scale, roughly matching the current size of
+# the real data sets.
+REALISTIC_SIZES = {
+    'rib_prefixes': 1000000,
+    'rib_peers': 10,
+    'nro_asns': 120000,
+    'nro_ipv4': 250000,
+    'nro_ipv6': 200000,
+    'probes': 30000,
+    'ixps': 1000,
+    'netixlans': 45000,
+    'thyme_lines': 180,
+}
+SCALES = {'small': 0.01, 'realistic': 1, '10x': 10}
+THYME_LOCATIONS = ('au', 'current', 'hk', 'london', 'singapore')
+# Relative slowdown that is reported as a regression. Smaller absolute
+# differences are considered noise.
+REGRESSION_THRESHOLD = 0.1
+MIN_REGRESSION_SECONDS = 0.05
+
+
+def get_sizes(scale: str) -> dict:
+    factor = SCALES[scale]
+    sizes = {key: max(1, int(value * factor))
+             for key, value in REALISTIC_SIZES.items()}
+    # The number of peers does not grow with the table.
+    sizes['rib_peers'] = REALISTIC_SIZES['rib_peers']
+    return sizes
+
+
+def generate_inputs(data_dir: str, scale: str, seed: int) -> dict:
+    """Generate the synthetic inputs for the scale unless they exist
+    already. Return a map of input name to {'file', 'items'}."""
+    scale_dir = os.path.join(data_dir, f'{scale}-{seed}')
+    manifest_file = os.path.join(scale_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_file):
+        with open(manifest_file, 'r') as f:
+            return json.load(f)
+    os.makedirs(scale_dir, exist_ok=True)
+    sizes = get_sizes(scale)
+    thyme_dir = os.path.join(scale_dir, 'thyme')
+    os.makedirs(thyme_dir, exist_ok=True)
+    tasks = {
+        'rib': ('rib.bz2', lambda file: generators.generate_rib(
+            file, sizes['rib_prefixes'], sizes['rib_peers'], seed=seed)),
+        'rib_pickle': ('rib.pickle.bz2',
+                       lambda file: generators.generate_rib_pickle(
+                           file, sizes['rib_prefixes'], seed=seed)),
+        'nro': ('delegated-stats.bz2', lambda file: generators.generate_nro(
+            file, sizes['nro_asns'], sizes['nro_ipv4'], sizes['nro_ipv6'],
+            seed=seed)),
+        'probes': ('probes.msgpack.bz2',
+                   lambda file: generators.generate_probes(
+                       file, sizes['probes'], seed=seed)),
+        'peeringdb_ixp': ('peeringdb-ixp.pickle.bz2',
+                          lambda file: generators.generate_peeringdb_ixp(
+                              file, sizes['ixps'], seed=seed)),
+        'peeringdb_netixlan': (
+            'peeringdb-netixlan.pickle.bz2',
+            lambda file: generators.generate_peeringdb_netixlan(
+                file, sizes['netixlans'], sizes['ixps'], seed=seed)),
+        'thyme': ('thyme', lambda path: sum(
+            generators.generate_thyme(
+                os.path.join(path, f'latest-bgp-analysis-{location}.txt'),
+                sizes['thyme_lines'], seed=seed + idx)
+            for idx, location in enumerate(THYME_LOCATIONS))),
+    }
+    manifest = dict()
+    for name, (file_name, generate) in tasks.items():
+        file = os.path.join(scale_dir, file_name)
+        logging.info(f'Generating {name} input: {file}')
+        start = time.perf_counter()
+        items = generate(file)
+        logging.info(f'Generated {items} items in '
+                     f'{time.perf_counter() - start:.2f}s')
+        manifest[name] = {'file': file, 'items': items}
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# Each benchmark is a function that receives the manifest and an output
+# directory and does the untimed preparation. It returns the timed
+# function, the input whose items are used to compute the throughput,
+# and the unit of the items.
+
+def bench_rib_native(manifest: dict, out_dir: str) -> tuple:
+    from get_rib_snapshot import process_rib, read_mrt
+    file = manifest['rib']['file']
+    return lambda: process_rib(read_mrt(file)), 'rib', 'entries'
+
+
+def bench_rib_native_first_peer(manifest: dict, out_dir: str) -> tuple:
+    from get_rib_snapshot import process_rib, read_mrt
+    file = manifest['rib']['file']
+    return lambda: process_rib(read_mrt(file, first_peer_only=True)), \
+        'rib', 'entries'
+
+
+def bench_rib_table(manifest: dict, out_dir: str) -> tuple:
+    from get_rib_snapshot import process_rib_table, read_mrt
+    file = manifest['rib']['file']
+    return lambda: process_rib_table(read_mrt(file)), 'rib', 'entries'
+
+
+def bench_rib_bgpdump(manifest: dict, out_dir: str) -> tuple:
+    from get_rib_snapshot import process_rib, read_bgpdump
+    if not shutil.which('bgpdump'):
+        raise RuntimeError('bgpdump not found')
+    file = manifest['rib']['file']
+    return lambda: process_rib(read_bgpdump(file)), 'rib', 'entries'
+
+
+def bench_as_prefix_count(manifest: dict, out_dir: str) -> tuple:
+    from file_handlers.pickle import PickleFileHandler
+    from get_as_prefix_count import count_prefixes
+
+    def run() -> None:
+        file = PickleFileHandler(manifest['rib_pickle']['file'],
+                                 output=os.path.join(out_dir, 'as-prefix.csv'))
+        file.write(count_prefixes(file.read(), coverage=True))
+    return run, 'rib_pickle', 'prefixes'
+
+
+def bench_assigned_asns(manifest: dict, out_dir: str) -> tuple:
+    from file_handlers.bz2 import Bz2FileHandler
+    from file_handlers.asn_ranges import ASN_HEADER
+    from get_assigned_as_numbers import get_assigned_asns
+
+    def run() -> None:
+        file = Bz2FileHandler(manifest['nro']['file'],
+                              output=os.path.join(out_dir, 'asns.csv'))
+        file.write(get_assigned_asns(file.iter_lines()), ASN_HEADER)
+    return run, 'nro', 'lines'
+
+
+def probe_benchmark(manifest: dict,
+                    out_dir: str,
+                    get_lines: Callable) -> tuple:
+    from file_handlers.msgpack import MsgpackFileHandler
+
+    def run() -> None:
+        file = MsgpackFileHandler(manifest['probes']['file'],
+                                  output=os.path.join(out_dir, 'probes.csv'))
+        file.write(get_lines(file.iter_records()))
+    return run, 'probes', 'probes'
+
+
+def bench_group_probes_by_as(manifest: dict, out_dir: str) -> tuple:
+    from group_probes_by_as import group_by_as
+    return probe_benchmark(manifest, out_dir,
+                           lambda data: group_by_as(data, False))
+
+
+def bench_group_probes_by_country(manifest: dict, out_dir: str) -> tuple:
+    from group_probes_by_country import group_by_country
+    return probe_benchmark(manifest, out_dir,
+                           lambda data: group_by_country(data, False))
+
+
+def bench_group_probes_by_rir(manifest: dict, out_dir: str) -> tuple:
+    from file_handlers.bz2 import Bz2FileHandler
+    from get_assigned_as_numbers import get_assigned_asn_ranges
+    from group_probes_by_rir import group_by_rir
+    asn_map = get_assigned_asn_ranges(
+        Bz2FileHandler(manifest['nro']['file']).iter_lines())
+    return probe_benchmark(manifest, out_dir,
+                           lambda data: group_by_rir(data, asn_map, False))
+
+
+def pickle_benchmark(manifest: dict,
+                     out_dir: str,
+                     input_name: str,
+                     get_lines: Callable) -> tuple:
+    from file_handlers.pickle import PickleFileHandler
+
+    def run() -> None:
+        file = PickleFileHandler(manifest[input_name]['file'],
+                                 output=os.path.join(out_dir, 'ixp.csv'))
+        file.write(get_lines(file.read()))
+    return run, input_name, 'objects'
+
+
+def bench_ixp_info(manifest: dict, out_dir: str) -> tuple:
+    from get_ixp_info import make_data_lines
+    return pickle_benchmark(manifest, out_dir, 'peeringdb_ixp',
+                            lambda data: make_data_lines(data['ix']))
+
+
+def bench_ixp_prefixes(manifest: dict, out_dir: str) -> tuple:
+    from get_ixp_prefixes import connect_pfx_data
+    return pickle_benchmark(manifest, out_dir, 'peeringdb_ixp',
+                            connect_pfx_data)
+
+
+def bench_ixp_participants(manifest: dict, out_dir: str) -> tuple:
+    from get_ixp_participants import make_data_lines
+    return pickle_benchmark(manifest, out_dir, 'peeringdb_netixlan',
+                            make_data_lines)
+
+
+def bench_as_stats(manifest: dict, out_dir: str) -> tuple:
+    from get_as_stats import get_stats
+    path = manifest['thyme']['file']
+    files = [os.path.join(path, f'latest-bgp-analysis-{location}.txt')
+             for location in THYME_LOCATIONS]
+    return lambda: [get_stats(file) for file in files], 'thyme', 'lines'
+
+
+BENCHMARKS = {
+    'rib-native': bench_rib_native,
+    'rib-native-first-peer': bench_rib_native_first_peer,
+    'rib-table': bench_rib_table,
+    'rib-bgpdump': bench_rib_bgpdump,
+    'as-prefix-count': bench_as_prefix_count,
+    'assigned-asns': bench_assigned_asns,
+    'group-probes-by-as': bench_group_probes_by_as,
+    'group-probes-by-country': bench_group_probes_by_country,
+    'group-probes-by-rir': bench_group_probes_by_rir,
+    'ixp-info': bench_ixp_info,
+    'ixp-prefixes': bench_ixp_prefixes,
+    'ixp-participants': bench_ixp_participants,
+    'as-stats': bench_as_stats,
+}
+
+
+def get_max_rss() -> int:
+    """Return the peak resident set size of this process in KiB.
+
+    ru_maxrss is inherited from the parent process across fork and exec,
+    so the high water mark of the current address space is used where
+    available."""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_child(name: str, manifest_file: str, out_dir: str) -> None:
+    """Run a single benchmark in this process and print the result as
+    JSON. Each benchmark runs in a fresh process so that the peak RSS
+    is not influenced by other benchmarks."""
+    with open(manifest_file, 'r') as f:
+        manifest = json.load(f)
+    os.makedirs(out_dir, exist_ok=True)
+    run, input_name, unit = BENCHMARKS[name](manifest, out_dir)
+    setup_rss = get_max_rss()
+    start = time.perf_counter()
+    run()
+    wall = time.perf_counter() - start
+    items = manifest[input_name]['items']
+    print(json.dumps({'wall_s': wall,
+                      'peak_rss_kib': get_max_rss(),
+                      'setup_rss_kib': setup_rss,
+                      'items': items,
+                      'unit': unit,
+                      'throughput': items / wall if wall else None}))
+
+
+def run_benchmark(name: str,
+                  manifest_file: str,
+                  out_dir: str,
+                  repeat: int) -> dict:
+    """Run the benchmark repeat times and return the result with the
+    lowest wall time and the highest peak RSS, or None if it failed."""
+    best = None
+    for _ in range(repeat):
+        ret = subprocess.run([sys.executable, os.path.abspath(__file__),
+                              '--child', name,
+                              '--manifest', manifest_file,
+                              '--out-dir', out_dir],
+                             cwd=ROOT_DIR, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, text=True)
+        if ret.returncode != 0:
+            error = ret.stderr.strip().splitlines()
+            logging.warning(f'{name}: failed: {error[-1] if error else ""}')
+            return None
+        result = json.loads(ret.stdout.strip().splitlines()[-1])
+        if best is None:
+            best = result
+            continue
+        peak_rss = max(best['peak_rss_kib'], result['peak_rss_kib'])
+        if result['wall_s'] < best['wall_s']:
+            best = result
+        best['peak_rss_kib'] = peak_rss
+    return best
+
+
+def get_git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=ROOT_DIR, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline_file: str, threshold: float) -> bool:
+    """Print the change of the results relative to the baseline. Return
+    True if any benchmark got slower by more than threshold."""
+    with open(baseline_file, 'r') as f:
+        baseline = json.load(f)['results']
+    regression = False
+    print(f'{"benchmark":<24} {"base s":>9} {"new s":>9} {"change":>8} '
+          f'{"base MiB":>9} {"new MiB":>9}')
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f'{name:<24} {"-":>9} {result["wall_s"]:>9.3f}')
+            continue
+        change = result['wall_s'] / base['wall_s'] - 1
+        flag = ''
+        if change > threshold \
+                and result['wall_s'] - base['wall_s'] > MIN_REGRESSION_SECONDS:
+            flag = '  REGRESSION'
+            regression = True
+        print(f'{name:<24} {base["wall_s"]:>9.3f} {result["wall_s"]:>9.3f} '
+              f'{change:>+8.1%} {base["peak_rss_kib"] / 1024:>9.1f} '
+              f'{result["peak_rss_kib"] / 1024:>9.1f}{flag}')
+    return regression
+
+
+def main() -> None:
+    log_format = '%(asctime)s %(levelname)s %(message)s'
+    logging.basicConfig(
+        format=log_format,
+        level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser(
+        description='Benchmark the parsers on synthetic inputs and store '
+                    'wall time, peak RSS, and throughput as JSON.')
+    parser.add_argument('benchmarks', nargs='*',
+                        help='run only these benchmarks. Available: '
+                             + ', '.join(BENCHMARKS))
+    parser.add_argument('-s', '--scale', choices=SCALES, default='realistic',
+                        help='input size')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed for the input generators')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='run each benchmark this many times')
+    parser.add_argument('-d', '--data-dir', default=DEFAULT_DATA_DIR,
+                        help='directory for the generated inputs, which '
+                             'are reused by later runs')
+    parser.add_argument('-o', '--output',
+                        help='result file. Defaults to '
+                             f'{DEFAULT_RESULT_DIR}/<timestamp>-<scale>.json')
+    parser.add_argument('-c', '--compare',
+                        help='compare the results to this result file and '
+                             'exit with code 1 on regressions')
+    parser.add_argument('--threshold', type=float,
+                        default=REGRESSION_THRESHOLD,
+                        help='relative slowdown reported as regression')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--manifest', help=argparse.SUPPRESS)
+    parser.add_argument('--out-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Keep the output of the parsers out of the result.
+        logging.getLogger().setLevel(logging.ERROR)
+        run_child(args.child, args.manifest, args.out_dir)
+        return
+
+    names = args.benchmarks or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            logging.error(f'Unknown benchmark: {name}')
+            sys.exit(1)
+
+    generate_inputs(args.data_dir, args.scale, args.seed)
+    scale_dir = os.path.join(args.data_dir, f'{args.scale}-{args.seed}')
+    manifest_file = os.path.join(scale_dir, MANIFEST_FILE)
+    out_dir = os.path.join(scale_dir, 'out')
+    results = dict()
+    for name in names:
+        logging.info(f'Running {name}')
+        result = run_benchmark(name, manifest_file, out_dir, args.repeat)
+        if result is None:
+            continue
+        results[name] = result
+        logging.info(f'{name}: {result["wall_s"]:.3f}s, '
+                     f'{result["peak_rss_kib"] / 1024:.1f} MiB peak RSS, '
+                     f'{result["throughput"]:.0f} {result["unit"]}/s')
+    shutil.rmtree(out_dir, ignore_errors=True)
+
+    now = datetime.now(tz=timezone.utc)
+    output = args.output
+    if not output:
+        output = os.path.join(DEFAULT_RESULT_DIR,
+                              now.strftime('%Y%m%d-%H%M%S')
+                              + f'-{args.scale}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'timestamp': now.isoformat(),
+                   'commit': get_git_commit(),
+                   'python': platform.python_version(),
+                   'machine': platform.machine(),
+                   'cpu_count': os.cpu_count(),
+                   'scale': args.scale,
+                   'sizes': get_sizes(args.scale),
+                   'repeat': args.repeat,
+                   'results': results}, f, indent=2)
+    logging.info(f'Wrote results to {output}')
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
@@ -0,0 +1,68 @@
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Tuple
+
+import requests
+
+from clients.session import DEFAULT_TIMEOUT
+
+API_BASE = 'https://atlas.ripe.net/api/v2/'
+PAGE_SIZE = 500
+MAX_WORKERS = 8
+
+
+def get_json(session: requests.Session, url: str, params: dict) -> dict:
+    """Query url and return the decoded JSON reply. Raise a
+    requests.RequestException if the request failed (after retries) or
+    the reply is not valid JSON."""
+    logging.debug(f'Querying {url} with params {params}')
+    r = session.get(url, params=params, timeout=DEFAULT_TIMEOUT)
+    r.raise_for_status()
+    return r.json()
+
+
+def iter_queries(session: requests.Session,
+                 queries: Iterable[Tuple[str, dict]],
+                 max_workers: int = MAX_WORKERS) -> Iterator[dict]:
+    """Execute (url, params) queries concurrently and yield the replies
+    in the order of the queries.
+
+    At most max_workers requests are in flight and at most twice as
+    many replies are buffered, so memory usage does not depend on the
+    number of queries."""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for url, params in queries:
+            pending.append(executor.submit(get_json, session, url, params))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_pages(session: requests.Session,
+               endpoint: str,
+               params: dict,
+               page_size: int = PAGE_SIZE,
+               max_workers: int = MAX_WORKERS) -> Iterator[list]:
+    """Yield the results of a paginated Atlas API endpoint page by
+    page, in order.
+
+    The first page is fetched on its own to get the total result count.
+    Since the page offsets are known afterwards, the remaining pages are
+    fetched concurrently instead of following the 'next' links.
+    """
+    params = dict(params, page_size=page_size)
+    first_page = get_json(session, endpoint, dict(params, page=1))
+    if 'count' not in first_page or 'results' not in first_page:
+        raise requests.RequestException(
+            '"count" or "results" key missing from response data.')
+    count = first_page['count']
+    page_count = max(1, -(-count // page_size))
+    logging.info(f'{endpoint}: {count} results on {page_count} pages')
+    yield first_page['results']
+    queries = ((endpoint, dict(params, page=page))
+               for page in range(2, page_count + 1))
+    for page in iter_queries(session, queries, max_workers):
+        yield page['results']
@@ -0,0 +1,168 @@
+import logging
+import os
+import pickle
+import time
+from typing import Iterable, Tuple
+
+import requests
+
+from clients.session import DEFAULT_TIMEOUT
+from file_handlers.compression import open_file
+
+API_BASE = 'https://peeringdb.com/api/'
+# Changes are requested from a bit before the last sync, so that objects
+# updated while the last sync was running are not missed. Applying a
+# change twice is harmless.
+SINCE_OVERLAP = 300
+# Deleted objects are only visible to since queries for a limited time,
+# so older states are not updated incrementally.
+MAX_STATE_AGE = 7 * 24 * 60 * 60
+STATE_VERSION = 1
+
+
+def query(session: requests.Session,
+          api_base: str,
+          endpoint: str,
+          params: dict) -> list:
+    """Query the PeeringDB API endpoint and return the data list of the
+    reply. Raise a requests.RequestException if the request failed or
+    the reply is invalid."""
+    url = api_base + endpoint
+    logging.info(f'Querying PeeringDB {url} with params {params}')
+    r = session.get(url, params=params, timeout=DEFAULT_TIMEOUT)
+    r.raise_for_status()
+    try:
+        data = r.json()['data']
+    except (ValueError, KeyError, TypeError) as e:
+        raise requests.RequestException(f'Invalid reply: {e}')
+    if not isinstance(data, list):
+        raise requests.RequestException('Invalid reply: data is not a list')
+    return data
+
+
+def fetch_full(session: requests.Session,
+               api_base: str,
+               endpoint: str) -> dict:
+    """Return all 'ok' objects of endpoint as a map of id to object."""
+    # Always query only 'ok' entries
+    return {obj['id']: obj
+            for obj in query(session, api_base, endpoint, {'status': 'ok'})}
+
+
+def fetch_changes(session: requests.Session,
+                  api_base: str,
+                  endpoint: str,
+                  since: int) -> list:
+    """Return all objects of endpoint updated since the specified Unix
+    timestamp, including deleted objects."""
+    return query(session, api_base, endpoint, {'since': since})
+
+
+def fetch_ids(session: requests.Session, api_base: str, endpoint: str) -> set:
+    """Return the ids of all 'ok' objects of endpoint."""
+    return {obj['id'] for obj in query(session, api_base, endpoint,
+                                       {'status': 'ok', 'fields': 'id'})}
+
+
+def apply_changes(objects: dict, changes: list) -> Tuple[int, int]:
+    """Update objects in place with changes and return the number of
+    updated and deleted objects."""
+    updated = 0
+    deleted = 0
+    for obj in changes:
+        if obj.get('status') == 'ok':
+            objects[obj['id']] = obj
+            updated += 1
+        elif objects.pop(obj['id'], None) is not None:
+            deleted += 1
+    return updated, deleted
+
+
+def load_state(file: str) -> dict:
+    """Load the sync state or return None if it does not exist or is
+    invalid."""
+    if not os.path.exists(file):
+        logging.info(f'No sync state found at {file}')
+        return None
+    try:
+        with open_file(file, 'rb') as f:
+            state = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError) as e:
+        logging.warning(f'Failed to read sync state {file}: {e}')
+        return None
+    if not isinstance(state, dict) or state.get('version') != STATE_VERSION:
+        logging.warning(f'Ignoring sync state {file} with unknown format')
+        return None
+    return state
+
+
+def save_state(file: str, state: dict) -> None:
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    tmp_file = file + '.tmp'
+    with open_file(tmp_file, 'wb', 'bz2') as f:
+        pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, file)
+
+
+def sync_endpoint(session: requests.Session,
+                  api_base: str,
+                  endpoint: str,
+                  objects: dict,
+                  since: int) -> dict:
+    """Update objects of endpoint with the changes since the specified
+    timestamp. Return None if the result does not match the objects
+    currently present on PeeringDB."""
+    try:
+        changes = fetch_changes(session, api_base, endpoint, since)
+        updated, deleted = apply_changes(objects, changes)
+        logging.info(f'{endpoint}: {updated} updated, {deleted} deleted '
+                     f'objects')
+        ids = fetch_ids(session, api_base, endpoint)
+    except (requests.RequestException, KeyError, TypeError) as e:
+        logging.warning(f'Incremental sync of {endpoint} failed: {e}')
+        return None
+    if ids != objects.keys():
+        logging.warning(f'{endpoint}: local state is inconsistent '
+                        f'({len(ids - objects.keys())} missing, '
+                        f'{len(objects.keys() - ids)} stale objects)')
+        return None
+    return objects
+
+
+def sync(session: requests.Session,
+         api_base: str,
+         endpoints: Iterable[str],
+         state_file: str,
+         full: bool = False) -> dict:
+    """Return all 'ok' objects of the endpoints as a map of endpoint to
+    a list of objects sorted by id.
+
+    If a recent sync state exists, only objects that changed since the
+    last sync are fetched and applied to the state. An endpoint is
+    fetched completely if there is no usable state, full is set, or the
+    updated state is inconsistent. The new state is saved to state_file.
+    Raise a requests.RequestException if fetching an endpoint failed.
+    """
+    start = time.time()
+    state = None
+    if not full:
+        state = load_state(state_file)
+    if state is not None and start - state['timestamp'] > MAX_STATE_AGE:
+        logging.info(f'Sync state is older than {MAX_STATE_AGE} seconds')
+        state = None
+    data = dict()
+    for endpoint in endpoints:
+        objects = None
+        if state is not None and endpoint in state['objects']:
+            objects = sync_endpoint(session, api_base, endpoint,
+                                    state['objects'][endpoint],
+                                    int(state['timestamp'] - SINCE_OVERLAP))
+        if objects is None:
+            logging.info(f'{endpoint}: full sync')
+            objects = fetch_full(session, api_base, endpoint)
+        data[endpoint] = objects
+    save_state(state_file, {'version': STATE_VERSION,
+                            'timestamp': start,
+                            'objects': data})
+    return {endpoint: [objects[obj_id] for obj_id in sorted(objects)]
+            for endpoint, objects in data.items()}
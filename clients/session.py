@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Timeout in seconds for connecting and between received bytes.
+DEFAULT_TIMEOUT = 60
+RETRIES = 5
+BACKOFF_FACTOR = 1
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def make_session(pool_size: int = 10,
+                 retries: int = RETRIES,
+                 backoff_factor: float = BACKOFF_FACTOR) -> requests.Session:
+    """Create a session that keeps up to pool_size connections per host
+    alive and retries failed requests with exponential backoff."""
+    retry = Retry(total=retries,
+                  backoff_factor=backoff_factor,
+                  status_forcelist=RETRY_STATUS_CODES,
+                  allowed_methods=('GET', 'HEAD'),
+                  respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=pool_size,
+                          pool_maxsize=pool_size,
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class ValidatorCache:
+    """ETag and Last-Modified validators of previously downloaded URLs,
+    stored as JSON in file.
+
+    Validators should only be updated once the response was processed
+    successfully, otherwise a failed download is never retried."""
+
+    def __init__(self, file: str) -> None:
+        self.file = file
+        self.validators = dict()
+        if os.path.exists(file):
+            try:
+                with open(file, 'r') as f:
+                    self.validators = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f'Ignoring invalid validator cache {file}: '
+                                f'{e}')
+
+    def get_headers(self, url: str) -> dict:
+        """Return the headers for a conditional request of url."""
+        headers = dict()
+        validators = self.validators.get(url, dict())
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
+    def update(self, url: str, r: requests.Response) -> None:
+        """Store the validators of the response and save the cache."""
+        validators = dict()
+        if 'ETag' in r.headers:
+            validators['etag'] = r.headers['ETag']
+        if 'Last-Modified' in r.headers:
+            validators['last_modified'] = r.headers['Last-Modified']
+        if not validators:
+            return
+        self.validators[url] = validators
+        os.makedirs(os.path.dirname(self.file) or '.', exist_ok=True)
+        tmp_file = self.file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.validators, f, indent=2)
+        os.replace(tmp_file, self.file)
+
+
+def conditional_get(session: requests.Session,
+                    url: str,
+                    cache: ValidatorCache = None,
+                    stream: bool = False,
+                    **kwargs) -> requests.Response:
+    """Get url with the validators stored in cache (if any) and return
+    the response. The status code is 304 if the content did not change
+    since the validators were stored.
+
+    Raise a requests.RequestException if the request failed (after
+    retries)."""
+    headers = dict(kwargs.pop('headers', dict()))
+    if cache is not None:
+        headers.update(cache.get_headers(url))
+    r = session.get(url, headers=headers, stream=stream,
+                    timeout=kwargs.pop('timeout', DEFAULT_TIMEOUT), **kwargs)
+    r.raise_for_status()
+    return r
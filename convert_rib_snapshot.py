@@ -0,0 +1,44 @@
+import argparse
+import logging
+import os
+import sys
+
+from file_handlers.common import get_file_name
+from file_handlers.pickle import INPUT_SUFFIX, PickleFileHandler
+from file_handlers.prefix_table import INPUT_SUFFIX as TABLE_SUFFIX
+from file_handlers.prefix_table import PrefixTable
+
+DEFAULT_INPUT = 'raw/routeviews/latest-rib.pickle.bz2'
+
+
+def main() -> None:
+    log_format = '%(asctime)s %(levelname)s %(message)s'
+    logging.basicConfig(
+        format=log_format,
+        level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser(
+        description='Convert a pickled radix tree RIB snapshot to a columnar '
+                    'prefix table.')
+    parser.add_argument('-i', '--input',
+                        help='Use this raw dump instead of latest',
+                        default=DEFAULT_INPUT)
+    parser.add_argument('-o', '--output',
+                        help='Manually specify output file')
+    args = parser.parse_args()
+
+    output = args.output
+    if not output:
+        output_name = get_file_name(args.input, INPUT_SUFFIX) + TABLE_SUFFIX
+        output = os.path.join(os.path.dirname(args.input), output_name)
+    rtree = PickleFileHandler(input_=args.input).read()
+    table = PrefixTable.from_rtree(rtree)
+    if not len(table):
+        logging.error('No prefixes found.')
+        sys.exit(1)
+    logging.info(f'Writing {len(table)} prefixes to {output}')
+    table.save(output)
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
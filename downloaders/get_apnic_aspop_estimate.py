@@ -6,12 +6,17 @@ from datetime import datetime, timezone
 import requests
 
 sys.path.append('../')
-from file_handlers.common import make_symlink
+from clients.session import ValidatorCache, conditional_get, make_session
+from file_handlers.common import write_csv
+from file_handlers.snapshot_store import commit_snapshot
 
 OUTPUT_DIR = '../raw/apnic/'
 OUTPUT_FMT = '%Y%m%d'
 OUTPUT_SUFFIX = '-aspop-estimate.csv'
 URL = 'https://stats.labs.apnic.net/aspop/'
+HEADER = ('asn', 'name', 'cc', 'users', 'country_pct', 'internet_pct',
+          'samples')
+VALIDATOR_CACHE = OUTPUT_DIR + 'state/http-validators.json'
 
 EXPECTED_FIELD_COUNT = 7
 CC_FIELD_IDX = 2
@@ -42,7 +47,7 @@ def parse_line(line: str) -> list:
         logging.error(f'Unkown line format: {line}')
         return None
     rem = line.lstrip(',').split(',')
-    parsed_line = [asn.strip('"AS'), as_name.replace(',', ' '), *rem]
+    parsed_line = [asn.strip('"AS'), as_name, *rem]
     field_count = len(parsed_line)
     if field_count != EXPECTED_FIELD_COUNT:
         logging.error(f'Unkown line format. Expected {EXPECTED_FIELD_COUNT} '
@@ -72,12 +77,17 @@ def download_table() -> None:
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
     logging.info(f'Downloading {URL}')
-    r = requests.get(URL)
-    if not r.ok:
-        logging.error(f'Request failed with status code: {r.status_code}')
+    cache = ValidatorCache(VALIDATOR_CACHE)
+    try:
+        r = conditional_get(make_session(), URL, cache)
+    except requests.RequestException as e:
+        logging.error(f'Request failed: {e}')
         sys.exit(1)
+    if r.status_code == 304:
+        logging.info('Table did not change since the last download.')
+        return
     in_list = False
-    out_lines = [['asn', 'name', 'cc', 'users', 'country_pct', 'internet_pct', 'samples']]
+    out_lines = list()
     for line in r.text.split('\n'):
         line_stripped = line.strip()
         if line_stripped.startswith("['Rank"):
@@ -90,10 +100,11 @@ def download_table() -> None:
             break
         out_lines.append(parsed_line)
     logging.info(f'Writing {len(out_lines)} lines to: {output_file}')
-    with open(output_file, 'w') as f:
-        for line in out_lines:
-            f.write(','.join(map(str, line)) + '\n')
-    make_symlink(output_name, latest_symlink)
+    # write_csv replaces output_file atomically, which is then moved to
+    # the object store and replaced by a reference.
+    write_csv(output_file, out_lines, HEADER)
+    commit_snapshot(output_file, output_file, latest_symlink)
+    cache.update(URL, r)
     logging.info('Finished.')
 
 
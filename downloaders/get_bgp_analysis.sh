@@ -24,18 +24,14 @@ do
     echo "Downloading $URL"
     curl "$URL" -o "$TMP"
 
-    if [ -f "$OUTPUT_SYMLINK" ]
+    # Identical snapshots are only stored once.
+    STATUS=0
+    python3 "$SCRIPT_DIR/store_snapshot.py" "$TMP" "$OUTPUT_FILE" "$OUTPUT_SYMLINK" || STATUS=$?
+    if [ "$STATUS" -eq 3 ]
     then
-        echo "Comparing with existing file..."
-        if diff "$TMP" "$OUTPUT_SYMLINK"
-        then
-            echo "Existing file is already up to date."
-            rm -f "$TMP"
-            continue
-        fi
-        rm "$OUTPUT_SYMLINK"
+        echo "Existing file is already up to date."
+    elif [ "$STATUS" -ne 0 ]
+    then
+        exit "$STATUS"
     fi
-
-    mv "$TMP" "$OUTPUT_FILE"
-    ln -s "$OUTPUT_FILE_NAME" "$OUTPUT_SYMLINK"
 done
\ No newline at end of file
@@ -1,4 +1,4 @@
-import bz2
+import argparse
 import logging
 import os
 import sys
@@ -7,12 +7,17 @@ from datetime import datetime, timezone
 import requests
 
 sys.path.append('../')
-from file_handlers.common import make_symlink
+from clients.session import ValidatorCache, conditional_get, make_session
+from file_handlers.compression import (CODEC_SUFFIXES, CODECS, DEFAULT_CODEC,
+                                      open_file)
+from file_handlers.snapshot_store import commit_snapshot
 
 OUTPUT_DIR = '../raw/nro/'
 OUTPUT_FMT = '%Y%m%d'
-OUTPUT_SUFFIX = '-delegated-stats.bz2'
+OUTPUT_SUFFIX = '-delegated-stats'
 URL = 'https://www.nro.net/wp-content/uploads/delegated-stats/nro-extended-stats'
+VALIDATOR_CACHE = OUTPUT_DIR + 'state/http-validators.json'
+DOWNLOAD_CHUNK_SIZE = 1048576
 
 
 def check_output(file: str) -> bool:
@@ -22,11 +27,12 @@ def check_output(file: str) -> bool:
     return False
 
 
-def download_snapshot() -> None:
+def download_snapshot(codec: str = DEFAULT_CODEC) -> None:
+    suffix = OUTPUT_SUFFIX + CODEC_SUFFIXES[codec]
     output_name = datetime.now(tz=timezone.utc).strftime(OUTPUT_FMT) \
-                  + OUTPUT_SUFFIX
+                  + suffix
     output_file = OUTPUT_DIR + output_name
-    latest_symlink = OUTPUT_DIR + 'latest' + OUTPUT_SUFFIX
+    latest_symlink = OUTPUT_DIR + 'latest' + suffix
     logging.info(f'Output: {output_file}')
 
     if check_output(output_file):
@@ -35,12 +41,24 @@ def download_snapshot() -> None:
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
     logging.info(f'Downloading {URL}')
-    r = requests.get(URL, stream=True)
+    cache = ValidatorCache(VALIDATOR_CACHE)
+    tmp_file = output_file + '.tmp'
     download_len = 0
-    with bz2.open(output_file, 'wb') as f:
-        for chunk in r.iter_content(chunk_size=1048576):
-            download_len += f.write(chunk)
-    make_symlink(output_name, latest_symlink)
+    try:
+        r = conditional_get(make_session(), URL, cache, stream=True)
+        if r.status_code == 304:
+            logging.info('Report did not change since the last download.')
+            return
+        with open_file(tmp_file, 'wb', codec) as f:
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                download_len += f.write(chunk)
+    except requests.RequestException as e:
+        logging.error(f'Download failed: {e}')
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        sys.exit(1)
+    commit_snapshot(tmp_file, output_file, latest_symlink)
+    cache.update(URL, r)
     logging.info(f'Size: {download_len / 1024 / 1024:2f} MiB')
     logging.info('Finished.')
 
@@ -50,8 +68,12 @@ def main() -> None:
     logging.basicConfig(
         format=log_format,
         level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--codec', choices=CODECS, default=DEFAULT_CODEC,
+                        help='compression codec of the snapshot')
+    args = parser.parse_args()
 
-    download_snapshot()
+    download_snapshot(args.codec)
 
 
 if __name__ == '__main__':
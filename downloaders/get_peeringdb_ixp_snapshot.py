@@ -1,4 +1,4 @@
-import bz2
+import argparse
 import logging
 import pickle
 import sys
@@ -8,71 +8,51 @@ from typing import Tuple
 import requests
 
 sys.path.append('../')
-from file_handlers.common import make_symlink
+from clients.peeringdb import API_BASE, sync
+from clients.session import make_session
+from file_handlers.compression import (CODEC_SUFFIXES, CODECS, DEFAULT_CODEC,
+                                      open_file)
+from file_handlers.snapshot_store import commit_snapshot
 
-
-API_BASE ='https://peeringdb.com/api/'
 OUTPUT_DIR = '../raw/peeringdb/'
 OUTPUT_FMT = '%Y%m%d'
-OUTPUT_SUFFIX = '-peeringdb-ixp.pickle.bz2'
+OUTPUT_SUFFIX = '-peeringdb-ixp.pickle'
+STATE_FILE = OUTPUT_DIR + 'state/peeringdb-ixp.pickle.bz2'
 
 
-def query_pdb(endpoint: str, params=None) -> dict:
-    """Query the PeeringDB API with the specified endpoint and
-    parameters and return the response JSON data as a dictionary.
-    """
-    if params is None:
-        params = dict()
-    url = API_BASE + endpoint
-    # Always query only 'ok' entries
-    params['status'] = 'ok'
-    logging.info('Querying PeeringDB {} with params {}'.format(url, params))
-    try:
-        r = requests.get(url, params)
-    except ConnectionError as e:
-        logging.error('Failed to connect to PeeringDB: {}'.format(e))
-        return dict()
-    if r.status_code != 200:
-        logging.error('PeeringDB replied with status code: {}'
-                      .format(r.status_code))
-        return dict()
+def fetch_data(api_base: str = API_BASE,
+               full: bool = False) -> Tuple[list, list, list]:
+    """Fetch ix/ixlan/ixpfx data from PeeringDB. Only changes since the
+    last run are fetched unless full is set."""
     try:
-        json_data = r.json()
-    except ValueError as e:
-        logging.error('Failed to decode JSON reply: {}'.format(e))
-        return dict()
-    return json_data
-
-
-def fetch_data() -> Tuple[dict, dict, dict]:
-    """Fetch ix/ixlan/ixpfx data from PeeringDB."""
-    ix_data = query_pdb('ix')
-    if 'data' in ix_data:
-        ix_data = ix_data['data']
-    ixlan_data = query_pdb('ixlan')
-    if 'data' in ixlan_data:
-        ixlan_data = ixlan_data['data']
-    ixpfx_data = query_pdb('ixpfx')
-    if 'data' in ixpfx_data:
-        ixpfx_data = ixpfx_data['data']
-    return ix_data, ixlan_data, ixpfx_data
+        data = sync(make_session(), api_base, ('ix', 'ixlan', 'ixpfx'),
+                    STATE_FILE, full)
+    except requests.RequestException as e:
+        logging.error(f'Failed to fetch PeeringDB data: {e}')
+        return list(), list(), list()
+    return data['ix'], data['ixlan'], data['ixpfx']
 
 
-def write_data(ix_data: dict, ixlan_data: dict, ixpfx_data: dict) -> None:
+def write_data(ix_data: list,
+               ixlan_data: list,
+               ixpfx_data: list,
+               codec: str = DEFAULT_CODEC) -> None:
     if not any((ix_data, ixlan_data, ixpfx_data)):
         return
     out = {'ix': ix_data,
            'ixlan': ixlan_data,
            'ixpfx': ixpfx_data}
+    suffix = OUTPUT_SUFFIX + CODEC_SUFFIXES[codec]
     output_name = datetime.now(tz=timezone.utc).strftime(OUTPUT_FMT) \
-                  + OUTPUT_SUFFIX
+                  + suffix
     output_file = OUTPUT_DIR + output_name
-    latest_symlink = OUTPUT_DIR + 'latest' + OUTPUT_SUFFIX
+    latest_symlink = OUTPUT_DIR + 'latest' + suffix
     logging.info(f'Writing {len(ix_data)} IXPs, {len(ixlan_data)} IX LANs, '
                  f'{len(ixpfx_data)} IXP prefixes to {output_file}')
-    with bz2.open(output_file, 'wb') as f:
+    tmp_file = output_file + '.tmp'
+    with open_file(tmp_file, 'wb', codec) as f:
         pickle.dump(out, f)
-    make_symlink(output_name, latest_symlink)
+    commit_snapshot(tmp_file, output_file, latest_symlink)
 
 
 def main() -> None:
@@ -80,8 +60,17 @@ def main() -> None:
     logging.basicConfig(
         format=log_format,
         level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
-    data = fetch_data()
-    write_data(*data)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--codec', choices=CODECS, default=DEFAULT_CODEC,
+                        help='compression codec of the snapshot')
+    parser.add_argument('--api-base', default=API_BASE,
+                        help='query this PeeringDB API instead of the default')
+    parser.add_argument('--full', action='store_true',
+                        help='fetch all objects instead of only the changes '
+                             'since the last run')
+    args = parser.parse_args()
+    data = fetch_data(args.api_base, args.full)
+    write_data(*data, codec=args.codec)
 
 
 if __name__ == '__main__':
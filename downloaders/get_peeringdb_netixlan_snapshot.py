@@ -1,68 +1,48 @@
-import bz2
+import argparse
 import logging
 import pickle
 import sys
 from datetime import datetime, timezone
-from typing import Tuple
 
 import requests
 
 sys.path.append('../')
-from file_handlers.common import make_symlink
+from clients.peeringdb import API_BASE, sync
+from clients.session import make_session
+from file_handlers.compression import (CODEC_SUFFIXES, CODECS, DEFAULT_CODEC,
+                                      open_file)
+from file_handlers.snapshot_store import commit_snapshot
 
-
-API_BASE ='https://peeringdb.com/api/'
 OUTPUT_DIR = '../raw/peeringdb/'
 OUTPUT_FMT = '%Y%m%d'
-OUTPUT_SUFFIX = '-peeringdb-netixlan.pickle.bz2'
+OUTPUT_SUFFIX = '-peeringdb-netixlan.pickle'
+STATE_FILE = OUTPUT_DIR + 'state/peeringdb-netixlan.pickle.bz2'
 
 
-def query_pdb(endpoint: str, params=None) -> dict:
-    """Query the PeeringDB API with the specified endpoint and
-    parameters and return the response JSON data as a dictionary.
-    """
-    if params is None:
-        params = dict()
-    url = API_BASE + endpoint
-    # Always query only 'ok' entries
-    params['status'] = 'ok'
-    logging.info('Querying PeeringDB {} with params {}'.format(url, params))
-    try:
-        r = requests.get(url, params)
-    except ConnectionError as e:
-        logging.error('Failed to connect to PeeringDB: {}'.format(e))
-        return dict()
-    if r.status_code != 200:
-        logging.error('PeeringDB replied with status code: {}'
-                      .format(r.status_code))
-        return dict()
+def fetch_data(api_base: str = API_BASE, full: bool = False) -> list:
+    """Fetch netixlan data from PeeringDB. Only changes since the last
+    run are fetched unless full is set."""
     try:
-        json_data = r.json()
-    except ValueError as e:
-        logging.error('Failed to decode JSON reply: {}'.format(e))
-        return dict()
-    return json_data
-
-
-def fetch_data() -> dict:
-    """Fetch netxilan data from PeeringDB."""
-    netixlan_data = query_pdb('netixlan')
-    if 'data' not in netixlan_data:
-        return dict()
-    return netixlan_data['data']
+        data = sync(make_session(), api_base, ('netixlan',), STATE_FILE, full)
+    except requests.RequestException as e:
+        logging.error(f'Failed to fetch PeeringDB data: {e}')
+        return list()
+    return data['netixlan']
 
 
-def write_data(netixlan_data: dict) -> None:
+def write_data(netixlan_data: list, codec: str = DEFAULT_CODEC) -> None:
     if not netixlan_data:
         return
+    suffix = OUTPUT_SUFFIX + CODEC_SUFFIXES[codec]
     output_name = datetime.now(tz=timezone.utc).strftime(OUTPUT_FMT) \
-                  + OUTPUT_SUFFIX
+                  + suffix
     output_file = OUTPUT_DIR + output_name
-    latest_symlink = OUTPUT_DIR + 'latest' + OUTPUT_SUFFIX
+    latest_symlink = OUTPUT_DIR + 'latest' + suffix
     logging.info(f'Writing {len(netixlan_data)} entries to {output_file}')
-    with bz2.open(output_file, 'wb') as f:
+    tmp_file = output_file + '.tmp'
+    with open_file(tmp_file, 'wb', codec) as f:
         pickle.dump(netixlan_data, f)
-    make_symlink(output_name, latest_symlink)
+    commit_snapshot(tmp_file, output_file, latest_symlink)
 
 
 def main() -> None:
@@ -70,8 +50,17 @@ def main() -> None:
     logging.basicConfig(
         format=log_format,
         level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
-    data = fetch_data()
-    write_data(data)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--codec', choices=CODECS, default=DEFAULT_CODEC,
+                        help='compression codec of the snapshot')
+    parser.add_argument('--api-base', default=API_BASE,
+                        help='query this PeeringDB API instead of the default')
+    parser.add_argument('--full', action='store_true',
+                        help='fetch all objects instead of only the changes '
+                             'since the last run')
+    args = parser.parse_args()
+    data = fetch_data(args.api_base, args.full)
+    write_data(data, args.codec)
 
 
 if __name__ == '__main__':
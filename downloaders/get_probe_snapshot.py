@@ -1,66 +1,63 @@
-import bz2
-import json.decoder
+import argparse
 import logging
+import os
 import sys
 from datetime import datetime, timezone
+from typing import Iterator
 
-import msgpack
 import requests
 
 sys.path.append('../')
-from file_handlers.common import make_symlink
+from clients.atlas import API_BASE, MAX_WORKERS, iter_pages
+from clients.session import make_session
+from file_handlers.compression import CODEC_SUFFIXES, CODECS, DEFAULT_CODEC
+from file_handlers.msgpack import write_records
+from file_handlers.snapshot_store import commit_snapshot
 
-API_BASE = 'https://atlas.ripe.net/api/v2/'
 OUTPUT_DIR = '../raw/atlas/'
 OUTPUT_FMT = '%Y%m%d'
-OUTPUT_SUFFIX = '-probes.msgpack.bz2'
+OUTPUT_SUFFIX = '-probes.msgpack'
 
 
-def process_response(response: requests.Response) -> (str, list):
-    if response.status_code != requests.codes.ok:
-        logging.error(f'Request to {response.url} failed with status: '
-                      f'{response.status_code}')
-        return str(), list()
-    try:
-        data = response.json()
-    except json.decoder.JSONDecodeError as e:
-        logging.error(f'Decoding JSON reply from {response.url} failed with '
-                      f'exception: {e}')
-        return str(), list()
-    if 'next' not in data or 'results' not in data:
-        logging.error('"next" or "results" key missing from response data.')
-        return str(), list()
-    next_url = data['next']
-    if not next_url:
-        logging.info('Reached end of list')
-        next_url = str()
-    ret = list()
-    for res in data['results']:
+def strip_tags(results: list) -> list:
+    for res in results:
         if 'tags' in res:
             # Not interested in this and uses comparatively lots of
             # space.
             res.pop('tags')
-        ret.append(res)
-    return next_url, ret
+    return results
 
 
-def execute_query(url: str) -> (str, list):
-    logging.info(f'Querying {url}')
-    r = requests.get(url)
-    return process_response(r)
+def write_data(pages: Iterator[list], codec: str = DEFAULT_CODEC) -> None:
+    """Write the probes to the snapshot as the pages come in."""
+    suffix = OUTPUT_SUFFIX + CODEC_SUFFIXES[codec]
+    output_name = datetime.now(tz=timezone.utc).strftime(OUTPUT_FMT) \
+                  + suffix
+    output_file = OUTPUT_DIR + output_name
+    tmp_file = output_file + '.tmp'
+    latest_symlink = OUTPUT_DIR + 'latest' + suffix
+    logging.info(f'Writing probes to {output_file}')
 
+    total = 0
 
-def write_data(data: list) -> None:
-    if not data:
+    def iter_probes() -> Iterator[dict]:
+        nonlocal total
+        for page in pages:
+            total += len(page)
+            logging.info(f'Added {len(page)} probes. Total: {total}')
+            yield from strip_tags(page)
+
+    try:
+        probe_count = write_records(tmp_file, iter_probes(), codec)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    if not probe_count:
+        os.remove(tmp_file)
         return
-    output_name = datetime.now(tz=timezone.utc).strftime(OUTPUT_FMT) \
-                  + OUTPUT_SUFFIX
-    output_file = OUTPUT_DIR + output_name
-    latest_symlink = OUTPUT_DIR + 'latest' + OUTPUT_SUFFIX
-    logging.info(f'Writing {len(data)} probes to {output_file}')
-    with bz2.open(output_file, 'wb') as f:
-        msgpack.dump(data, f)
-    make_symlink(output_name, latest_symlink)
+    logging.info(f'Wrote {probe_count} probes to {output_file}')
+    commit_snapshot(tmp_file, output_file, latest_symlink)
 
 
 def main() -> None:
@@ -69,16 +66,26 @@ def main() -> None:
         format=log_format,
         filename='../logs/get_probe_snapshot.log',
         level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
-    probe_endpoint = API_BASE + 'probes/'
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--api-base', default=API_BASE,
+                        help='query this Atlas API instead of the default')
+    parser.add_argument('-w', '--workers', type=int, default=MAX_WORKERS,
+                        help='maximum number of concurrent requests')
+    parser.add_argument('-c', '--codec', choices=CODECS, default=DEFAULT_CODEC,
+                        help='compression codec of the snapshot')
+    args = parser.parse_args()
+
+    probe_endpoint = args.api_base + 'probes/'
     logging.info(f'Querying Atlas API {probe_endpoint}')
-    params = {'format': 'json', 'status': 1, 'page_size': 500}
-    r = requests.get(probe_endpoint, params)
-    next_url, data = process_response(r)
-    while next_url:
-        next_url, next_data = execute_query(next_url)
-        data += next_data
-        logging.info(f'Added {len(next_data)} probes. Total: {len(data)}')
-    write_data(data)
+    params = {'format': 'json', 'status': 1}
+    session = make_session(args.workers)
+    try:
+        write_data(iter_pages(session, probe_endpoint, params,
+                              max_workers=args.workers),
+                   args.codec)
+    except requests.RequestException as e:
+        logging.error(f'Querying probes failed: {e}')
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,310 @@
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+from datetime import datetime, timedelta
+
+import requests
+
+sys.path.append('../')
+from clients.session import DEFAULT_TIMEOUT, make_session
+from file_handlers.compression import CODECS, DEFAULT_CODEC
+from get_rib_snapshot import (DATE_FMT, OUTPUT_DIR, OUTPUT_FORMATS,
+                              get_outputs, read_mrt, save_rib)
+
+ARCHIVE_URL = 'http://archive.routeviews.org/'
+# Dumps of route-views2 are in the root of the archive.
+ROOT_COLLECTOR = 'route-views2'
+DEFAULT_COLLECTOR = 'route-views.wide'
+RIB_PATH = 'bgpdata/{year}.{month:02d}/RIBS/rib.{date}.0000.bz2'
+DUMP_DIR = OUTPUT_DIR + 'dumps/'
+PART_SUFFIX = '.part'
+# A chunk that is cut off by an interrupted transfer is lost, so keep
+# chunks small.
+DOWNLOAD_CHUNK_SIZE = 65536
+MAX_WORKERS = 4
+PARSE_WORKERS = max(1, (os.cpu_count() or 1) // 2)
+# Attempts per dump. Interrupted transfers are resumed.
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 5
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+# Content-Range of a 416 response, which contains the full size.
+UNSATISFIED_RANGE = re.compile(r'^bytes \*/(\d+)$')
+
+
+def get_dates(from_date: datetime, to_date: datetime) -> list:
+    ret = list()
+    date = from_date
+    while date <= to_date:
+        ret.append(date)
+        date += timedelta(days=1)
+    return ret
+
+
+def get_url(base_url: str, collector: str, date: datetime) -> str:
+    path = RIB_PATH.format(year=date.year, month=date.month,
+                           date=date.strftime(DATE_FMT))
+    if collector == ROOT_COLLECTOR:
+        return base_url + path
+    return base_url + collector + '/' + path
+
+
+def get_output_name(collector: str) -> str:
+    """Outputs of the default collector are named like the ones of
+    get_rib_snapshot.py, others include the collector name."""
+    if collector == DEFAULT_COLLECTOR:
+        return str()
+    return '-' + collector
+
+
+def get_expected_size(r: requests.Response, offset: int) -> int:
+    """Return the full size of the file from the response to a (range)
+    request starting at offset, or None if it is unknown."""
+    if r.status_code == 206:
+        m = CONTENT_RANGE.match(r.headers.get('Content-Range', ''))
+        if not m or int(m.group(1)) != offset:
+            raise requests.RequestException(
+                f'Unexpected Content-Range: {r.headers.get("Content-Range")}')
+        if m.group(3) != '*':
+            return int(m.group(3))
+        return None
+    if 'Content-Length' in r.headers:
+        return int(r.headers['Content-Length'])
+    return None
+
+
+def get_unsatisfied_size(r: requests.Response) -> int:
+    """Return the full size of the file from a 416 response, or None if
+    it is unknown."""
+    m = UNSATISFIED_RANGE.match(r.headers.get('Content-Range', ''))
+    if not m:
+        return None
+    return int(m.group(1))
+
+
+def download(session: requests.Session, url: str, output: str) -> bool:
+    """Download url to output.
+
+    Data is written to output.part first. If the transfer is
+    interrupted, it is resumed with a range request, also across runs.
+    Servers that do not support range requests send the whole file,
+    which replaces the partial download. If the server rejects the
+    range, the partial download is kept only if it already has the full
+    size. The size of the download is verified against the size
+    announced by the server. Return False if the dump does not exist or
+    the download failed."""
+    part = output + PART_SUFFIX
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else dict()
+        try:
+            with session.get(url, headers=headers, stream=True,
+                             timeout=DEFAULT_TIMEOUT) as r:
+                if r.status_code == 404:
+                    logging.warning(f'Dump does not exist: {url}')
+                    return False
+                if r.status_code == 416:
+                    if offset and get_unsatisfied_size(r) == offset:
+                        # An earlier attempt was interrupted after the
+                        # last byte was written.
+                        os.replace(part, output)
+                        logging.info(f'Downloaded {url} ({offset} bytes)')
+                        return True
+                    # The partial download is larger than the file.
+                    logging.warning(f'Discarding invalid partial download '
+                                    f'{part}')
+                    if os.path.exists(part):
+                        os.remove(part)
+                    continue
+                r.raise_for_status()
+                if r.status_code != 206:
+                    if offset:
+                        logging.info(f'Server ignored range request. '
+                                     f'Restarting download of {url}')
+                    offset = 0
+                expected_size = get_expected_size(r, offset)
+                if offset:
+                    logging.info(f'Resuming download of {url} at {offset} '
+                                 f'bytes')
+                with open(part, 'ab' if offset else 'wb') as f:
+                    for chunk in r.iter_content(
+                            chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+        except (requests.RequestException, OSError) as e:
+            logging.warning(f'Download of {url} failed (attempt {attempt}/'
+                            f'{MAX_ATTEMPTS}): {e}')
+            time.sleep(RETRY_DELAY * attempt)
+            continue
+        size = os.path.getsize(part)
+        if expected_size is not None and size != expected_size:
+            logging.warning(f'Download of {url} is incomplete: {size} of '
+                            f'{expected_size} bytes (attempt {attempt}/'
+                            f'{MAX_ATTEMPTS})')
+            if size > expected_size:
+                os.remove(part)
+            time.sleep(RETRY_DELAY * attempt)
+            continue
+        os.replace(part, output)
+        logging.info(f'Downloaded {url} ({size} bytes)')
+        return True
+    logging.error(f'Giving up on {url}')
+    return False
+
+
+def parse_dump(dump: str,
+               date: datetime,
+               collector: str,
+               output_format: str,
+               codec: str,
+               first_peer_only: bool,
+               dedup: bool,
+               keep_dump: bool) -> bool:
+    """Parse a downloaded dump and save it. Runs in a worker process."""
+    entries = read_mrt(dump, first_peer_only=first_peer_only)
+    saved = save_rib(entries, date, output_format, dedup, codec,
+                     get_output_name(collector), update_latest=False)
+    if saved and not keep_dump:
+        os.remove(dump)
+    return saved
+
+
+def backfill(dates: list,
+             collectors: list,
+             base_url: str,
+             workers: int,
+             parse_workers: int,
+             output_format: str,
+             codec: str,
+             first_peer_only: bool,
+             dedup: bool,
+             keep_dumps: bool,
+             force: bool) -> int:
+    """Download and parse the dumps of the collectors for the dates.
+
+    Downloads run on a pool of threads. Each completed download is
+    passed to a pool of processes for parsing, so parsing overlaps with
+    the remaining downloads. Dumps whose outputs exist are skipped
+    unless force is set. Return the number of failed dumps."""
+    os.makedirs(DUMP_DIR, exist_ok=True)
+    session = make_session(workers)
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as downloader, \
+            ProcessPoolExecutor(max_workers=parse_workers) as parser:
+        downloads = dict()
+        for date in dates:
+            for collector in collectors:
+                outputs = get_outputs(date, output_format, codec,
+                                      get_output_name(collector))
+                if not force and all(map(os.path.exists, outputs)):
+                    logging.info(f'Skipping {collector} {date:%Y-%m-%d}: '
+                                 f'already processed')
+                    continue
+                url = get_url(base_url, collector, date)
+                dump = DUMP_DIR + collector + '.' + os.path.basename(url)
+                if os.path.exists(dump):
+                    # Downloaded but not parsed by an earlier run.
+                    future = downloader.submit(lambda: True)
+                else:
+                    future = downloader.submit(download, session, url, dump)
+                downloads[future] = (date, collector, dump)
+        parses = dict()
+        while downloads or parses:
+            done, _ = wait(list(downloads) + list(parses),
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in downloads:
+                    date, collector, dump = downloads.pop(future)
+                    if not future.result():
+                        failed += 1
+                        continue
+                    parses[parser.submit(parse_dump, dump, date, collector,
+                                         output_format, codec,
+                                         first_peer_only, dedup,
+                                         keep_dumps)] = (date, collector)
+                    continue
+                date, collector = parses.pop(future)
+                try:
+                    saved = future.result()
+                except Exception as e:
+                    logging.error(f'Parsing {collector} {date:%Y-%m-%d} '
+                                  f'failed: {e}')
+                    saved = False
+                if not saved:
+                    failed += 1
+                    continue
+                logging.info(f'Processed {collector} {date:%Y-%m-%d}')
+    return failed
+
+
+def main() -> None:
+    log_format = '%(asctime)s %(levelname)s %(message)s'
+    logging.basicConfig(
+        format=log_format,
+        level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser(
+        description='Download and process the RouteViews RIBs of a range '
+                    'of dates. Downloads run concurrently, are resumed '
+                    'after interruptions, and are parsed while the '
+                    'remaining downloads are running.')
+    parser.add_argument('from_date', help='first date (%%Y%%m%%d)')
+    parser.add_argument('to_date', nargs='?',
+                        help='last date (%%Y%%m%%d). Defaults to from_date')
+    parser.add_argument('-C', '--collector', action='append',
+                        help='RouteViews collector, e.g., route-views2 or '
+                             'route-views.linx. Can be specified multiple '
+                             f'times. Defaults to {DEFAULT_COLLECTOR}')
+    parser.add_argument('--base-url', default=ARCHIVE_URL,
+                        help='download from this archive (e.g., a local '
+                             'mirror) instead of RouteViews')
+    parser.add_argument('-w', '--workers', type=int, default=MAX_WORKERS,
+                        help='maximum number of concurrent downloads')
+    parser.add_argument('-p', '--parse-workers', type=int,
+                        default=PARSE_WORKERS,
+                        help='number of processes parsing dumps')
+    parser.add_argument('--first-peer-only', action='store_true',
+                        help='only use the entry of the first peer for each '
+                             'prefix')
+    parser.add_argument('--dedup', action='store_true',
+                        help='insert each prefix only once and keep the '
+                             'origins and peer count seen across all peers')
+    parser.add_argument('-f', '--format', choices=OUTPUT_FORMATS,
+                        default='pickle',
+                        help='save a pickled radix tree, a columnar prefix '
+                             'table, or both')
+    parser.add_argument('-c', '--codec', choices=CODECS, default=DEFAULT_CODEC,
+                        help='compression codec of the pickled radix tree')
+    parser.add_argument('--keep-dumps', action='store_true',
+                        help=f'keep the downloaded dumps in {DUMP_DIR}')
+    parser.add_argument('--force', action='store_true',
+                        help='process dates even if their output exists')
+    args = parser.parse_args()
+
+    try:
+        from_date = datetime.strptime(args.from_date, DATE_FMT)
+        to_date = datetime.strptime(args.to_date or args.from_date, DATE_FMT)
+    except ValueError as e:
+        logging.error(f'Invalid date specified: {e}')
+        sys.exit(1)
+    base_url = args.base_url
+    if not base_url.endswith('/'):
+        base_url += '/'
+    collectors = args.collector or [DEFAULT_COLLECTOR]
+    dates = get_dates(from_date, to_date)
+    logging.info(f'Backfilling {len(dates)} days from {len(collectors)} '
+                 f'collectors')
+    failed = backfill(dates, collectors, base_url, args.workers,
+                      args.parse_workers, args.format, args.codec,
+                      args.first_peer_only, args.dedup, args.keep_dumps,
+                      args.force)
+    if failed:
+        logging.error(f'{failed} dumps failed')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
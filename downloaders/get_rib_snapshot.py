@@ -1,35 +1,159 @@
 import argparse
 import bz2
+import gzip
 import logging
 import os
 import pickle
+import re
 import subprocess
 import sys
 import tempfile
+import threading
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from typing import Iterable, Iterator, List, Tuple
 
 import radix
 import requests
 
 sys.path.append('../')
-from file_handlers.common import make_symlink
+from clients.session import ValidatorCache, conditional_get, make_session
+from file_handlers.compression import (CODEC_SUFFIXES, CODECS, DEFAULT_CODEC,
+                                      open_file)
+from file_handlers.mrt import group_by_prefix, iter_rib_entries
+from file_handlers.parallel_bz2 import open_bz2
+from file_handlers.prefix_table import PrefixTable
+from file_handlers.rib_merge import RUN_SUFFIX, merge_runs, write_run
+from file_handlers.snapshot_store import commit_snapshot
 
 DATE_FMT = '%Y%m%d'
-RIB_URL = 'http://archive.routeviews.org/route-views.wide/bgpdata/{year}.{month:02d}/RIBS/rib.{year}{month:02d}{day:02d}.0000.bz2'
+# URL templates of the RIB dumps. Collectors are specified by name
+# (see get_collector_url) or as NAME=TEMPLATE.
+ROUTEVIEWS_URL = 'http://archive.routeviews.org/{collector}/bgpdata/{year}.{month:02d}/RIBS/rib.{year}{month:02d}{day:02d}.0000.bz2'
+# Dumps of route-views2 are in the root of the archive.
+ROUTEVIEWS2_URL = 'http://archive.routeviews.org/bgpdata/{year}.{month:02d}/RIBS/rib.{year}{month:02d}{day:02d}.0000.bz2'
+RIS_URL = 'https://data.ris.ripe.net/{collector}/{year}.{month:02d}/bview.{year}{month:02d}{day:02d}.0000.gz'
+RIS_COLLECTOR = re.compile(r'^rrc\d{2}$')
+DEFAULT_COLLECTOR = 'route-views.wide'
 RIB_FIELD_DELIMITER = '|'
 RIB_FIELD_COUNT = 15
 PFX_FIELD_IDX = 5
 AS_PATH_FIELD_IDX = 6
+DOWNLOAD_CHUNK_SIZE = 1048576
 OUTPUT_DIR = '../raw/routeviews/'
-OUTPUT_SUFFIX = '-rib.pickle.bz2'
+OUTPUT_SUFFIX = '-rib.pickle'
+TABLE_OUTPUT_SUFFIX = '-rib.pfx2as'
+OUTPUT_FORMATS = ('pickle', 'table', 'both')
+VALIDATOR_CACHE = OUTPUT_DIR + 'state/http-validators.json'
+# Maximum number of collectors processed concurrently when merging.
+# Each worker holds the prefixes and origin counts of one full RIB in
+# memory while it sorts them (about 1 GiB for a full table), so the
+# default is kept small independent of the number of CPUs.
+MAX_WORKERS = 2
 
 
-def process_rib(file: str) -> radix.Radix:
-    logging.info('Processing RIB')
-    rtree = radix.Radix()
+def parse_collector(spec: str) -> Tuple[str, str]:
+    """Return the name and URL template of a collector specified as
+    NAME or NAME=TEMPLATE. Templates can use the fields collector, year,
+    month, and day. Raise a ValueError if the template is invalid."""
+    if '=' not in spec:
+        name = spec
+        if name == 'route-views2':
+            template = ROUTEVIEWS2_URL
+        elif RIS_COLLECTOR.match(name):
+            template = RIS_URL
+        else:
+            template = ROUTEVIEWS_URL
+        return name, template
+    name, template = spec.split('=', 1)
+    try:
+        template.format(collector=name, year=2000, month=1, day=1)
+    except (KeyError, IndexError, ValueError) as e:
+        raise ValueError(f'Invalid URL template for {name}: {template} '
+                         f'({e})')
+    return name, template
+
+
+def get_collector_url(collector: str, template: str, date: datetime) -> str:
+    return template.format(collector=collector, year=date.year,
+                           month=date.month, day=date.day)
+
+
+def is_gzip(url: str) -> bool:
+    """RIS dumps are gzip-compressed, RouteViews dumps bz2-compressed."""
+    return url.endswith('.gz')
+
+
+def feed_rib(r: requests.Response, pipe, errors: list) -> None:
+    """Decompress the response body chunk by chunk and write it to
+    pipe.
+
+    bgpdump treats stdin as uncompressed, so decompression happens
+    here. Multi-stream bz2 and multi-member gzip files are handled as
+    well. Runs in a separate thread, so failures are appended to errors
+    instead of being raised. A body that ends within a compressed stream
+    is treated as a failure, since bgpdump would otherwise silently
+    parse a partial dump."""
+    if is_gzip(r.url):
+        def make_decompressor():
+            return zlib.decompressobj(zlib.MAX_WBITS | 16)
+    else:
+        make_decompressor = bz2.BZ2Decompressor
+    decompressor = make_decompressor()
+    download_len = 0
+    try:
+        for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            download_len += len(chunk)
+            while chunk:
+                if decompressor.eof:
+                    decompressor = make_decompressor()
+                pipe.write(decompressor.decompress(chunk))
+                chunk = decompressor.unused_data if decompressor.eof \
+                    else None
+        if not decompressor.eof:
+            raise EOFError('Compressed stream ended before the '
+                           'end-of-stream marker was reached')
+    except BrokenPipeError as e:
+        logging.error('bgpdump exited before the download finished.')
+        errors.append(e)
+    except (requests.RequestException, OSError, EOFError) as e:
+        logging.error(f'Streaming RIB failed: {e}')
+        errors.append(e)
+    finally:
+        try:
+            pipe.close()
+        except BrokenPipeError:
+            pass
+    logging.info(f'Downloaded {download_len / 1024 / 1024:.2f} MiB')
+
+
+def read_bgpdump(file: str, r: requests.Response = None) \
+        -> Iterator[Tuple[str, str]]:
+    """Parse the RIB with bgpdump and yield (prefix, origin) tuples.
+
+    If a streamed response is specified, file is ignored and the
+    response body is piped into bgpdump while it is being downloaded.
+    Raise a ValueError if the output format of bgpdump is unexpected,
+    and the error of the download if it failed (see feed_rib).
+    """
+    if r is not None:
+        file = '-'
     with subprocess.Popen(['bgpdump', '-m', '-v', '-t', 'change', file],
-                          bufsize=1, stdout=subprocess.PIPE,
-                          stderr=subprocess.PIPE, encoding='utf-8') as cp:
+                          bufsize=1,
+                          stdin=subprocess.PIPE if r is not None else None,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL,
+                          encoding='utf-8') as cp:
+        feeder = None
+        feeder_errors = list()
+        if r is not None:
+            feeder = threading.Thread(target=feed_rib,
+                                      args=(r, cp.stdin.buffer,
+                                            feeder_errors),
+                                      daemon=True)
+            feeder.start()
         line_count = 0
         for line in cp.stdout:
             line_count += 1
@@ -40,42 +164,380 @@ def process_rib(file: str) -> radix.Radix:
                               f'{len(line_split)}.')
                 logging.error(line)
                 logging.error(line_count)
-                return radix.Radix()
+                cp.kill()
+                raise ValueError('Unexpected bgpdump output format')
             pfx = line_split[PFX_FIELD_IDX]
             as_path = line_split[AS_PATH_FIELD_IDX]
-            if pfx == '0.0.0.0/0' or pfx == '::/0':
-                continue
-            node = rtree.add(pfx)
-            node.data['as'] = as_path.split(' ')[-1]
-    logging.info(f'Processed {line_count} RIB entries')
+            yield pfx, as_path.split(' ')[-1]
+        if feeder is not None:
+            feeder.join()
+            if feeder_errors:
+                raise feeder_errors[0]
+
+
+def read_mrt(file: str,
+             r: requests.Response = None,
+             first_peer_only: bool = False) -> Iterator[Tuple[str, str]]:
+    """Decode the bz2- or gzip-compressed MRT dump directly and yield
+    (prefix, origin) tuples.
+
+    If a streamed response is specified, file is ignored and the
+    response body is decoded while it is being downloaded.
+    """
+    if r is not None:
+        if is_gzip(r.url):
+            f = gzip.open(r.raw, 'rb')
+        else:
+            f = bz2.open(r.raw, 'rb')
+    elif is_gzip(file):
+        f = gzip.open(file, 'rb')
+    else:
+        f = open_bz2(file, 'rb')
+    with f:
+        yield from iter_rib_entries(f, first_peer_only)
+
+
+def process_rib(entries: Iterable[Tuple[str, str]],
+                dedup: bool = False) -> radix.Radix:
+    """Build a radix tree from (prefix, origin) tuples.
+
+    By default, the origin of the last entry of a prefix is stored. If
+    dedup is set, consecutive entries of the same prefix are grouped and
+    each prefix is inserted only once. In this case the node data also
+    contains the peer count per origin ('origins') and the total number
+    of peers ('peers'), and 'as' is the origin seen by most peers.
+    """
+    logging.info('Processing RIB')
+    rtree = radix.Radix()
+    entry_count = 0
+    moas_count = 0
+
+    def count_entries():
+        nonlocal entry_count
+        for entry in entries:
+            entry_count += 1
+            yield entry
+
+    try:
+        if not dedup:
+            for pfx, origin in count_entries():
+                if pfx == '0.0.0.0/0' or pfx == '::/0':
+                    continue
+                node = rtree.add(pfx)
+                node.data['as'] = origin
+        else:
+            for pfx, origins in group_by_prefix(count_entries()):
+                if pfx == '0.0.0.0/0' or pfx == '::/0':
+                    continue
+                node = rtree.add(pfx)
+                if 'origins' in node.data:
+                    # Prefix was not listed consecutively.
+                    origins.update(node.data['origins'])
+                node.data['as'] = origins.most_common(1)[0][0]
+                node.data['origins'] = dict(origins)
+                node.data['peers'] = sum(origins.values())
+                if len(origins) > 1:
+                    moas_count += 1
+    except ValueError:
+        return radix.Radix()
+    logging.info(f'Processed {entry_count} RIB entries')
+    if dedup:
+        logging.info(f'Found {len(rtree.nodes())} unique prefixes, '
+                     f'{moas_count} with multiple origins')
     return rtree
 
 
-def save_rtree(rtree: radix.Radix, output: str) -> None:
+def process_rib_table(entries: Iterable[Tuple[str, str]],
+                      dedup: bool = False) -> PrefixTable:
+    """Build a columnar prefix table from (prefix, origin) tuples
+    without building a radix tree. If dedup is set, the origin seen by
+    most peers is used for each prefix, otherwise the last one.
+    """
+    logging.info('Processing RIB')
+    if dedup:
+        entries = ((pfx, origins.most_common(1)[0][0])
+                   for pfx, origins in group_by_prefix(entries))
+    try:
+        table = PrefixTable.from_entries(
+            (pfx, origin) for pfx, origin in entries
+            if pfx != '0.0.0.0/0' and pfx != '::/0')
+    except ValueError:
+        return PrefixTable.from_entries(list())
+    logging.info(f'Processed {len(table)} prefixes')
+    return table
+
+
+def save_table(table: PrefixTable,
+               output: str,
+               update_latest: bool = True) -> None:
+    logging.info(f'Saving prefix table: {output}')
+    tmp_output = output + '.tmp'
+    table.save(tmp_output)
+    latest_symlink = None
+    if update_latest:
+        latest_symlink = OUTPUT_DIR + 'latest' + TABLE_OUTPUT_SUFFIX
+    commit_snapshot(tmp_output, output, latest_symlink)
+
+
+def save_rtree(rtree: radix.Radix,
+               output: str,
+               codec: str = DEFAULT_CODEC,
+               update_latest: bool = True) -> None:
     logging.info(f'Saving rtree: {output}')
-    with bz2.open(output, 'wb') as f:
+    tmp_output = output + '.tmp'
+    with open_file(tmp_output, 'wb', codec) as f:
         pickle.dump(rtree, f, pickle.HIGHEST_PROTOCOL)
-    latest_symlink = OUTPUT_DIR + 'latest' + OUTPUT_SUFFIX
-    output_name = os.path.basename(output)
-    make_symlink(output_name, latest_symlink)
+    latest_symlink = None
+    if update_latest:
+        latest_symlink = OUTPUT_DIR + 'latest' + OUTPUT_SUFFIX \
+                         + CODEC_SUFFIXES[codec]
+    commit_snapshot(tmp_output, output, latest_symlink)
+
+
+def download_and_process_rib(date: datetime,
+                             url: str,
+                             stream: bool = True,
+                             use_bgpdump: bool = False,
+                             first_peer_only: bool = False,
+                             dedup: bool = False,
+                             output_format: str = 'pickle',
+                             codec: str = DEFAULT_CODEC) -> bool:
+    """Download and process the RIB at url for the specified date.
+
+    In streaming mode the download is parsed while it is running, i.e.,
+    parsing overlaps with the download and the compressed dump is never
+    held in memory. Otherwise, the dump is written to a temporary file
+    chunk by chunk and processed after the download finished.
 
+    By default the MRT dump is decoded natively. bgpdump is only
+    required if use_bgpdump is set. See process_rib for dedup.
 
-def download_and_process_rib(date: datetime) -> None:
-    url = RIB_URL.format(year=date.year, month=date.month, day=date.day)
+    The result is saved as a pickled radix tree, a columnar prefix table
+    (see file_handlers.prefix_table), or both. The pickled radix tree is
+    compressed with codec. Dumps that did not change since they were
+    last processed are skipped if the output still exists. Nothing is
+    saved if the download fails. Return False if the RIB could not be
+    downloaded or processed."""
     logging.info(f'Downloading RIB: {url}')
-    r = requests.get(url)
+    cache = ValidatorCache(VALIDATOR_CACHE)
+    # Only skip unchanged dumps if the output still exists.
+    outputs = get_outputs(date, output_format, codec)
+    if not all(os.path.exists(output) for output in outputs):
+        cache.validators.pop(url, None)
     try:
-        r.raise_for_status()
-    except requests.HTTPError as e:
+        r = conditional_get(make_session(), url, cache, stream=True)
+    except requests.RequestException as e:
         logging.error(f'Request failed with error: {e}')
-        return
-    with tempfile.NamedTemporaryFile(delete=True, suffix='.bz2') as tmp:
-        tmp.write(r.content)
-        tmp.flush()
-        rtree = process_rib(tmp.name)
-    if rtree.nodes():
-        output = OUTPUT_DIR + date.strftime(DATE_FMT) + OUTPUT_SUFFIX
-        save_rtree(rtree, output)
+        return False
+    if r.status_code == 304:
+        logging.info('RIB was already processed.')
+        return True
+    try:
+        if stream:
+            if use_bgpdump:
+                entries = read_bgpdump(str(), r)
+            else:
+                entries = read_mrt(str(), r, first_peer_only)
+            saved = save_rib(entries, date, output_format, dedup, codec)
+        else:
+            suffix = '.gz' if is_gzip(url) else '.bz2'
+            with tempfile.NamedTemporaryFile(delete=True,
+                                             suffix=suffix) as tmp:
+                for chunk in r.iter_content(
+                        chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    tmp.write(chunk)
+                tmp.flush()
+                if use_bgpdump:
+                    entries = read_bgpdump(tmp.name)
+                else:
+                    entries = read_mrt(tmp.name,
+                                       first_peer_only=first_peer_only)
+                saved = save_rib(entries, date, output_format, dedup,
+                                 codec)
+    except Exception as e:
+        # Like in collect_rib, connection resets and timeouts while
+        # streaming surface as urllib3 errors, corrupt or truncated dumps
+        # as bz2/zlib errors. The entries are consumed before anything is
+        # saved, so a partial dump is never stored and the validators are
+        # not updated. The next run downloads the RIB again.
+        logging.error(f'Failed to process RIB at {url}: '
+                      f'{type(e).__name__}: {e}')
+        return False
+    if saved:
+        cache.update(url, r)
+    return saved
+
+
+def get_outputs(date: datetime,
+                output_format: str,
+                codec: str = DEFAULT_CODEC,
+                name: str = str()) -> list:
+    """Return the output files for the date in the specified output
+    format. name is inserted between the date and the suffix."""
+    prefix = OUTPUT_DIR + date.strftime(DATE_FMT) + name
+    outputs = list()
+    if output_format != 'table':
+        outputs.append(prefix + OUTPUT_SUFFIX + CODEC_SUFFIXES[codec])
+    if output_format != 'pickle':
+        outputs.append(prefix + TABLE_OUTPUT_SUFFIX)
+    return outputs
+
+
+def save_rib(entries: Iterable[Tuple[str, str]],
+             date: datetime,
+             output_format: str,
+             dedup: bool,
+             codec: str = DEFAULT_CODEC,
+             name: str = str(),
+             update_latest: bool = True) -> bool:
+    """Process the entries and save the result in the specified output
+    format. Return False if there was nothing to save. See get_outputs
+    for name."""
+    outputs = get_outputs(date, output_format, codec, name)
+    if output_format == 'table':
+        table = process_rib_table(entries, dedup)
+        if not len(table):
+            return False
+        save_table(table, outputs[0], update_latest)
+        return True
+    rtree = process_rib(entries, dedup)
+    if not rtree.nodes():
+        return False
+    save_rtree(rtree, outputs[0], codec, update_latest)
+    if output_format == 'both':
+        save_table(PrefixTable.from_rtree(rtree), outputs[1], update_latest)
+    return True
+
+
+def collect_rib(url: str, run_file: str, first_peer_only: bool) -> int:
+    """Download the RIB at url and write it to run_file as a sorted
+    run (see file_handlers.rib_merge). Runs in a worker process. Return
+    the number of prefixes, or 0 if the download or decoding failed."""
+    logging.info(f'Downloading RIB: {url}')
+    try:
+        r = conditional_get(make_session(), url, stream=True)
+    except requests.RequestException as e:
+        logging.error(f'Request failed with error: {e}')
+        return 0
+    try:
+        with r:
+            return write_run(read_mrt(str(), r, first_peer_only), run_file)
+    except Exception as e:
+        # Connection resets and timeouts while streaming surface as
+        # urllib3 errors, corrupt dumps as bz2/zlib errors. A single
+        # collector should not abort the merge.
+        logging.error(f'Failed to process RIB at {url}: '
+                      f'{type(e).__name__}: {e}')
+        return 0
+
+
+def process_merged_rib(entries: Iterable[Tuple[str, Counter, int]]) \
+        -> radix.Radix:
+    """Build a radix tree from merged (prefix, origins, collectors)
+    tuples (see file_handlers.rib_merge.merge_runs).
+
+    Like with dedup in process_rib, the node data contains the peer
+    count per origin ('origins'), the total number of peers ('peers'),
+    and the origin seen by most peers ('as'). 'collectors' is the number
+    of collectors that saw the prefix.
+    """
+    logging.info('Merging RIBs')
+    rtree = radix.Radix()
+    moas_count = 0
+    for pfx, origins, collectors in entries:
+        if pfx == '0.0.0.0/0' or pfx == '::/0':
+            continue
+        node = rtree.add(pfx)
+        node.data['as'] = origins.most_common(1)[0][0]
+        node.data['origins'] = dict(origins)
+        node.data['peers'] = sum(origins.values())
+        node.data['collectors'] = collectors
+        if len(origins) > 1:
+            moas_count += 1
+    logging.info(f'Found {len(rtree.nodes())} unique prefixes, '
+                 f'{moas_count} with multiple origins')
+    return rtree
+
+
+def save_merged_rib(runs: List[str],
+                    date: datetime,
+                    output_format: str,
+                    codec: str = DEFAULT_CODEC) -> bool:
+    """Merge the runs and save the result in the specified output
+    format. Return False if there was nothing to save."""
+    outputs = get_outputs(date, output_format, codec)
+    entries = merge_runs(runs)
+    if output_format == 'table':
+        table = PrefixTable.from_origin_sets(
+            (pfx, origins, collectors)
+            for pfx, origins, collectors in entries
+            if pfx != '0.0.0.0/0' and pfx != '::/0')
+        if not len(table):
+            return False
+        logging.info(f'Merged {len(table)} prefixes')
+        save_table(table, outputs[0])
+        return True
+    rtree = process_merged_rib(entries)
+    if not rtree.nodes():
+        return False
+    save_rtree(rtree, outputs[0], codec)
+    if output_format == 'both':
+        save_table(PrefixTable.from_rtree(rtree), outputs[1])
+    return True
+
+
+def download_and_merge_ribs(date: datetime,
+                            collectors: List[Tuple[str, str]],
+                            workers: int = None,
+                            first_peer_only: bool = False,
+                            output_format: str = 'pickle',
+                            codec: str = DEFAULT_CODEC) -> None:
+    """Download the RIBs of multiple collectors for the specified date
+    and merge them into a single snapshot.
+
+    collectors is a list of (name, URL template) tuples. The RIBs are
+    downloaded and decoded concurrently by a pool of processes. Each one
+    is reduced to a sorted run on disk, and the runs are merged
+    afterwards, so there is never more than one full RIB per worker in
+    memory. The snapshot records the origins of each prefix with their
+    peer counts and the number of collectors that saw it (see
+    process_merged_rib and PrefixTable.from_origin_sets). Collectors
+    whose RIB is not available are left out of the merge.
+
+    Each worker holds one full RIB in memory while sorting it, so peak
+    memory grows with workers, which defaults to the number of
+    collectors, but at most MAX_WORKERS.
+    """
+    if workers is None:
+        workers = min(len(collectors), MAX_WORKERS)
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = list()
+        for name, template in collectors:
+            url = get_collector_url(name, template, date)
+            run_file = os.path.join(tmp_dir, name + RUN_SUFFIX)
+            futures.append((name, run_file,
+                            executor.submit(collect_rib, url, run_file,
+                                            first_peer_only)))
+        runs = list()
+        for name, run_file, future in futures:
+            try:
+                prefix_count = future.result()
+            except Exception as e:
+                # The worker process died, e.g., because it ran out of
+                # memory.
+                logging.error(f'Failed to process RIB of {name}: {e}')
+                prefix_count = 0
+            if not prefix_count:
+                logging.warning(f'Leaving {name} out of the merged RIB')
+                continue
+            logging.info(f'{name}: {prefix_count} prefixes')
+            runs.append(run_file)
+        if not runs:
+            logging.error('No RIB could be processed.')
+            return
+        logging.info(f'Merging RIBs of {len(runs)} collectors')
+        save_merged_rib(runs, date, output_format, codec)
 
 
 def main() -> None:
@@ -85,7 +547,40 @@ def main() -> None:
         level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
     parser = argparse.ArgumentParser()
     parser.add_argument('-d', '--date', help='Download RIB for this date '
-                                             'specified as %Y%m%d')
+                                             'specified as %%Y%%m%%d')
+    parser.add_argument('-C', '--collector', action='append',
+                        help='RouteViews (e.g., route-views2) or RIS (e.g., '
+                             'rrc00) collector, or NAME=URL_TEMPLATE with '
+                             'the fields {collector}, {year}, {month}, and '
+                             '{day}. Can be specified multiple times, in '
+                             'which case the RIBs are merged. Defaults to '
+                             f'{DEFAULT_COLLECTOR}')
+    parser.add_argument('-w', '--workers', type=int,
+                        help='number of processes downloading and decoding '
+                             'RIBs of multiple collectors. Each one holds a '
+                             'full RIB in memory (about 1 GiB for a full '
+                             'table) while sorting it. Defaults to the '
+                             f'number of collectors, but at most '
+                             f'{MAX_WORKERS}')
+    parser.add_argument('--no-stream', action='store_true',
+                        help='download the RIB to a temporary file before '
+                             'processing instead of parsing it on the fly')
+    parser.add_argument('--bgpdump', action='store_true',
+                        help='parse the RIB with bgpdump instead of the '
+                             'built-in MRT decoder')
+    parser.add_argument('--first-peer-only', action='store_true',
+                        help='only use the entry of the first peer for each '
+                             'prefix (ignored with --bgpdump)')
+    parser.add_argument('--dedup', action='store_true',
+                        help='insert each prefix only once and keep the '
+                             'origins and peer count seen across all peers. '
+                             'Always enabled if RIBs are merged')
+    parser.add_argument('-f', '--format', choices=OUTPUT_FORMATS,
+                        default='pickle',
+                        help='save a pickled radix tree, a columnar prefix '
+                             'table, or both')
+    parser.add_argument('-c', '--codec', choices=CODECS, default=DEFAULT_CODEC,
+                        help='compression codec of the pickled radix tree')
     args = parser.parse_args()
     date = datetime.now()
     if args.date:
@@ -94,7 +589,34 @@ def main() -> None:
         except ValueError as e:
             logging.error(f'Invalid date specified: {date} {e}')
             sys.exit(1)
-    download_and_process_rib(date)
+    try:
+        collectors = [parse_collector(spec)
+                      for spec in args.collector or [DEFAULT_COLLECTOR]]
+    except ValueError as e:
+        logging.error(e)
+        sys.exit(1)
+    if len(collectors) > 1:
+        if args.bgpdump:
+            logging.error('Merging RIBs of multiple collectors is not '
+                          'supported with --bgpdump.')
+            sys.exit(1)
+        download_and_merge_ribs(date,
+                                collectors,
+                                workers=args.workers,
+                                first_peer_only=args.first_peer_only,
+                                output_format=args.format,
+                                codec=args.codec)
+        return
+    name, template = collectors[0]
+    if not download_and_process_rib(date,
+                                    get_collector_url(name, template, date),
+                                    stream=not args.no_stream,
+                                    use_bgpdump=args.bgpdump,
+                                    first_peer_only=args.first_peer_only,
+                                    dedup=args.dedup,
+                                    output_format=args.format,
+                                    codec=args.codec):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,39 @@
+import argparse
+import logging
+import os
+import sys
+
+# Called by the shell downloaders, which may run from any directory.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from file_handlers.snapshot_store import commit_snapshot
+
+# Exit code if the snapshot is identical to the previous latest one.
+UNCHANGED_EXIT_CODE = 3
+
+
+def main() -> None:
+    log_format = '%(asctime)s %(levelname)s %(message)s'
+    logging.basicConfig(
+        format=log_format,
+        level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser(
+        description='Move a downloaded file into the snapshot store and '
+                    'create the dated snapshot and latest symlink. Exit '
+                    f'with code {UNCHANGED_EXIT_CODE} if the content did not '
+                    'change.')
+    parser.add_argument('file', help='downloaded file (is moved or removed)')
+    parser.add_argument('output_file', help='dated snapshot to create')
+    parser.add_argument('latest_symlink', nargs='?',
+                        help='symlink to point to the snapshot')
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.file):
+        logging.error(f'File not found: {args.file}')
+        sys.exit(1)
+    if not commit_snapshot(args.file, args.output_file, args.latest_symlink):
+        sys.exit(UNCHANGED_EXIT_CODE)
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
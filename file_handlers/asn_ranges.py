@@ -0,0 +1,160 @@
+import logging
+import os
+from bisect import bisect_right
+from typing import Iterable, Iterator, List, Tuple
+
+INPUT_DELIMITER = ','
+RANGE_HEADER = ('registry', 'cc', 'start', 'end')
+ASN_HEADER = ('registry', 'cc', 'asn')
+
+
+class AsnRangeTable:
+    """Mapping of ASNs to the registry and country they are assigned
+    to, stored as sorted ranges.
+
+    Each range covers the ASNs from start to end (inclusive). Lookups
+    use binary search over the range starts, so memory depends on the
+    number of delegation records, not on the number of ASNs. Ranges may
+    overlap or be nested (see find).
+    """
+
+    def __init__(self, ranges: Iterable[Tuple[str, str, int, int]]) -> None:
+        """Create a table from (registry, cc, start, end) tuples."""
+        ranges = sorted(ranges, key=lambda t: (t[2], t[3]))
+        self.registries = [r[0] for r in ranges]
+        self.ccs = [r[1] for r in ranges]
+        self.starts = [r[2] for r in ranges]
+        self.ends = [r[3] for r in ranges]
+        # Largest end of all ranges up to each index, so that lookups
+        # know when no earlier range can contain an ASN.
+        self.max_ends = list()
+        max_end = -1
+        for end in self.ends:
+            max_end = max(max_end, end)
+            self.max_ends.append(max_end)
+
+    @classmethod
+    def from_asns(cls, asns: Iterable[Tuple[str, str, int]]) \
+            -> 'AsnRangeTable':
+        """Create a table from (registry, cc, asn) tuples sorted by ASN.
+        Consecutive ASNs of the same registry and country are merged
+        into a single range."""
+        ranges = list()
+        current = None
+        for registry, cc, asn in asns:
+            if current is not None \
+                    and current[3] + 1 == asn \
+                    and current[:2] == [registry, cc]:
+                current[3] = asn
+                continue
+            if current is not None:
+                ranges.append(tuple(current))
+            current = [registry, cc, asn, asn]
+        if current is not None:
+            ranges.append(tuple(current))
+        return cls(ranges)
+
+    @classmethod
+    def load(cls, input_file: str) -> 'AsnRangeTable':
+        """Read a CSV file written by get_assigned_as_numbers.py, either
+        with one line per range or with one line per ASN. The cc column
+        is optional. Return an empty table if the file is invalid."""
+        if not os.path.exists(input_file):
+            logging.error(f'Failed to find AS map file: {input_file}')
+            return cls(list())
+        logging.info(f'Reading AS map file: {input_file}')
+        with open(input_file, 'r') as f:
+            header = f.readline().strip().split(INPUT_DELIMITER)
+            if 'start' in header and 'end' in header:
+                columns = [header.index(c) if c in header else None
+                           for c in RANGE_HEADER]
+            elif 'asn' in header:
+                columns = [header.index(c) if c in header else None
+                           for c in ASN_HEADER]
+            else:
+                logging.error(f'AS map file has invalid header: {header}')
+                return cls(list())
+            if columns[0] is None:
+                logging.error(f'AS map file has no registry column: {header}')
+                return cls(list())
+            rows = list()
+            for line in f:
+                line_split = line.strip().split(INPUT_DELIMITER)
+                try:
+                    row = [line_split[idx] if idx is not None else str()
+                           for idx in columns]
+                    row[2:] = map(int, row[2:])
+                except (IndexError, ValueError):
+                    logging.error(f'AS map file has invalid line format: '
+                                  f'{line.strip()}')
+                    return cls(list())
+                rows.append(tuple(row))
+        if len(columns) == len(RANGE_HEADER):
+            return cls(rows)
+        rows.sort(key=lambda t: t[2])
+        return cls.from_asns(rows)
+
+    def __len__(self) -> int:
+        """Return the number of ranges."""
+        return len(self.starts)
+
+    def asn_count(self) -> int:
+        return sum(end - start + 1
+                   for start, end in zip(self.starts, self.ends))
+
+    def find(self, asn: int) -> int:
+        """Return the index of the range containing asn or -1.
+
+        The last range starting at or before asn does not necessarily
+        contain it if ranges are nested, so earlier ranges are searched
+        as long as one of them can still cover asn. If multiple ranges
+        contain asn, the one starting last (i.e., the innermost) is
+        returned."""
+        idx = bisect_right(self.starts, asn) - 1
+        while idx >= 0 and self.max_ends[idx] >= asn:
+            if self.ends[idx] >= asn:
+                return idx
+            idx -= 1
+        return -1
+
+    def __contains__(self, asn: int) -> bool:
+        return self.find(asn) >= 0
+
+    def __getitem__(self, asn: int) -> str:
+        """Return the registry that assigned asn."""
+        idx = self.find(asn)
+        if idx < 0:
+            raise KeyError(asn)
+        return self.registries[idx]
+
+    def get_cc(self, asn: int) -> str:
+        """Return the country asn is assigned to or None."""
+        idx = self.find(asn)
+        if idx < 0:
+            return None
+        return self.ccs[idx]
+
+    def find_overlaps(self) -> List[Tuple[int, int]]:
+        """Return the (start, end) ranges of ASNs that are covered by
+        more than one range.
+
+        Since the ranges are sorted by start, a single pass keeping
+        track of the largest end seen so far finds all overlaps. Lookups
+        of ASNs in these ranges are ambiguous."""
+        overlaps = list()
+        max_end = -1
+        for start, end in zip(self.starts, self.ends):
+            if start <= max_end:
+                overlaps.append((start, min(end, max_end)))
+            max_end = max(max_end, end)
+        return overlaps
+
+    def iter_ranges(self) -> Iterator[Tuple[str, str, int, int]]:
+        yield from zip(self.registries, self.ccs, self.starts, self.ends)
+
+    def iter_asns(self) -> Iterator[Tuple[str, str, int]]:
+        """Yield (registry, cc, asn) tuples for all ASNs in the table in
+        order of the ranges."""
+        for registry, cc, start, end in self.iter_ranges():
+            for asn in range(start, end + 1):
+                yield registry, cc, asn
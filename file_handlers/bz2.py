@@ -1,13 +1,12 @@
-import bz2
 import logging
-import os
+from typing import Iterable, Iterator, Sequence
 
-from file_handlers.common import get_file_name
+from file_handlers.common import get_file_name, write_output
+from file_handlers.compression import find_file, open_file
 
-INPUT_SUFFIX = '.bz2'
+INPUT_SUFFIX = ''
 OUTPUT_DIR = 'parsed/'
 OUTPUT_SUFFIX = '.csv'
-OUTPUT_DELIMITER = ','
 
 
 class Bz2FileHandler:
@@ -15,7 +14,7 @@ class Bz2FileHandler:
                  input_: str,
                  output: str = None,
                  output_name_suffix: str = None):
-        self.input = input_
+        self.input = find_file(input_)
         if output:
             self.output = output
         else:
@@ -25,13 +24,22 @@ class Bz2FileHandler:
             self.output = OUTPUT_DIR + output_name + OUTPUT_SUFFIX
 
     def read(self) -> list:
+        return list(self.iter_lines())
+
+    def iter_lines(self) -> Iterator[str]:
+        """Yield the lines of the input one by one without reading the
+        whole file into memory."""
         logging.info(f'Reading file: {self.input}')
-        with bz2.open(self.input, 'rt') as f:
-            return f.readlines()
+        with open_file(self.input, 'rt') as f:
+            yield from f
 
-    def write(self, lines: list) -> None:
-        logging.info(f'Writing {len(lines)} lines to file: {self.output}')
-        os.makedirs(os.path.dirname(self.output), exist_ok=True)
-        with open(self.output, 'w') as f:
-            for line in lines:
-                f.write(OUTPUT_DELIMITER.join(map(str, line)) + '\n')
+    def write(self,
+              lines: Iterable,
+              header: Sequence = None,
+              formats: Sequence[str] = None,
+              column_types: dict = None) -> None:
+        """Write the lines to the output in the specified formats (CSV by
+        default). See write_output."""
+        line_count = write_output(self.output, lines, header, formats,
+                                  column_types)
+        logging.info(f'Wrote {line_count} lines to file: {self.output}')
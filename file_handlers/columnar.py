@@ -0,0 +1,78 @@
+import os
+from typing import Sequence
+
+# Typed columnar outputs. pyarrow is only imported if one of these
+# formats is requested.
+FORMAT_SUFFIXES = {'parquet': '.parquet', 'arrow': '.arrow'}
+PARQUET_COMPRESSION = 'zstd'
+
+
+def get_arrow_type(type_name: str):
+    """Return the pyarrow type of int64, uint32, float64, string, or
+    category, which is a dictionary-encoded string."""
+    import pyarrow as pa
+    if type_name == 'category':
+        return pa.dictionary(pa.int32(), pa.string())
+    return {'int64': pa.int64(),
+            'uint32': pa.uint32(),
+            'float64': pa.float64(),
+            'string': pa.string()}[type_name]
+
+
+def make_table(rows: Sequence[Sequence],
+               header: Sequence[str],
+               column_types: dict = None):
+    """Build a pyarrow table from rows. column_types maps column names
+    to type names (see get_arrow_type); other columns are inferred.
+    Values are converted to the column type, so numbers formatted as
+    strings become numbers again. Raise a ValueError if a value can not
+    be converted."""
+    import pyarrow as pa
+    column_types = column_types or dict()
+    columns = list(zip(*rows)) if rows else [tuple()] * len(header)
+    arrays = list()
+    for name, values in zip(header, columns):
+        try:
+            try:
+                array = pa.array(values)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                if name not in column_types:
+                    raise
+                # Mixed types, e.g., numbers and formatted numbers.
+                array = pa.array([None if value is None else str(value)
+                                  for value in values], pa.string())
+            if name in column_types:
+                arrow_type = get_arrow_type(column_types[name])
+                if pa.types.is_dictionary(arrow_type):
+                    array = array.cast(pa.string()).dictionary_encode()
+                elif array.type != arrow_type:
+                    array = array.cast(arrow_type)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError,
+                pa.ArrowTypeError) as e:
+            raise ValueError(f'Failed to convert column {name}: {e}')
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays, names=list(header))
+
+
+def write_table(output: str,
+                rows: Sequence[Sequence],
+                header: Sequence[str],
+                output_format: str,
+                column_types: dict = None) -> None:
+    """Write rows to output as Parquet or Arrow IPC file. The data is
+    written to a temporary file, which replaces output once it is
+    complete."""
+    table = make_table(rows, header, column_types)
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    tmp_output = output + '.tmp'
+    if output_format == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, tmp_output, compression=PARQUET_COMPRESSION)
+    elif output_format == 'arrow':
+        import pyarrow as pa
+        with pa.OSFile(tmp_output, 'wb') as sink, \
+                pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        raise ValueError(f'Unknown output format: {output_format}')
+    os.replace(tmp_output, output)
@@ -1,23 +1,143 @@
+import argparse
+import csv
 import logging
 import os
+from itertools import islice
+from typing import Iterable, Sequence
+
+from file_handlers.columnar import FORMAT_SUFFIXES, write_table
+from file_handlers.compression import strip_codec_suffix
+from file_handlers.snapshot_store import OBJECT_DIR
+
+OUTPUT_DELIMITER = ','
+OUTPUT_FORMATS = ('csv',) + tuple(FORMAT_SUFFIXES)
+DEFAULT_OUTPUT_FORMAT = 'csv'
+# Rows are serialized in batches of this size and collected in a write
+# buffer of WRITE_BUFFER_SIZE bytes before they hit the file.
+WRITE_BATCH_SIZE = 10000
+WRITE_BUFFER_SIZE = 1048576
 
 
 def get_file_name(file: str, suffix: str) -> str:
-    """Get the basename of the file and return the basename of the
-    destination if file is a symlink."""
+    """Get the basename of the file without the suffix and the codec
+    suffix (if any) and use the destination if file is a symlink, unless
+    it points into the snapshot object store."""
     if os.path.islink(file):
-        file = os.readlink(file)
-    basename = os.path.basename(file)
+        target = os.readlink(file)
+        if os.path.basename(os.path.dirname(target)) != OBJECT_DIR:
+            file = target
+    basename = strip_codec_suffix(os.path.basename(file))
     if not basename.endswith(suffix):
         logging.warning(f'Can not determine name for input {file}: '
                         f'Unexpected suffix (Expected: {suffix})')
         return basename
-    return basename[:-len(suffix)]
+    return basename[:len(basename) - len(suffix)]
 
 
 def make_symlink(src: str, dst: str) -> None:
     """Create a symlink from src to dst. Remove dst first if it
     exists."""
-    if os.path.exists(dst):
+    if os.path.lexists(dst):
         os.remove(dst)
     os.symlink(src, dst)
+
+
+def write_csv(output: str,
+              rows: Iterable[Sequence],
+              header: Sequence = None) -> int:
+    """Write the rows (and the header, if specified) to output as CSV
+    and return the number of rows, excluding the header.
+
+    rows can be any iterable, e.g., a generator, and is consumed in
+    batches. Fields containing the delimiter, quotes, or line breaks are
+    quoted. The data is written to a temporary file, which replaces
+    output once it is complete.
+    """
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    tmp_output = output + '.tmp'
+    row_count = 0
+    rows = iter(rows)
+    with open(tmp_output, 'w', newline='', buffering=WRITE_BUFFER_SIZE) as f:
+        writer = csv.writer(f, delimiter=OUTPUT_DELIMITER, lineterminator='\n')
+        if header is not None:
+            writer.writerow(header)
+        while True:
+            batch = list(islice(rows, WRITE_BATCH_SIZE))
+            if not batch:
+                break
+            writer.writerows(batch)
+            row_count += len(batch)
+    os.replace(tmp_output, output)
+    return row_count
+
+
+def add_output_format_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--output-format', action='append',
+                        choices=OUTPUT_FORMATS,
+                        help='write the output in this format. Can be '
+                             'specified multiple times. Parquet and Arrow '
+                             'outputs have typed columns and require '
+                             f'pyarrow. Defaults to {DEFAULT_OUTPUT_FORMAT}')
+
+
+def get_output_formats(formats: Sequence[str] = None) -> list:
+    """Return the unique formats in order, or the default format if
+    none are specified."""
+    return list(dict.fromkeys(formats or [DEFAULT_OUTPUT_FORMAT]))
+
+
+def get_outputs(output: str, formats: Sequence[str] = None) -> list:
+    """Return the output file of each format, i.e., output with the
+    suffix replaced by the suffix of the format. CSV outputs keep the
+    suffix of output."""
+    outputs = list()
+    for output_format in get_output_formats(formats):
+        if output_format == DEFAULT_OUTPUT_FORMAT:
+            outputs.append(output)
+        else:
+            outputs.append(os.path.splitext(output)[0]
+                           + FORMAT_SUFFIXES[output_format])
+    return outputs
+
+
+def write_output(output: str,
+                 rows: Iterable[Sequence],
+                 header: Sequence = None,
+                 formats: Sequence[str] = None,
+                 column_types: dict = None) -> int:
+    """Write the rows in the specified formats (see get_outputs) and
+    return the number of rows.
+
+    If header is None, the first row is the header. column_types maps
+    column names to the types of the columnar formats (see
+    file_handlers.columnar). Rows are only materialized if they are
+    written in multiple formats or a columnar format. Raise an
+    ImportError if pyarrow is missing for a columnar format, or a
+    ValueError if the rows do not fit its column types.
+    """
+    formats = get_output_formats(formats)
+    if formats == [DEFAULT_OUTPUT_FORMAT]:
+        return write_csv(output, rows, header)
+    rows = iter(rows)
+    if header is None:
+        header = next(rows, None)
+        if header is None:
+            logging.warning(f'Nothing to write to {output}')
+            return 0
+    rows = list(rows)
+    row_count = 0
+    for output_format, format_output in zip(formats,
+                                            get_outputs(output, formats)):
+        if output_format == DEFAULT_OUTPUT_FORMAT:
+            row_count = write_csv(format_output, rows, header)
+            continue
+        try:
+            write_table(format_output, rows, header, output_format,
+                        column_types)
+        except ImportError as e:
+            raise ImportError(f'Writing {output_format} requires pyarrow: '
+                              f'{e}') from e
+        except ValueError as e:
+            raise ValueError(f'Failed to write {format_output}: {e}') from e
+        row_count = len(rows)
+    return row_count
@@ -0,0 +1,95 @@
+import io
+import logging
+import os
+
+from file_handlers.parallel_bz2 import open_bz2
+
+# Raw snapshots are stored with one of these codecs, which is
+# determined by the file suffix. zstd and lz4 are only imported if
+# used.
+CODEC_SUFFIXES = {'bz2': '.bz2',
+                  'zst': '.zst',
+                  'lz4': '.lz4',
+                  'none': ''}
+CODECS = tuple(CODEC_SUFFIXES)
+DEFAULT_CODEC = 'bz2'
+# Prefix of the symlinks to the latest snapshot.
+LATEST_PREFIX = 'latest-'
+ZSTD_LEVEL = 10
+# Use all cores for zstd compression.
+ZSTD_THREADS = -1
+
+
+def get_codec(file: str) -> str:
+    """Return the codec of file based on its suffix."""
+    for codec, suffix in CODEC_SUFFIXES.items():
+        if suffix and file.endswith(suffix):
+            return codec
+    return 'none'
+
+
+def strip_codec_suffix(file: str) -> str:
+    """Remove the codec suffix (if any) from file."""
+    suffix = CODEC_SUFFIXES[get_codec(file)]
+    if not suffix:
+        return file
+    return file[:-len(suffix)]
+
+
+def find_file(file: str) -> str:
+    """Return the path to the variant of file that is actually present.
+
+    Snapshots named latest-* are resolved to the most recently updated
+    variant of any codec, e.g., 'latest-rib.pickle.zst' is used for
+    'latest-rib.pickle.bz2' if the last snapshot was downloaded with
+    zstd, since the latest symlinks of other codecs are not removed.
+    Other files are returned as is if they exist, and the most recent
+    variant is only used if they do not. Return file if no variant
+    exists.
+    """
+    if os.path.isfile(file) \
+            and not os.path.basename(file).startswith(LATEST_PREFIX):
+        return file
+    base = strip_codec_suffix(file)
+    candidates = [base + suffix for suffix in CODEC_SUFFIXES.values()
+                  if os.path.isfile(base + suffix)]
+    if not candidates:
+        return file
+    # The latest symlink is replaced by every download, while the object
+    # it points to keeps its mtime if the content did not change.
+    found = max(candidates, key=lambda candidate: os.lstat(candidate).st_mtime)
+    if found != file:
+        logging.info(f'Using {found} for input {file}')
+    return found
+
+
+def open_file(file: str, mode: str = 'rb', codec: str = None):
+    """Open file in binary ('rb', 'wb') or text ('rt', 'wt') mode with
+    the specified codec, or the codec determined by the suffix of file.
+
+    Binary readers always support peek().
+    """
+    if mode not in ('r', 'rb', 'rt', 'w', 'wb', 'wt'):
+        raise ValueError(f'Invalid mode: {mode}')
+    if len(mode) == 1:
+        mode += 'b'
+    if codec is None:
+        codec = get_codec(file)
+    if codec == 'bz2':
+        return open_bz2(file, mode)
+    if codec == 'zst':
+        import zstandard
+        if mode.startswith('w'):
+            cctx = zstandard.ZstdCompressor(level=ZSTD_LEVEL,
+                                            threads=ZSTD_THREADS)
+            return zstandard.open(file, mode, cctx=cctx)
+        f = zstandard.open(file, mode)
+        if mode == 'rb':
+            return io.BufferedReader(f)
+        return f
+    if codec == 'lz4':
+        import lz4.frame
+        return lz4.frame.open(file, mode)
+    if codec == 'none':
+        return open(file, mode)
+    raise ValueError(f'Unknown codec: {codec}')
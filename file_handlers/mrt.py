@@ -0,0 +1,123 @@
+import logging
+import socket
+import struct
+from collections import Counter
+from itertools import groupby
+from typing import Iterable, Iterator, Tuple
+
+# For the format see RFC 6396 and RFC 8050 (ADD-PATH subtypes).
+MRT_HEADER = struct.Struct('!IHHI')
+TABLE_DUMP_V2 = 13
+RIB_IPV4_UNICAST = 2
+RIB_IPV6_UNICAST = 4
+RIB_IPV4_UNICAST_ADDPATH = 8
+RIB_IPV6_UNICAST_ADDPATH = 10
+RIB_SUBTYPES = {RIB_IPV4_UNICAST: (socket.AF_INET, 4, False),
+                RIB_IPV6_UNICAST: (socket.AF_INET6, 16, False),
+                RIB_IPV4_UNICAST_ADDPATH: (socket.AF_INET, 4, True),
+                RIB_IPV6_UNICAST_ADDPATH: (socket.AF_INET6, 16, True)}
+
+ATTR_FLAG_EXTENDED_LENGTH = 0x10
+ATTR_TYPE_AS_PATH = 2
+AS_SET = 1
+AS_SEQUENCE = 2
+
+
+def get_origin(body: bytes, offset: int, end: int) -> str:
+    """Return the origin of the AS_PATH attribute contained in the
+    attribute list between offset and end in the same format as
+    bgpdump, i.e., '{a,b}' if the path ends with an AS_SET. Return an
+    empty string if there is no AS path.
+
+    Note that TABLE_DUMP_V2 always encodes AS numbers with four
+    bytes."""
+    while offset < end:
+        flags = body[offset]
+        attr_type = body[offset + 1]
+        if flags & ATTR_FLAG_EXTENDED_LENGTH:
+            attr_len = (body[offset + 2] << 8) | body[offset + 3]
+            offset += 4
+        else:
+            attr_len = body[offset + 2]
+            offset += 3
+        if attr_type != ATTR_TYPE_AS_PATH:
+            offset += attr_len
+            continue
+        attr_end = offset + attr_len
+        origin = str()
+        while offset < attr_end:
+            segment_type = body[offset]
+            segment_len = body[offset + 1]
+            offset += 2
+            if segment_len == 0:
+                continue
+            if segment_type == AS_SEQUENCE:
+                origin = str(struct.unpack_from(
+                    '!I', body, offset + 4 * (segment_len - 1))[0])
+            elif segment_type == AS_SET:
+                asns = struct.unpack_from(f'!{segment_len}I', body, offset)
+                origin = '{' + ','.join(map(str, asns)) + '}'
+            offset += 4 * segment_len
+        return origin
+    return str()
+
+
+def iter_rib_entries(f, first_peer_only: bool = False) \
+        -> Iterator[Tuple[str, str]]:
+    """Decode RIB_IPV4_UNICAST and RIB_IPV6_UNICAST records from the
+    uncompressed MRT stream f and yield (prefix, origin) tuples.
+
+    By default one tuple is yielded per peer entry, i.e., the same
+    prefix is yielded multiple times in a row. If first_peer_only is
+    set, only the entry of the first peer is used for each prefix.
+    """
+    record_count = 0
+    while True:
+        header = f.read(MRT_HEADER.size)
+        if len(header) < MRT_HEADER.size:
+            if header:
+                logging.error('Truncated MRT header at end of file.')
+            break
+        _, mrt_type, subtype, length = MRT_HEADER.unpack(header)
+        body = f.read(length)
+        if len(body) < length:
+            logging.error(f'Truncated MRT record. Expected {length} bytes, '
+                          f'got {len(body)}.')
+            break
+        if mrt_type != TABLE_DUMP_V2 or subtype not in RIB_SUBTYPES:
+            continue
+        record_count += 1
+        family, addr_len, addpath = RIB_SUBTYPES[subtype]
+        # Skip sequence number.
+        pfx_len = body[4]
+        pfx_bytes = (pfx_len + 7) // 8
+        addr = body[5:5 + pfx_bytes] + bytes(addr_len - pfx_bytes)
+        prefix = f'{socket.inet_ntop(family, addr)}/{pfx_len}'
+        offset = 5 + pfx_bytes
+        entry_count = (body[offset] << 8) | body[offset + 1]
+        offset += 2
+        for _ in range(entry_count):
+            # Skip peer index and originated time.
+            offset += 6
+            if addpath:
+                offset += 4
+            attr_len = (body[offset] << 8) | body[offset + 1]
+            offset += 2
+            yield prefix, get_origin(body, offset, offset + attr_len)
+            if first_peer_only:
+                break
+            offset += attr_len
+    logging.info(f'Read {record_count} MRT RIB records')
+
+
+def group_by_prefix(entries: Iterable[Tuple[str, str]]) \
+        -> Iterator[Tuple[str, Counter]]:
+    """Group consecutive (prefix, origin) tuples by prefix and yield
+    (prefix, origin counter) tuples, where the counter maps each origin
+    to the number of peers that announced it.
+
+    MRT RIB dumps (and bgpdump output) list all peer entries of a
+    prefix consecutively, so each prefix is usually yielded once.
+    """
+    for prefix, group in groupby(entries, key=lambda t: t[0]):
+        yield prefix, Counter(origin for _, origin in group)
@@ -1,15 +1,32 @@
-import bz2
 import logging
-import os
+from typing import Iterable, Iterator, Sequence
 
 import msgpack
 
-from file_handlers.common import get_file_name
+from file_handlers.common import get_file_name, write_output
+from file_handlers.compression import find_file, open_file
 
-INPUT_SUFFIX = '.msgpack.bz2'
+INPUT_SUFFIX = '.msgpack'
 OUTPUT_DIR = 'parsed/'
 OUTPUT_SUFFIX = '.csv'
-OUTPUT_DELIMITER = ','
+# First bytes of msgpack arrays (fixarray, array 16, array 32).
+ARRAY_MARKERS = set(range(0x90, 0xa0)) | {0xdc, 0xdd}
+
+
+def write_records(output: str, records: Iterable, codec: str = None) -> int:
+    """Write records to output as a compressed stream of individual
+    msgpack objects and return the number of records. The codec is
+    determined by the suffix of output if not specified.
+
+    Records are packed and written as they come in, so the records do
+    not need to be held in memory."""
+    packer = msgpack.Packer()
+    record_count = 0
+    with open_file(output, 'wb', codec) as f:
+        for record in records:
+            f.write(packer.pack(record))
+            record_count += 1
+    return record_count
 
 
 class MsgpackFileHandler:
@@ -17,7 +34,7 @@ class MsgpackFileHandler:
                  input_: str,
                  output: str = None,
                  output_name_suffix: str = None):
-        self.input = input_
+        self.input = find_file(input_)
         if output:
             self.output = output
         else:
@@ -26,13 +43,33 @@ class MsgpackFileHandler:
                 output_name += output_name_suffix
             self.output = OUTPUT_DIR + output_name + OUTPUT_SUFFIX
 
-    def read(self):
+    def read(self) -> list:
+        return list(self.iter_records())
+
+    def iter_records(self) -> Iterator:
+        """Yield the records of the input one by one.
+
+        Supports both streams of individual records (see write_records)
+        and files containing a single array of records. In the latter
+        case the array elements are yielded without unpacking the whole
+        array first."""
         logging.info(f'Reading file: {self.input}')
-        return msgpack.load(bz2.BZ2File(self.input, 'rb'))
-
-    def write(self, lines: list) -> None:
-        logging.info(f'Writing {len(lines)} lines to file: {self.output}')
-        os.makedirs(os.path.dirname(self.output), exist_ok=True)
-        with open(self.output, 'w') as f:
-            for line in lines:
-                f.write(OUTPUT_DELIMITER.join(map(str, line)) + '\n')
+        with open_file(self.input, 'rb') as f:
+            first_byte = f.peek(1)[:1]
+            unpacker = msgpack.Unpacker(f)
+            if first_byte and first_byte[0] in ARRAY_MARKERS:
+                for _ in range(unpacker.read_array_header()):
+                    yield unpacker.unpack()
+            else:
+                yield from unpacker
+
+    def write(self,
+              lines: Iterable,
+              header: Sequence = None,
+              formats: Sequence[str] = None,
+              column_types: dict = None) -> None:
+        """Write the lines to the output in the specified formats (CSV by
+        default). See write_output."""
+        line_count = write_output(self.output, lines, header, formats,
+                                  column_types)
+        logging.info(f'Wrote {line_count} lines to file: {self.output}')
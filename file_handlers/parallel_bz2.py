@@ -0,0 +1,207 @@
+import bz2
+import io
+import logging
+import mmap
+import os
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Tuple
+
+# The bz2 module releases the GIL while (de)compressing, so threads
+# scale across cores without copying data between processes.
+WORKERS = os.cpu_count() or 1
+# Uncompressed size of the independent streams written in parallel.
+# Matches the largest bzip2 block size, as used by pbzip2 by default.
+BLOCK_SIZE = 900000
+COMPRESS_LEVEL = 9
+# Minimum amount of compressed data decompressed by a single job.
+JOB_SIZE = 4 * 1024 * 1024
+# Maximum amount of compressed data submitted ahead of the reader. Each
+# job is held in memory fully decompressed until it is read, so this
+# bounds the memory use independently of the number of workers.
+READ_AHEAD_SIZE = 8 * JOB_SIZE
+# Stream header ('BZh' + block size) followed by the block magic.
+STREAM_START = re.compile(rb'BZh[1-9]1AY&SY')
+
+
+def find_streams(data) -> List[int]:
+    """Return the offsets of all bz2 streams in data.
+
+    Files written by pbzip2 or ParallelBz2Writer consist of many
+    independent streams, which can be decompressed in parallel. Files
+    written by bzip2 or the bz2 module usually contain a single stream.
+    Since the pattern can also occur within compressed data by chance,
+    the offsets are only candidates.
+    """
+    return [m.start() for m in STREAM_START.finditer(data)]
+
+
+def make_jobs(offsets: List[int], size: int) -> List[Tuple[int, int]]:
+    """Group consecutive streams into (start, end) ranges of at least
+    JOB_SIZE bytes."""
+    jobs = list()
+    start = offsets[0]
+    for offset in offsets[1:]:
+        if offset - start >= JOB_SIZE:
+            jobs.append((start, offset))
+            start = offset
+    jobs.append((start, size))
+    return jobs
+
+
+def decompress(data: bytes):
+    """Decompress data or return None if data is not a valid sequence
+    of complete bz2 streams."""
+    try:
+        return bz2.decompress(data)
+    except (OSError, ValueError, EOFError):
+        return None
+
+
+class ParallelBz2Reader(io.RawIOBase):
+    """Decompress a multi-stream bz2 file on a thread pool while keeping
+    the output in order."""
+
+    def __init__(self, file: str, workers: int = WORKERS) -> None:
+        super().__init__()
+        with open(file, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        offsets = find_streams(self.mm)
+        if not offsets or offsets[0] != 0:
+            self.mm.close()
+            raise ValueError(f'Not a bz2 file: {file}')
+        self.jobs = make_jobs(offsets, len(self.mm))
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.workers = workers
+        self.blocks = self.iter_blocks()
+        self.buffer = memoryview(b'')
+
+    @staticmethod
+    def get_size(pending: deque) -> int:
+        """Return the compressed size of the pending jobs."""
+        return sum(end - start for start, end, _ in pending)
+
+    def iter_blocks(self) -> Iterator[bytes]:
+        pending = deque()
+        jobs = deque(self.jobs)
+        while jobs or pending:
+            while jobs and len(pending) < 2 * self.workers:
+                start, end = jobs[0]
+                if pending and self.get_size(pending) + end - start \
+                        > READ_AHEAD_SIZE:
+                    break
+                jobs.popleft()
+                pending.append((start, end, self.executor.submit(
+                    decompress, self.mm[start:end])))
+            start, end, future = pending.popleft()
+            block = future.result()
+            while block is None:
+                # A false stream start was used as a boundary. Extend
+                # the range until it ends at a real stream boundary.
+                if pending:
+                    _, end, _ = pending.popleft()
+                elif jobs:
+                    _, end = jobs.popleft()
+                else:
+                    raise OSError('Invalid data stream')
+                logging.debug(f'Retrying bz2 decompression of range '
+                              f'{start}-{end}')
+                block = decompress(self.mm[start:end])
+            yield block
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self.buffer:
+            try:
+                self.buffer = memoryview(next(self.blocks))
+            except StopIteration:
+                return 0
+        read_len = min(len(b), len(self.buffer))
+        b[:read_len] = self.buffer[:read_len]
+        self.buffer = self.buffer[read_len:]
+        return read_len
+
+    def close(self) -> None:
+        if not self.closed:
+            self.blocks.close()
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.buffer.release()
+            self.mm.close()
+        super().close()
+
+
+class ParallelBz2Writer(io.RawIOBase):
+    """Compress data on a thread pool into a sequence of independent
+    bz2 streams of BLOCK_SIZE uncompressed bytes each.
+
+    The output can be read by any bz2 decompressor and is compatible
+    with pbzip2."""
+
+    def __init__(self, file: str, workers: int = WORKERS) -> None:
+        super().__init__()
+        self.f = open(file, 'wb')
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.workers = workers
+        self.pending = deque()
+        self.buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.buffer += b
+        while len(self.buffer) >= BLOCK_SIZE:
+            self.submit(bytes(self.buffer[:BLOCK_SIZE]))
+            del self.buffer[:BLOCK_SIZE]
+        return len(b)
+
+    def submit(self, block: bytes) -> None:
+        self.pending.append(self.executor.submit(bz2.compress, block,
+                                                 COMPRESS_LEVEL))
+        while len(self.pending) > 2 * self.workers:
+            self.f.write(self.pending.popleft().result())
+
+    def close(self) -> None:
+        if not self.closed:
+            try:
+                if self.buffer or not self.pending:
+                    # Always write at least one stream, even if empty.
+                    self.submit(bytes(self.buffer))
+                self.buffer.clear()
+                while self.pending:
+                    self.f.write(self.pending.popleft().result())
+            finally:
+                self.executor.shutdown(wait=True)
+                self.f.close()
+        super().close()
+
+
+def open_bz2(file: str, mode: str = 'rb', workers: int = WORKERS):
+    """Open a bz2-compressed file in binary ('rb', 'wb') or text ('rt',
+    'wt') mode and use multiple threads if possible.
+
+    Writing always produces a multi-stream file if workers > 1. Reading
+    is only parallelized for multi-stream files, single-stream files are
+    read with the bz2 module.
+    """
+    if mode not in ('r', 'rb', 'rt', 'w', 'wb', 'wt'):
+        raise ValueError(f'Invalid mode: {mode}')
+    text = mode.endswith('t')
+    if workers <= 1:
+        return bz2.open(file, mode)
+    if mode.startswith('w'):
+        f = io.BufferedWriter(ParallelBz2Writer(file, workers),
+                              buffer_size=BLOCK_SIZE)
+    else:
+        with open(file, 'rb') as f:
+            head = f.read(JOB_SIZE + 1)
+        if len(find_streams(head)) <= 1:
+            return bz2.open(file, mode)
+        f = io.BufferedReader(ParallelBz2Reader(file, workers),
+                              buffer_size=BLOCK_SIZE)
+    if text:
+        return io.TextIOWrapper(f)
+    return f
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+
+from file_handlers.compression import find_file
+from file_handlers.snapshot_store import get_snapshot_hash
+
+# Sidecar file written next to each output.
+META_SUFFIX = '.meta.json'
+# Maps cache keys to outputs, stored in the output directory.
+INDEX_FILE = '.parse-cache-index.json'
+
+
+def get_input_identity(file: str) -> dict:
+    """Return the resolved path, size, and modification time of the
+    input file."""
+    target = os.path.realpath(find_file(file))
+    st = os.stat(target)
+    return {'file': target, 'size': st.st_size, 'mtime': st.st_mtime}
+
+
+def write_json(file: str, data: dict) -> None:
+    tmp_file = file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_file, file)
+
+
+def read_json(file: str) -> dict:
+    if not os.path.exists(file):
+        return dict()
+    try:
+        with open(file, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f'Ignoring invalid cache file {file}: {e}')
+        return dict()
+
+
+class ParseCache:
+    """Record which inputs and parameters outputs were computed from,
+    so that unchanged outputs are not recomputed.
+
+    outputs are the files written by the script, e.g., one per output
+    format. They are up to date if all of them exist and the sidecar of
+    the first one lists the same parameters and inputs. Inputs are
+    compared by resolved path, size and modification time first and by
+    content hash if these differ. If the outputs do not exist, but other
+    outputs were computed by the same script from inputs with the same
+    content and the same parameters, these outputs are copied instead.
+    """
+
+    def __init__(self,
+                 outputs: list,
+                 inputs: list,
+                 params: dict = None,
+                 name: str = None) -> None:
+        if isinstance(outputs, str):
+            outputs = [outputs]
+        self.outputs = outputs
+        self.output = outputs[0]
+        self.meta_file = self.output + META_SUFFIX
+        self.index_file = os.path.join(os.path.dirname(self.output) or '.',
+                                       INDEX_FILE)
+        self.inputs = inputs
+        self.params = params or dict()
+        self.name = name or os.path.basename(sys.argv[0])
+        self._identities = None
+
+    @property
+    def identities(self) -> list:
+        """Identities of the inputs, including their content hash."""
+        if self._identities is None:
+            self._identities = list()
+            for file in self.inputs:
+                identity = get_input_identity(file)
+                identity['hash'] = get_snapshot_hash(identity['file'])
+                self._identities.append(identity)
+        return self._identities
+
+    def get_key(self) -> str:
+        key = {'name': self.name,
+               'params': self.params,
+               'inputs': [identity['hash'] for identity in self.identities]}
+        return hashlib.sha256(json.dumps(key, sort_keys=True, default=str)
+                              .encode('utf-8')).hexdigest()
+
+    def inputs_match(self, recorded: list) -> bool:
+        if len(recorded) != len(self.inputs):
+            return False
+        for idx, (file, old) in enumerate(zip(self.inputs, recorded)):
+            try:
+                new = get_input_identity(file)
+            except OSError:
+                return False
+            if all(new[k] == old.get(k) for k in ('file', 'size', 'mtime')):
+                continue
+            # Same content at a different path or with a new mtime.
+            if new['size'] != old.get('size'):
+                return False
+            if self.identities[idx]['hash'] != old.get('hash'):
+                return False
+        return True
+
+    def is_fresh(self) -> bool:
+        """Return True if all outputs are up to date."""
+        if not all(os.path.exists(output) for output in self.outputs):
+            return False
+        meta = read_json(self.meta_file)
+        if not meta or meta.get('name') != self.name \
+                or meta.get('params') != json.loads(
+                    json.dumps(self.params, default=str)):
+            return False
+        return self.inputs_match(meta.get('inputs', list()))
+
+    def reuse(self) -> bool:
+        """Copy the outputs computed from identical inputs, if any.
+        Return True on success."""
+        try:
+            previous = read_json(self.index_file).get(self.get_key())
+        except OSError:
+            return False
+        if isinstance(previous, str):
+            previous = [previous]
+        if not previous or previous == self.outputs \
+                or len(previous) != len(self.outputs) \
+                or not all(os.path.exists(output) for output in previous):
+            return False
+        logging.info(f'Inputs are identical to those of {previous[0]}')
+        for src, dst in zip(previous, self.outputs):
+            shutil.copyfile(src, dst)
+        self.record()
+        return True
+
+    def check(self, force: bool = False) -> bool:
+        """Return True if the output is up to date or could be reused,
+        i.e., it does not need to be computed. Always return False if
+        force is set."""
+        if force:
+            return False
+        try:
+            if self.is_fresh():
+                logging.info(f'Output is up to date: {self.output}')
+                return True
+            return self.reuse()
+        except OSError as e:
+            logging.warning(f'Failed to check parse cache: {e}')
+            return False
+
+    def record(self) -> None:
+        """Record the inputs of the outputs after they were written."""
+        try:
+            write_json(self.meta_file,
+                       {'name': self.name,
+                        'params': self.params,
+                        'inputs': self.identities})
+            index = read_json(self.index_file)
+            index[self.get_key()] = self.outputs
+            write_json(self.index_file, index)
+        except (OSError, TypeError) as e:
+            logging.warning(f'Failed to update parse cache: {e}')
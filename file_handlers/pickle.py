@@ -1,14 +1,13 @@
-import bz2
 import logging
-import os
 import pickle
+from typing import Iterable, Sequence
 
-from file_handlers.common import get_file_name
+from file_handlers.common import get_file_name, write_output
+from file_handlers.compression import find_file, open_file
 
-INPUT_SUFFIX = '.pickle.bz2'
+INPUT_SUFFIX = '.pickle'
 OUTPUT_DIR = 'parsed/'
 OUTPUT_SUFFIX = '.csv'
-OUTPUT_DELIMITER = ','
 
 
 class PickleFileHandler:
@@ -16,7 +15,7 @@ class PickleFileHandler:
                  input_: str,
                  output: str = None,
                  output_name_suffix: str = None):
-        self.input = input_
+        self.input = find_file(input_)
         if output:
             self.output = output
         else:
@@ -27,11 +26,16 @@ class PickleFileHandler:
 
     def read(self):
         logging.info(f'Reading file: {self.input}')
-        return pickle.load(bz2.BZ2File(self.input, 'rb'))
+        with open_file(self.input, 'rb') as f:
+            return pickle.load(f)
 
-    def write(self, lines: list) -> None:
-        logging.info(f'Writing {len(lines)} lines to file: {self.output}')
-        os.makedirs(os.path.dirname(self.output), exist_ok=True)
-        with open(self.output, 'w') as f:
-            for line in lines:
-                f.write(OUTPUT_DELIMITER.join(map(str, line)) + '\n')
+    def write(self,
+              lines: Iterable,
+              header: Sequence = None,
+              formats: Sequence[str] = None,
+              column_types: dict = None) -> None:
+        """Write the lines to the output in the specified formats (CSV by
+        default). See write_output."""
+        line_count = write_output(self.output, lines, header, formats,
+                                  column_types)
+        logging.info(f'Wrote {line_count} lines to file: {self.output}')
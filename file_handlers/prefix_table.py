@@ -0,0 +1,548 @@
+import json
+import logging
+import mmap
+import socket
+import struct
+from collections import Counter, namedtuple
+from typing import Iterable, Iterator, Sequence, Tuple
+
+import numpy as np
+import radix
+
+from file_handlers.common import get_file_name, write_output
+
+INPUT_SUFFIX = '.pfx2as'
+OUTPUT_DIR = 'parsed/'
+OUTPUT_SUFFIX = '.csv'
+
+# File layout: magic, little-endian uint64 header length, JSON header
+# describing the sections, and the raw section data. Each section
+# starts at a multiple of SECTION_ALIGNMENT relative to the data start,
+# so the arrays can be memory-mapped without copying.
+MAGIC = b'PFX2AS01'
+HEADER_LEN = struct.Struct('<Q')
+SECTION_ALIGNMENT = 8
+
+# Origins ending in an AS_SET are stored as SET_ORIGIN in the origin
+# column. Their members are listed in the set_* sections, which are
+# indexed by the position of the entry in the table (IPv4 entries
+# first, then IPv6 entries). An empty origin (no AS path) is also
+# stored as SET_ORIGIN, but has no set entry.
+SET_ORIGIN = 0
+
+# Tables built from the merged RIBs of multiple collectors (see
+# PrefixTable.from_origin_sets) also list all origins of each entry and
+# the number of peers announcing them. Unlike the set_* sections, the
+# origin_* sections contain an offset for every entry. AS_SET origins
+# are listed as SET_ORIGIN. The visibility_* sections contain the
+# number of collectors and peers that saw each entry.
+
+# Batch lookups of IPv6 addresses only use the upper 64 bits. Longer
+# prefixes are ignored.
+V6_LOOKUP_BITS = 64
+NO_MATCH = -1
+
+PrefixNode = namedtuple('PrefixNode', 'prefix network prefixlen family data')
+
+
+def parse_origin(origin: str) -> Tuple[int, tuple]:
+    """Return the numeric origin and the members of the AS_SET (if
+    any) of an origin in bgpdump notation."""
+    if origin.startswith('{'):
+        members = tuple(int(asn) for asn in origin.strip('{}').split(',')
+                        if asn)
+        return SET_ORIGIN, members
+    if not origin:
+        return SET_ORIGIN, tuple()
+    return int(origin), tuple()
+
+
+def get_prefix_key(prefix: str) -> Tuple[int, int, int, int]:
+    """Return (family, high, low, prefix length) of prefix, where family
+    is 4 or 6 and high and low are the upper and lower 64 bits of the
+    network (high is always 0 for IPv4). Host bits are cleared, like
+    radix does. Sorting by this key orders prefixes like the table."""
+    address, prefixlen = prefix.split('/')
+    prefixlen = int(prefixlen)
+    if ':' in address:
+        network = int.from_bytes(socket.inet_pton(socket.AF_INET6, address),
+                                 'big')
+        network &= ~((1 << (128 - prefixlen)) - 1)
+        return 6, network >> 64, network & 0xffffffffffffffff, prefixlen
+    network = int.from_bytes(socket.inet_aton(address), 'big')
+    return 4, 0, network & ~((1 << (32 - prefixlen)) - 1), prefixlen
+
+
+def make_sections(v4: dict, v6: dict) -> dict:
+    """Build the sections of a table from maps of (network, length) to
+    origin for IPv4 and (high, low, length) to origin for IPv6."""
+    sections = dict()
+    set_index = list()
+    set_offsets = [0]
+    set_members = list()
+
+    def make_origins(keys: list, table: dict, index_offset: int) \
+            -> np.ndarray:
+        origins = np.empty(len(keys), dtype='<u4')
+        for idx, key in enumerate(keys):
+            origin, members = parse_origin(table[key])
+            origins[idx] = origin
+            if members:
+                set_index.append(index_offset + idx)
+                set_members.extend(members)
+                set_offsets.append(len(set_members))
+        return origins
+
+    v4_keys = sorted(v4)
+    sections['v4_network'] = np.array([k[0] for k in v4_keys], dtype='<u4')
+    sections['v4_length'] = np.array([k[1] for k in v4_keys], dtype='u1')
+    sections['v4_origin'] = make_origins(v4_keys, v4, 0)
+    v6_keys = sorted(v6)
+    sections['v6_network'] = np.array([k[:2] for k in v6_keys],
+                                      dtype='<u8').reshape(-1, 2)
+    sections['v6_length'] = np.array([k[2] for k in v6_keys], dtype='u1')
+    sections['v6_origin'] = make_origins(v6_keys, v6, len(v4_keys))
+    sections['set_index'] = np.array(set_index, dtype='<u8')
+    sections['set_offsets'] = np.array(set_offsets, dtype='<u8')
+    sections['set_members'] = np.array(set_members, dtype='<u4')
+    return sections
+
+
+def make_intervals(networks: list,
+                   lengths: list,
+                   bits: int,
+                   index_offset: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Flatten prefixes into non-overlapping intervals.
+
+    networks and lengths describe prefixes in an address space of the
+    specified number of bits and must be sorted by network and length,
+    i.e., covering prefixes come before more specific ones. Prefixes
+    longer than bits are ignored.
+
+    Return a sorted array of interval starts and an array containing the
+    index of the most specific prefix covering each interval (plus
+    index_offset), or NO_MATCH. The longest-prefix match of an address
+    is the index of the last interval starting at or before it.
+    """
+    starts = [0]
+    indices = [NO_MATCH]
+    space_end = 1 << bits
+
+    def add(start: int, idx: int) -> None:
+        if start >= space_end:
+            return
+        if starts[-1] == start:
+            # The previous interval is empty.
+            starts.pop()
+            indices.pop()
+        if indices and indices[-1] == idx:
+            return
+        starts.append(start)
+        indices.append(idx)
+
+    # (end, index) of the prefixes covering the current position.
+    stack = list()
+    for idx, (network, length) in enumerate(zip(networks, lengths)):
+        if length > bits:
+            continue
+        while stack and stack[-1][0] <= network:
+            end, _ = stack.pop()
+            add(end, stack[-1][1] if stack else NO_MATCH)
+        add(network, index_offset + idx)
+        stack.append((network + (1 << (bits - length)), index_offset + idx))
+    while stack:
+        end, _ = stack.pop()
+        add(end, stack[-1][1] if stack else NO_MATCH)
+    return np.array(starts, dtype=np.uint64), np.array(indices, dtype=np.int64)
+
+
+def encode_addresses(addresses: Sequence[str]) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Convert address strings to integers for batch lookups.
+
+    Return the positions of the IPv4 addresses, their values, and the
+    positions of the IPv6 addresses and the values of their upper 64
+    bits. Invalid addresses are not included."""
+    v4_pos = list()
+    v4_bytes = list()
+    v6_pos = list()
+    v6_bytes = list()
+    for pos, address in enumerate(addresses):
+        try:
+            if ':' in address:
+                v6_bytes.append(
+                    socket.inet_pton(socket.AF_INET6, address)[:8])
+                v6_pos.append(pos)
+            else:
+                v4_bytes.append(socket.inet_pton(socket.AF_INET, address))
+                v4_pos.append(pos)
+        except OSError:
+            logging.debug(f'Invalid address: {address}')
+    return (np.array(v4_pos, dtype=np.int64),
+            np.frombuffer(b''.join(v4_bytes), dtype='>u4').astype(np.uint64),
+            np.array(v6_pos, dtype=np.int64),
+            np.frombuffer(b''.join(v6_bytes), dtype='>u8').astype(np.uint64))
+
+
+class PrefixTable:
+    """Prefix-to-origin mapping stored as sorted columns.
+
+    IPv4 and IPv6 prefixes are kept in separate sections, sorted by
+    network address and prefix length. IPv4 networks are stored as
+    uint32, IPv6 networks as pairs of uint64 (high, low).
+
+    A radix tree is only built if longest-prefix lookups are requested.
+    """
+
+    def __init__(self, sections: dict) -> None:
+        self.sections = sections
+        self.v4_network = sections['v4_network']
+        self.v4_length = sections['v4_length']
+        self.v4_origin = sections['v4_origin']
+        self.v6_network = sections['v6_network']
+        self.v6_length = sections['v6_length']
+        self.v6_origin = sections['v6_origin']
+        self.set_index = sections['set_index']
+        self.set_offsets = sections['set_offsets']
+        self.set_members = sections['set_members']
+        self.origin_offsets = sections.get('origin_offsets')
+        self.origin_members = sections.get('origin_members')
+        self.origin_peers = sections.get('origin_peers')
+        self.visibility_collectors = sections.get('visibility_collectors')
+        self.visibility_peers = sections.get('visibility_peers')
+        self._rtree = None
+        self._v4_intervals = None
+        self._v6_intervals = None
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Tuple[str, str]]) -> 'PrefixTable':
+        """Build a table from (prefix, origin) tuples, where origin is in
+        bgpdump notation. Later entries overwrite earlier entries of the
+        same prefix."""
+        v4 = dict()
+        v6 = dict()
+        for prefix, origin in entries:
+            family, hi, lo, prefixlen = get_prefix_key(prefix)
+            if family == 6:
+                v6[(hi, lo, prefixlen)] = origin
+            else:
+                v4[(lo, prefixlen)] = origin
+        return cls(make_sections(v4, v6))
+
+    @classmethod
+    def from_origin_sets(cls, entries: Iterable[Tuple[str, dict, int]]) \
+            -> 'PrefixTable':
+        """Build a table from (prefix, origins, collectors) tuples, where
+        origins maps each origin to the number of peers that announced it
+        and collectors is the number of collectors that saw the prefix.
+
+        The origin column contains the origin seen by most peers. All
+        origins and the visibility of each prefix are stored in the
+        origin_* and visibility_* sections.
+        """
+        v4 = dict()
+        v6 = dict()
+        for prefix, origins, collectors in entries:
+            family, hi, lo, prefixlen = get_prefix_key(prefix)
+            if family == 6:
+                v6[(hi, lo, prefixlen)] = (Counter(origins), collectors)
+            else:
+                v4[(lo, prefixlen)] = (Counter(origins), collectors)
+        sections = make_sections(
+            {key: origins.most_common(1)[0][0]
+             for key, (origins, _) in v4.items()},
+            {key: origins.most_common(1)[0][0]
+             for key, (origins, _) in v6.items()})
+        values = [v4[key] for key in sorted(v4)] \
+            + [v6[key] for key in sorted(v6)]
+        origin_offsets = [0]
+        origin_members = list()
+        origin_peers = list()
+        for origins, _ in values:
+            for origin, peers in origins.items():
+                origin_members.append(parse_origin(origin)[0])
+                origin_peers.append(peers)
+            origin_offsets.append(len(origin_members))
+        sections['origin_offsets'] = np.array(origin_offsets, dtype='<u8')
+        sections['origin_members'] = np.array(origin_members, dtype='<u4')
+        sections['origin_peers'] = np.array(origin_peers, dtype='<u4')
+        sections['visibility_collectors'] = np.array(
+            [collectors for _, collectors in values], dtype='<u2')
+        sections['visibility_peers'] = np.array(
+            [sum(origins.values()) for origins, _ in values], dtype='<u4')
+        return cls(sections)
+
+    @classmethod
+    def from_rtree(cls, rtree: radix.Radix) -> 'PrefixTable':
+        """Build a table from a radix tree. Trees of merged RIBs, whose
+        nodes contain 'origins' and 'collectors', keep their origin
+        sets."""
+        nodes = rtree.nodes()
+        if nodes and 'collectors' in nodes[0].data:
+            return cls.from_origin_sets((node.prefix,
+                                         node.data['origins'],
+                                         node.data['collectors'])
+                                        for node in nodes)
+        return cls.from_entries((node.prefix, node.data['as'])
+                                for node in nodes)
+
+    @classmethod
+    def load(cls, file: str) -> 'PrefixTable':
+        """Memory-map the table stored in file."""
+        with open(file, 'rb') as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError(f'Not a prefix table file: {file}')
+            header_len, = HEADER_LEN.unpack(f.read(HEADER_LEN.size))
+            header = json.loads(f.read(header_len))
+            data_offset = f.tell()
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        sections = dict()
+        for name, desc in header['sections'].items():
+            dtype = np.dtype(desc['dtype'])
+            shape = tuple(desc['shape'])
+            count = int(np.prod(shape))
+            sections[name] = np.frombuffer(mm,
+                                           dtype=dtype,
+                                           count=count,
+                                           offset=data_offset + desc['offset']
+                                           ).reshape(shape)
+        return cls(sections)
+
+    def save(self, file: str) -> None:
+        header = {'sections': dict()}
+        offset = 0
+        for name, array in self.sections.items():
+            header['sections'][name] = {'dtype': array.dtype.str,
+                                        'shape': list(array.shape),
+                                        'offset': offset}
+            offset += array.nbytes
+            offset += -offset % SECTION_ALIGNMENT
+        header_bytes = json.dumps(header).encode('utf-8')
+        # Pad the header so that the data starts aligned.
+        header_bytes += b' ' * (-(len(MAGIC) + HEADER_LEN.size
+                                  + len(header_bytes)) % SECTION_ALIGNMENT)
+        with open(file, 'wb') as f:
+            f.write(MAGIC)
+            f.write(HEADER_LEN.pack(len(header_bytes)))
+            f.write(header_bytes)
+            data_start = f.tell()
+            for name, array in self.sections.items():
+                f.seek(data_start + header['sections'][name]['offset'])
+                f.write(np.ascontiguousarray(array).tobytes())
+
+    def __len__(self) -> int:
+        return len(self.v4_origin) + len(self.v6_origin)
+
+    def get_set_members(self, idx: int) -> tuple:
+        """Return the AS_SET members of the entry at idx (empty if the
+        origin is not an AS_SET)."""
+        set_pos = np.searchsorted(self.set_index, idx)
+        if set_pos >= len(self.set_index) or self.set_index[set_pos] != idx:
+            return tuple()
+        start = self.set_offsets[set_pos]
+        end = self.set_offsets[set_pos + 1]
+        return tuple(self.set_members[start:end].tolist())
+
+    @property
+    def has_origin_sets(self) -> bool:
+        return self.origin_offsets is not None
+
+    def get_origin_peers(self, idx: int) -> dict:
+        """Return a map of each origin of the entry at idx to the number
+        of peers that announced it. Empty if the table has no origin
+        sets."""
+        if not self.has_origin_sets:
+            return dict()
+        start = self.origin_offsets[idx]
+        end = self.origin_offsets[idx + 1]
+        return dict(zip(self.origin_members[start:end].tolist(),
+                        self.origin_peers[start:end].tolist()))
+
+    def get_visibility(self, idx: int) -> Tuple[int, int]:
+        """Return the number of collectors and peers that saw the entry
+        at idx, or (0, 0) if the table has no origin sets."""
+        if not self.has_origin_sets:
+            return 0, 0
+        return (int(self.visibility_collectors[idx]),
+                int(self.visibility_peers[idx]))
+
+    def get_set_origins(self) -> dict:
+        """Return a map of entry index to origin in bgpdump notation for
+        all entries whose origin is an AS_SET."""
+        members = self.set_members.tolist()
+        offsets = self.set_offsets.tolist()
+        return {idx: '{' + ','.join(map(str, members[start:end])) + '}'
+                for idx, start, end in zip(self.set_index.tolist(),
+                                           offsets[:-1],
+                                           offsets[1:])}
+
+    def get_origin(self, idx: int) -> str:
+        """Return the origin of the entry at idx in bgpdump notation."""
+        v4_count = len(self.v4_origin)
+        if idx < v4_count:
+            origin = int(self.v4_origin[idx])
+        else:
+            origin = int(self.v6_origin[idx - v4_count])
+        if origin != SET_ORIGIN:
+            return str(origin)
+        members = self.get_set_members(idx)
+        if not members:
+            return str()
+        return '{' + ','.join(map(str, members)) + '}'
+
+    def get_prefix(self, idx: int) -> str:
+        """Return the prefix of the entry at idx."""
+        v4_count = len(self.v4_origin)
+        if idx < v4_count:
+            network = int(self.v4_network[idx])
+            address = socket.inet_ntoa(network.to_bytes(4, 'big'))
+            return f'{address}/{self.v4_length[idx]}'
+        hi, lo = self.v6_network[idx - v4_count].tolist()
+        address = socket.inet_ntop(socket.AF_INET6, struct.pack('!QQ', hi, lo))
+        return f'{address}/{self.v6_length[idx - v4_count]}'
+
+    def __iter__(self) -> Iterator[PrefixNode]:
+        set_origins = self.get_set_origins()
+
+        def make_origin(idx: int, origin: int) -> str:
+            if origin != SET_ORIGIN:
+                return str(origin)
+            return set_origins.get(idx, str())
+
+        idx = 0
+        for network, prefixlen, origin in zip(self.v4_network.tolist(),
+                                              self.v4_length.tolist(),
+                                              self.v4_origin.tolist()):
+            address = socket.inet_ntoa(network.to_bytes(4, 'big'))
+            yield PrefixNode(f'{address}/{prefixlen}', address, prefixlen,
+                             socket.AF_INET, {'as': make_origin(idx, origin)})
+            idx += 1
+        for (hi, lo), prefixlen, origin in zip(self.v6_network.tolist(),
+                                               self.v6_length.tolist(),
+                                               self.v6_origin.tolist()):
+            address = socket.inet_ntop(socket.AF_INET6,
+                                       struct.pack('!QQ', hi, lo))
+            yield PrefixNode(f'{address}/{prefixlen}', address, prefixlen,
+                             socket.AF_INET6, {'as': make_origin(idx, origin)})
+            idx += 1
+
+    def nodes(self) -> list:
+        return list(self)
+
+    @property
+    def rtree(self) -> radix.Radix:
+        """Radix tree of the table, built on first access."""
+        if self._rtree is None:
+            logging.info(f'Building radix tree from {len(self)} prefixes')
+            rtree = radix.Radix()
+            for node in self:
+                rtree.add(node.prefix).data['as'] = node.data['as']
+            self._rtree = rtree
+        return self._rtree
+
+    def search_best(self, address: str):
+        return self.rtree.search_best(address)
+
+    @property
+    def v4_intervals(self) -> Tuple[np.ndarray, np.ndarray]:
+        """IPv4 lookup intervals (see make_intervals), built on first
+        access."""
+        if self._v4_intervals is None:
+            self._v4_intervals = make_intervals(self.v4_network.tolist(),
+                                                self.v4_length.tolist(),
+                                                32)
+        return self._v4_intervals
+
+    @property
+    def v6_intervals(self) -> Tuple[np.ndarray, np.ndarray]:
+        """IPv6 lookup intervals at a resolution of V6_LOOKUP_BITS,
+        built on first access."""
+        if self._v6_intervals is None:
+            self._v6_intervals = make_intervals(self.v6_network[:, 0].tolist(),
+                                                self.v6_length.tolist(),
+                                                V6_LOOKUP_BITS,
+                                                len(self.v4_origin))
+        return self._v6_intervals
+
+    @staticmethod
+    def search_intervals(intervals: Tuple[np.ndarray, np.ndarray],
+                         values: np.ndarray) -> np.ndarray:
+        starts, indices = intervals
+        # Searching sorted values is much more cache friendly.
+        order = np.argsort(values)
+        pos = np.empty(len(values), dtype=np.int64)
+        pos[order] = np.searchsorted(starts, values[order], side='right') - 1
+        return indices[pos]
+
+    def lookup_v4(self, addresses: np.ndarray) -> np.ndarray:
+        """Return the entry index of the longest matching prefix for
+        each IPv4 address given as integer, or NO_MATCH."""
+        return self.search_intervals(self.v4_intervals,
+                                     addresses.astype(np.uint64, copy=False))
+
+    def lookup_v6(self, addresses: np.ndarray) -> np.ndarray:
+        """Return the entry index of the longest matching prefix for
+        each IPv6 address given as the integer of its upper 64 bits, or
+        NO_MATCH."""
+        return self.search_intervals(self.v6_intervals,
+                                     addresses.astype(np.uint64, copy=False))
+
+    def lookup(self, addresses: Sequence[str]) -> np.ndarray:
+        """Return the entry index of the longest matching prefix for
+        each address, or NO_MATCH if there is none or the address is
+        invalid."""
+        ret = np.full(len(addresses), NO_MATCH, dtype=np.int64)
+        v4_pos, v4_values, v6_pos, v6_values = encode_addresses(addresses)
+        if len(v4_pos):
+            ret[v4_pos] = self.lookup_v4(v4_values)
+        if len(v6_pos):
+            ret[v6_pos] = self.lookup_v6(v6_values)
+        return ret
+
+    def get_origins(self, indices: np.ndarray) -> list:
+        """Return the origins of the entries at indices in bgpdump
+        notation. NO_MATCH is mapped to None."""
+        if not len(self):
+            return [None] * len(indices)
+        origins = np.concatenate((self.v4_origin, self.v6_origin))
+        ret = list()
+        for idx, origin in zip(indices.tolist(),
+                               origins[np.maximum(indices, 0)].tolist()):
+            if idx == NO_MATCH:
+                ret.append(None)
+            elif origin != SET_ORIGIN:
+                ret.append(str(origin))
+            else:
+                ret.append(self.get_origin(idx))
+        return ret
+
+
+class PrefixTableFileHandler:
+    def __init__(self,
+                 input_: str,
+                 output: str = None,
+                 output_name_suffix: str = None):
+        self.input = input_
+        if output:
+            self.output = output
+        else:
+            output_name = get_file_name(self.input, INPUT_SUFFIX)
+            if output_name_suffix:
+                output_name += output_name_suffix
+            self.output = OUTPUT_DIR + output_name + OUTPUT_SUFFIX
+
+    def read(self) -> PrefixTable:
+        logging.info(f'Reading file: {self.input}')
+        return PrefixTable.load(self.input)
+
+    def write(self,
+              lines: Iterable,
+              header: Sequence = None,
+              formats: Sequence[str] = None,
+              column_types: dict = None) -> None:
+        """Write the lines to the output in the specified formats (CSV by
+        default). See write_output."""
+        line_count = write_output(self.output, lines, header, formats,
+                                  column_types)
+        logging.info(f'Wrote {line_count} lines to file: {self.output}')
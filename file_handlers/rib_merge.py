@@ -0,0 +1,62 @@
+import heapq
+import logging
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+from typing import Iterable, Iterator, List, Tuple
+
+import msgpack
+
+from file_handlers.mrt import group_by_prefix
+from file_handlers.prefix_table import get_prefix_key
+
+# The RIB of each collector is reduced to a run: one record per prefix
+# with the number of peers per origin, sorted by get_prefix_key and
+# written to a file. Runs of multiple collectors are merged with
+# heapq.merge, so only the current record of each run is held in
+# memory while the merged view is built.
+RUN_SUFFIX = '.run.msgpack'
+WRITE_BUFFER_SIZE = 1048576
+
+
+def write_run(entries: Iterable[Tuple[str, str]], file: str) -> int:
+    """Group (prefix, origin) tuples by prefix and write them to file
+    as a run, sorted by prefix. Return the number of prefixes."""
+    prefixes = dict()
+    for prefix, origins in group_by_prefix(entries):
+        key = get_prefix_key(prefix)
+        if key in prefixes:
+            # Prefix was not listed consecutively.
+            prefixes[key][1].update(origins)
+        else:
+            prefixes[key] = (prefix, origins)
+    packer = msgpack.Packer()
+    with open(file, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+        for key in sorted(prefixes):
+            prefix, origins = prefixes[key]
+            f.write(packer.pack(key + (prefix, dict(origins))))
+    logging.info(f'Wrote {len(prefixes)} prefixes to run {file}')
+    return len(prefixes)
+
+
+def read_run(file: str) -> Iterator[Tuple[tuple, str, dict]]:
+    """Yield (key, prefix, origins) tuples from a run in sorted order."""
+    with open(file, 'rb') as f:
+        for record in msgpack.Unpacker(f, use_list=False):
+            yield record[:4], record[4], record[5]
+
+
+def merge_runs(files: List[str]) -> Iterator[Tuple[str, Counter, int]]:
+    """Merge the runs of multiple collectors and yield (prefix, origins,
+    collectors) tuples sorted by prefix, where origins counts the peers
+    per origin across all collectors and collectors is the number of
+    runs that contain the prefix."""
+    merged = heapq.merge(*[read_run(file) for file in files],
+                         key=itemgetter(0))
+    for _, group in groupby(merged, key=itemgetter(0)):
+        origins = Counter()
+        collectors = 0
+        for _, prefix, run_origins in group:
+            origins.update(run_origins)
+            collectors += 1
+        yield prefix, origins, collectors
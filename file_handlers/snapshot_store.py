@@ -0,0 +1,87 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+
+# Snapshot payloads are stored once per content hash in this
+# subdirectory of the snapshot directory. Dated snapshots and latest-*
+# files are symlinks into it.
+OBJECT_DIR = 'objects'
+HASH_CHUNK_SIZE = 1048576
+# Dated snapshot names start with a date, e.g., 20210416-rib.pickle.bz2.
+DATED_NAME = re.compile(r'^\d{8}(-.*)$')
+OBJECT_NAME = re.compile(r'^([0-9a-f]{64})-')
+
+
+def hash_file(file: str) -> str:
+    """Return the SHA-256 hex digest of the content of file."""
+    h = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def get_snapshot_hash(file: str) -> str:
+    """Return the content hash of the snapshot file.
+
+    Symlinks are followed. The hash of files in the object store is
+    taken from their name, other files are hashed."""
+    target = os.path.realpath(file)
+    m = OBJECT_NAME.match(os.path.basename(target))
+    if m and os.path.basename(os.path.dirname(target)) == OBJECT_DIR:
+        return m.group(1)
+    return hash_file(target)
+
+
+def replace_symlink(src: str, dst: str) -> None:
+    """Atomically create or replace the symlink dst pointing to src."""
+    tmp_dst = dst + '.tmp'
+    if os.path.lexists(tmp_dst):
+        os.remove(tmp_dst)
+    os.symlink(src, tmp_dst)
+    os.replace(tmp_dst, dst)
+
+
+def get_object_name(digest: str, output_file: str) -> str:
+    """Return the name of the object for output_file. The object keeps
+    the suffix of the snapshot name so the format can still be
+    determined from it."""
+    name = os.path.basename(output_file)
+    m = DATED_NAME.match(name)
+    suffix = m.group(1) if m else '-' + name
+    return digest + suffix
+
+
+def commit_snapshot(file: str,
+                    output_file: str,
+                    latest_symlink: str = None) -> bool:
+    """Move file into the object store and create output_file as a
+    reference to it. If latest_symlink is specified, point it to
+    output_file.
+
+    If an object with the same content exists already, file is removed
+    instead, so identical snapshots only use disk space once. Return
+    True if the content differs from the previous latest snapshot."""
+    output_dir = os.path.dirname(output_file)
+    object_dir = os.path.join(output_dir, OBJECT_DIR)
+    os.makedirs(object_dir, exist_ok=True)
+    digest = hash_file(file)
+    object_file = os.path.join(object_dir,
+                               get_object_name(digest, output_file))
+    if os.path.exists(object_file):
+        logging.info(f'Snapshot content already stored as {object_file}')
+        os.remove(file)
+    else:
+        # file might be on a different file system, e.g., in /tmp.
+        shutil.move(file, object_file)
+    changed = True
+    if latest_symlink and os.path.exists(latest_symlink):
+        changed = get_snapshot_hash(latest_symlink) != digest
+    replace_symlink(os.path.relpath(object_file, output_dir), output_file)
+    if latest_symlink:
+        replace_symlink(os.path.basename(output_file), latest_symlink)
+    if not changed:
+        logging.info('Snapshot did not change since the last download.')
+    return changed
@@ -0,0 +1,175 @@
+import argparse
+import csv
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, List, Tuple
+
+from file_handlers.common import OUTPUT_DELIMITER, write_csv
+from file_handlers.compression import strip_codec_suffix
+
+DATE_FMT = '%Y%m%d'
+OUTPUT_DIR = 'parsed/'
+OUTPUT_PREFIX = 'series'
+OUTPUT_SUFFIX = '.csv'
+# Snapshot names start with the date or with latest.
+SNAPSHOT_NAME = re.compile(r'^(\d{8}|latest)(-.*)$')
+
+
+def parse_date(date: str) -> str:
+    """Normalize YYYYMMDD or YYYY-MM-DD to YYYYMMDD. Raise a ValueError
+    if the date is invalid."""
+    for fmt in (DATE_FMT, '%Y-%m-%d'):
+        try:
+            return datetime.strptime(date, fmt).strftime(DATE_FMT)
+        except ValueError:
+            continue
+    raise ValueError(f'Invalid date: {date}')
+
+
+def add_range_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--from', dest='from_date',
+                        help='process all snapshots from this date '
+                             '(YYYYMMDD) on instead of a single input and '
+                             'write a single time series')
+    parser.add_argument('--to', dest='to_date',
+                        help='last date of the time series. Defaults to '
+                             'today')
+    parser.add_argument('-w', '--workers', type=int,
+                        help='number of processes used for the time series. '
+                             'Defaults to the number of CPUs')
+
+
+def get_series_name(input_: str, suffix: str) -> str:
+    """Return the name of input without the date or latest prefix, the
+    codec suffix, and suffix, e.g., -probes for
+    raw/atlas/latest-probes.msgpack.bz2."""
+    basename = strip_codec_suffix(os.path.basename(input_))
+    m = SNAPSHOT_NAME.match(basename)
+    if not m or not basename.endswith(suffix):
+        raise ValueError(f'Not a snapshot name: {input_}')
+    return m.group(2)[:len(m.group(2)) - len(suffix)]
+
+
+def get_series_output(input_: str,
+                      suffix: str,
+                      output_name_suffix: str = None) -> str:
+    """Return the default time series output for snapshots like input_,
+    e.g., parsed/series-probes-by-as.csv."""
+    name = OUTPUT_PREFIX + get_series_name(input_, suffix)
+    if output_name_suffix:
+        name += output_name_suffix
+    return OUTPUT_DIR + name + OUTPUT_SUFFIX
+
+
+def find_snapshots(input_: str,
+                   suffix: str,
+                   from_date: str,
+                   to_date: str) -> List[Tuple[str, str]]:
+    """Return the dated snapshots in the directory of input_ with the
+    same name as input_ as a sorted list of (date, file) tuples. Only
+    snapshots between from_date and to_date (inclusive) are returned. If
+    multiple codecs exist for a date, the newest file is used."""
+    input_dir = os.path.dirname(input_) or '.'
+    name = get_series_name(input_, suffix) + suffix
+    snapshots = dict()
+    for entry in os.scandir(input_dir):
+        basename = strip_codec_suffix(entry.name)
+        m = SNAPSHOT_NAME.match(basename)
+        if not m or m.group(2) != name or m.group(1) == 'latest':
+            continue
+        date = m.group(1)
+        if date < from_date or date > to_date:
+            continue
+        try:
+            mtime = os.path.getmtime(entry.path)
+        except OSError:
+            # Dangling symlink
+            continue
+        if date not in snapshots or mtime > snapshots[date][1]:
+            snapshots[date] = (entry.path, mtime)
+    return [(date, file) for date, (file, _) in sorted(snapshots.items())]
+
+
+def read_series(output: str) -> Tuple[list, dict]:
+    """Return the header and a map of date to rows of an existing time
+    series. The fields are not converted."""
+    if not os.path.exists(output):
+        return None, dict()
+    ret = dict()
+    with open(output, 'r', newline='') as f:
+        reader = csv.reader(f, delimiter=OUTPUT_DELIMITER)
+        header = next(reader, None)
+        for row in reader:
+            ret.setdefault(row[0], list()).append(row)
+    return header, ret
+
+
+def process_range(input_: str,
+                  suffix: str,
+                  from_date: str,
+                  to_date: str,
+                  output: str,
+                  process: Callable[[str], list],
+                  workers: int = None) -> None:
+    """Compute a time series by applying process to all snapshots of
+    input_ between from_date and to_date and write it to output.
+
+    process is called with a snapshot file and returns the output lines
+    of the parser, starting with the header. It is run in a pool of
+    processes, so it must be picklable. The result is written in long
+    format, i.e., each line of the parser prefixed with the date. Dates
+    that are already present in output are not computed again.
+
+    Snapshots that fail to process or whose header does not match are
+    logged and skipped, so they are retried by the next run. The other
+    dates are written anyway.
+    """
+    from_date = parse_date(from_date)
+    to_date = parse_date(to_date) if to_date \
+        else datetime.now(tz=timezone.utc).strftime(DATE_FMT)
+    snapshots = find_snapshots(input_, suffix, from_date, to_date)
+    logging.info(f'Found {len(snapshots)} snapshots between {from_date} and '
+                 f'{to_date}')
+    header, series = read_series(output)
+    missing = [(date, file) for date, file in snapshots if date not in series]
+    if not missing:
+        logging.info(f'Time series {output} is up to date.')
+        return
+    logging.info(f'Processing {len(missing)} snapshots')
+    updated = 0
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [(date, file, executor.submit(process, file))
+                   for date, file in missing]
+        for date, file, future in futures:
+            try:
+                lines = future.result()
+            except Exception as e:
+                logging.error(f'Failed to process {file}: '
+                              f'{type(e).__name__}: {e}')
+                failed += 1
+                continue
+            if not lines:
+                logging.warning(f'No data for {date} ({file})')
+                continue
+            date_header = ['date'] + list(map(str, lines[0]))
+            if header is None:
+                header = date_header
+            elif header != date_header:
+                logging.error(f'Header of {file} does not match existing '
+                              f'output: {date_header} != {header}')
+                failed += 1
+                continue
+            series[date] = [[date] + list(line) for line in lines[1:]]
+            updated += 1
+    if failed:
+        logging.warning(f'Skipped {failed} of {len(missing)} snapshots')
+    if not updated:
+        return
+    logging.info(f'Writing {len(series)} dates to file: {output}')
+    write_csv(output,
+              (row for date in sorted(series) for row in series[date]),
+              header)
@@ -1,13 +1,14 @@
-import json.decoder
+import argparse
 import logging
 import sys
 from datetime import datetime, timezone
-from typing import Tuple
 
 import requests
 
+from clients.atlas import API_BASE, MAX_WORKERS, iter_pages, iter_queries
+from clients.session import make_session
+
 
-API_BASE = 'https://atlas.ripe.net/api/v2/'
 OUTPUT_DIR = 'parsed/'
 OUTPUT_FMT = '%Y%m%d'
 OUTPUT_DELIMITER = ','
@@ -19,33 +20,6 @@ PAGE_SIZE = 500
 CHUNK_SIZE = 499
 
 
-def process_response(response: requests.Response) -> Tuple[str, list]:
-    if response.status_code != requests.codes.ok:
-        logging.error(f'Request to {response.url} failed with status: '
-                      f'{response.status_code}')
-        return str(), list()
-    try:
-        data = response.json()
-    except json.decoder.JSONDecodeError as e:
-        logging.error(f'Decoding JSON reply from {response.url} failed with '
-                      f'exception: {e}')
-        return str(), list()
-    if 'next' not in data or 'results' not in data:
-        logging.error('"next" or "results" key missing from response data.')
-        return str(), list()
-    next_url = data['next']
-    if not next_url:
-        logging.info('Reached end of list')
-        next_url = str()
-    return next_url, data['results']
-
-
-def execute_query(url: str) -> Tuple[str, list]:
-    logging.info(f'Querying {url}')
-    r = requests.get(url)
-    return process_response(r)
-
-
 def write_data(data: list, name: str) -> None:
     if not data:
         return
@@ -64,17 +38,29 @@ def main() -> None:
     logging.basicConfig(
         format=log_format,
         level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--api-base', default=API_BASE,
+                        help='query this Atlas API instead of the default')
+    parser.add_argument('-w', '--workers', type=int, default=MAX_WORKERS,
+                        help='maximum number of concurrent requests')
+    args = parser.parse_args()
+    session = make_session(args.workers)
+
     # Get anchor measurements. These only include the type and if the
     # measurement is a mesh or probe measurement.
-    endpoint = API_BASE + 'anchor-measurements/'
+    endpoint = args.api_base + 'anchor-measurements/'
     logging.info(f'Querying Atlas API {endpoint}')
-    params = {'format': 'json', 'page_size': PAGE_SIZE}
-    r = requests.get(endpoint, params)
-    next_url, anchor_msm_data = process_response(r)
-    while next_url:
-        next_url, next_data = execute_query(next_url)
-        anchor_msm_data += next_data
-        logging.info(f'Added {len(next_data)} measurements. Total: {len(anchor_msm_data)}')
+    params = {'format': 'json'}
+    anchor_msm_data = list()
+    try:
+        for page in iter_pages(session, endpoint, params, PAGE_SIZE,
+                               args.workers):
+            anchor_msm_data += page
+            logging.info(f'Added {len(page)} measurements. Total: '
+                         f'{len(anchor_msm_data)}')
+    except requests.RequestException as e:
+        logging.error(f'Querying anchor measurements failed: {e}')
+        sys.exit(1)
     # Keep only traceroute measurements.
     tr_measurements = [entry
                        for entry in anchor_msm_data if entry['type'] == 'traceroute']
@@ -89,21 +75,23 @@ def main() -> None:
 
     # Get measurement details to distinguish between IPv4 and IPv6 measurements.
     params = {'format': 'json', 'page_size': PAGE_SIZE}
-    endpoint = API_BASE + 'measurements/'
+    endpoint = args.api_base + 'measurements/'
     logging.info(f'Querying Atlas API {endpoint}')
+    queries = [(endpoint,
+                dict(params, id__in=','.join(msm_ids[chunk_start:
+                                                     chunk_start + CHUNK_SIZE])))
+               for chunk_start in range(0, len(msm_ids), CHUNK_SIZE)]
     msm_data = list()
-    chunks = len(msm_ids) // CHUNK_SIZE
-    if len(msm_ids) % CHUNK_SIZE:
-        chunks += 1
-    for chunk_no in range(chunks):
-        msm_id_chunk = msm_ids[chunk_no * CHUNK_SIZE: (chunk_no + 1) * CHUNK_SIZE]
-        params['id__in'] = ','.join(msm_id_chunk)
-        r = requests.get(endpoint, params)
-        next_url, next_data = process_response(r)
-        if next_url:
-            logging.warning('Result did not fit on one page.')
-        msm_data += next_data
-        logging.info(f'Added {len(next_data)} measurements. Total: {len(msm_data)}')
+    try:
+        for reply in iter_queries(session, queries, args.workers):
+            if reply.get('next'):
+                logging.warning('Result did not fit on one page.')
+            msm_data += reply['results']
+            logging.info(f'Added {len(reply["results"])} measurements. '
+                         f'Total: {len(msm_data)}')
+    except (requests.RequestException, KeyError) as e:
+        logging.error(f'Querying measurements failed: {e}')
+        sys.exit(1)
     ipv4_msm_ids = {entry['id'] for entry in msm_data if entry['af'] == 4}
     ipv6_msm_ids = {entry['id'] for entry in msm_data if entry['af'] == 6}
     write_data(list(mesh_msm_ids.intersection(ipv4_msm_ids)), 'mesh-ipv4-msm')
@@ -1,27 +1,183 @@
 import argparse
 import logging
-from collections import defaultdict
+from functools import partial
+from typing import Tuple, Union
 
+import numpy as np
 import radix
 
+from file_handlers.common import add_output_format_argument, get_outputs
+from file_handlers.compression import strip_codec_suffix
+from file_handlers.parse_cache import ParseCache
+from file_handlers.pickle import INPUT_SUFFIX as PICKLE_SUFFIX
 from file_handlers.pickle import PickleFileHandler
+from file_handlers.prefix_table import INPUT_SUFFIX as TABLE_SUFFIX
+from file_handlers.prefix_table import (SET_ORIGIN, PrefixTable,
+                                        PrefixTableFileHandler)
+from file_handlers.time_series import (add_range_arguments, get_series_output,
+                                       process_range)
 
 DEFAULT_INPUT = 'raw/routeviews/latest-rib.pickle.bz2'
 OUTPUT_SUFFIX = '-as-prefixes'
+COLUMN_TYPES = {'as': 'uint32', 'pfx_count': 'int64', 'v4_slash24': 'float64',
+                'v6_slash48': 'float64'}
+# Address space is reported in /24 (IPv4) and /48 (IPv6) equivalents.
+V4_UNIT_LEN = 24
+V6_UNIT_LEN = 48
+ALL_ONES = np.uint64(2 ** 64 - 1)
 
 
-def count_prefixes(data: radix.Radix) -> list:
-    logging.info(f'Counting {len(data.nodes())} nodes...')
-    as_map = defaultdict(int)
-    for rnode in data:
-        asn = rnode.data['as']
-        if asn.startswith('{'):
-            for asn_member in asn.strip('{}').split(','):
-                as_map[asn_member] += 1
-        else:
-            as_map[rnode.data['as']] += 1
-    return [['as', 'pfx_count']] \
-           + sorted(as_map.items(), key=lambda t: t[1], reverse=True)
+def get_origin_rows(table: PrefixTable) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (asn, entry index) arrays with one row per origin AS of
+    each table entry. AS_SET origins are expanded to one row per member,
+    entries without origin are dropped."""
+    origins = np.concatenate((table.v4_origin, table.v6_origin))
+    entry_idx = np.flatnonzero(origins != SET_ORIGIN)
+    set_sizes = np.diff(table.set_offsets.astype(np.int64))
+    asns = np.concatenate((origins[entry_idx],
+                           table.set_members)).astype(np.uint32)
+    entry_idx = np.concatenate((entry_idx,
+                                np.repeat(table.set_index.astype(np.int64),
+                                          set_sizes)))
+    return asns, entry_idx
+
+
+def get_ranks(hi: np.ndarray, lo: np.ndarray) -> np.ndarray:
+    """Return the dense rank of each (hi, lo) pair."""
+    order = np.lexsort((lo, hi))
+    hi_sorted = hi[order]
+    lo_sorted = lo[order]
+    new_value = np.ones(len(order), dtype=bool)
+    new_value[1:] = (hi_sorted[1:] != hi_sorted[:-1]) \
+        | (lo_sorted[1:] != lo_sorted[:-1])
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.cumsum(new_value) - 1
+    return ranks
+
+
+def get_coverage(asns: np.ndarray,
+                 hi: np.ndarray,
+                 lo: np.ndarray,
+                 hi_mask: np.ndarray,
+                 lo_mask: np.ndarray,
+                 weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sum up the weights of the prefixes of each AS, ignoring prefixes
+    that are covered by a less-specific prefix of the same AS.
+
+    Prefixes are given as (hi, lo) network address pairs and the
+    corresponding host masks. Since prefixes either nest or are
+    disjoint, a prefix is covered iff its first address is not after the
+    last address of any preceding prefix of the same AS in address
+    order. The running maximum over last addresses is computed per AS by
+    mapping addresses to their ranks and offsetting each AS into its own
+    range.
+
+    Return the unique ASes and their coverage.
+    """
+    if len(asns) == 0:
+        return np.empty(0, dtype=np.uint32), np.empty(0)
+    hi_last = hi | hi_mask
+    lo_last = lo | lo_mask
+    order = np.lexsort((lo_mask ^ ALL_ONES, hi_mask ^ ALL_ONES, lo, hi, asns))
+    asns = asns[order]
+    ranks = get_ranks(np.concatenate((hi[order], hi_last[order])),
+                      np.concatenate((lo[order], lo_last[order])))
+    row_count = len(order)
+    new_as = np.ones(row_count, dtype=bool)
+    new_as[1:] = asns[1:] != asns[:-1]
+    group = np.cumsum(new_as) - 1
+    offset = group * (2 * row_count + 1)
+    first = ranks[:row_count] + offset
+    last = ranks[row_count:] + offset
+    covered = np.zeros(row_count, dtype=bool)
+    covered[1:] = first[1:] <= np.maximum.accumulate(last)[:-1]
+    coverage = np.bincount(group, weights=np.where(covered, 0, weights[order]))
+    return asns[new_as], coverage
+
+
+def get_v4_coverage(table: PrefixTable,
+                    asns: np.ndarray,
+                    entry_idx: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    v4_rows = entry_idx < len(table.v4_origin)
+    idx = entry_idx[v4_rows]
+    prefixlen = table.v4_length[idx].astype(np.uint64)
+    hi = table.v4_network[idx].astype(np.uint64)
+    hi_mask = (np.uint64(1) << (np.uint64(32) - prefixlen)) - np.uint64(1)
+    zeros = np.zeros(len(idx), dtype=np.uint64)
+    weights = np.exp2(V4_UNIT_LEN - prefixlen.astype(np.float64))
+    return get_coverage(asns[v4_rows], hi, zeros, hi_mask, zeros, weights)
+
+
+def get_v6_coverage(table: PrefixTable,
+                    asns: np.ndarray,
+                    entry_idx: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    v6_rows = entry_idx >= len(table.v4_origin)
+    idx = entry_idx[v6_rows] - len(table.v4_origin)
+    prefixlen = table.v6_length[idx].astype(np.int64)
+    hi = table.v6_network[idx, 0].astype(np.uint64)
+    lo = table.v6_network[idx, 1].astype(np.uint64)
+    # Shifting by 64 bits is undefined, so handle these cases
+    # separately.
+    hi_shift = np.clip(64 - prefixlen, 0, 63).astype(np.uint64)
+    hi_mask = np.where(prefixlen == 0, ALL_ONES,
+                       (np.uint64(1) << hi_shift) - np.uint64(1))
+    lo_shift = np.clip(128 - prefixlen, 0, 63).astype(np.uint64)
+    lo_mask = np.where(prefixlen <= 64, ALL_ONES,
+                       (np.uint64(1) << lo_shift) - np.uint64(1))
+    weights = np.exp2(V6_UNIT_LEN - prefixlen.astype(np.float64))
+    return get_coverage(asns[v6_rows], hi, lo, hi_mask, lo_mask, weights)
+
+
+def format_coverage(value: float) -> str:
+    if value.is_integer():
+        return str(int(value))
+    return str(round(value, 3))
+
+
+def count_prefixes(data: Union[radix.Radix, PrefixTable],
+                   coverage: bool = False) -> list:
+    """Count the prefixes originated by each AS. Prefixes with an AS_SET
+    origin are counted for each member.
+
+    If coverage is set, also compute the address space covered by each
+    AS in /24 (IPv4) and /48 (IPv6) equivalents. Address space covered
+    by multiple prefixes of the same AS is only counted once.
+    """
+    if isinstance(data, radix.Radix):
+        data = PrefixTable.from_rtree(data)
+    logging.info(f'Counting {len(data)} prefixes...')
+    asns, entry_idx = get_origin_rows(data)
+    unique_asns, counts = np.unique(asns, return_counts=True)
+    # Order by descending count and keep ties in the order in which the
+    # ASes first appear in the table.
+    _, first_seen = np.unique(asns[np.argsort(entry_idx, kind='stable')],
+                              return_index=True)
+    order = np.lexsort((first_seen, -counts))
+    if not coverage:
+        return [['as', 'pfx_count']] \
+               + list(zip(unique_asns[order].tolist(), counts[order].tolist()))
+    as_idx = {asn: idx for idx, asn in enumerate(unique_asns.tolist())}
+    ret = [['as', 'pfx_count', 'v4_slash24', 'v6_slash48']]
+    for asn, count in zip(unique_asns[order].tolist(),
+                          counts[order].tolist()):
+        ret.append([asn, count, 0, 0])
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    for column, get_family_coverage in ((2, get_v4_coverage),
+                                        (3, get_v6_coverage)):
+        family_asns, family_coverage = get_family_coverage(data, asns,
+                                                           entry_idx)
+        for asn, value in zip(family_asns.tolist(),
+                              family_coverage.tolist()):
+            ret[rank[as_idx[asn]] + 1][column] = format_coverage(value)
+    return ret
+
+
+def process_snapshot(file: str, coverage: bool = False) -> list:
+    """Return the prefix counts of a single snapshot."""
+    if strip_codec_suffix(file).endswith(TABLE_SUFFIX):
+        return count_prefixes(PrefixTable.load(file), coverage)
+    return count_prefixes(PickleFileHandler(file).read(), coverage)
 
 
 def main() -> None:
@@ -31,16 +187,44 @@ def main() -> None:
         level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
     parser = argparse.ArgumentParser()
     parser.add_argument('-i', '--input',
-                        help='Use this raw dump instead of latest',
+                        help='Use this raw dump instead of latest. Can be a '
+                             'pickled radix tree or a prefix table',
                         default=DEFAULT_INPUT)
     parser.add_argument('-o', '--output',
                         help='Manually specify output file')
+    parser.add_argument('--coverage', action='store_true',
+                        help='also output the address space covered by '
+                             'each AS in /24 and /48 equivalents')
+    parser.add_argument('--force', action='store_true',
+                        help='recompute the output even if it is up to date')
+    add_output_format_argument(parser)
+    add_range_arguments(parser)
     args = parser.parse_args()
-    file = PickleFileHandler(input_=args.input, output=args.output,
-                             output_name_suffix=OUTPUT_SUFFIX)
+    if args.from_date:
+        suffix = TABLE_SUFFIX if args.input.endswith(TABLE_SUFFIX) \
+            else PICKLE_SUFFIX
+        output = args.output \
+            or get_series_output(args.input, suffix, OUTPUT_SUFFIX)
+        process_range(args.input, suffix, args.from_date, args.to_date, output,
+                      partial(process_snapshot, coverage=args.coverage),
+                      args.workers)
+        return
+    if args.input.endswith(TABLE_SUFFIX):
+        file = PrefixTableFileHandler(input_=args.input, output=args.output,
+                                      output_name_suffix=OUTPUT_SUFFIX)
+    else:
+        file = PickleFileHandler(input_=args.input, output=args.output,
+                                 output_name_suffix=OUTPUT_SUFFIX)
+    cache = ParseCache(get_outputs(file.output, args.output_format),
+                       [file.input],
+                       {'coverage': args.coverage,
+                        'formats': args.output_format})
+    if cache.check(args.force):
+        return
     data = file.read()
-    lines = count_prefixes(data)
-    file.write(lines)
+    lines = count_prefixes(data, args.coverage)
+    file.write(lines, formats=args.output_format, column_types=COLUMN_TYPES)
+    cache.record()
 
 
 if __name__ == '__main__':
@@ -2,7 +2,7 @@ import argparse
 import logging
 import sys
 from typing import Tuple
-from file_handlers.common import get_file_name
+from file_handlers.common import get_file_name, write_csv
 
 
 DEFAULT_INPUT_PATH = 'raw/thyme/'
@@ -10,7 +10,6 @@ DEFAULT_DATE = 'latest'
 INPUT_FILE_FORMAT = '{date}-bgp-analysis-{location}.txt'
 OUTPUT_DIR = 'parsed/'
 OUTPUT_SUFFIX = '.csv'
-OUTPUT_DELIMITER = ','
 
 LOCATIONS = ('au', 'current', 'hk', 'london', 'singapore')
 TOTAL_NUM_AS_LINE = 'Total ASes present in the Internet Routing Table:'
@@ -95,7 +94,7 @@ def main() -> None:
                          'num-as': 0}
         header_line.append(f'{rir}_as_path_len')
         header_line.append(f'{rir}_num_as')
-    lines = [header_line]
+    lines = list()
     for location, rir_stats in stats.items():
         line = [location]
         for rir, stat_values in sorted(rir_stats.items()):
@@ -119,9 +118,7 @@ def main() -> None:
             output_date = input_date
         output_file = f'{OUTPUT_DIR}{output_date}-as-stats.csv'
 
-    with open(output_file, 'w') as f:
-        for line in lines:
-            f.write(OUTPUT_DELIMITER.join(map(str, line)) + '\n')
+    write_csv(output_file, lines, header_line)
 
 
 if __name__ == '__main__':
@@ -2,12 +2,17 @@ import argparse
 import logging
 import sys
 from collections import defaultdict, namedtuple
-from itertools import zip_longest
+from typing import Iterable
 
+from file_handlers.asn_ranges import ASN_HEADER, RANGE_HEADER, AsnRangeTable
 from file_handlers.bz2 import Bz2FileHandler
+from file_handlers.common import add_output_format_argument, get_outputs
+from file_handlers.parse_cache import ParseCache
 
 DEFAULT_INPUT = 'raw/nro/latest-delegated-stats.bz2'
 OUTPUT_SUFFIX = '-assigned-asns'
+COLUMN_TYPES = {'registry': 'category', 'cc': 'category', 'asn': 'uint32',
+                'start': 'uint32', 'end': 'uint32'}
 INPUT_DELIMITER = '|'
 VERSION_LINE_FIELD_COUNT = 7
 SUMMARY_LINE_FIELD_COUNT = 6
@@ -26,7 +31,12 @@ def parse_summary_line(fields: list) -> SummaryLine:
     return SummaryLine(fields[0], fields[2], int(fields[4]), fields[5])
 
 
-def get_assigned_asns(data: list) -> list:
+def get_assigned_asn_ranges(data: Iterable[str]) -> AsnRangeTable:
+    """Return a table of the assigned ASN ranges from the lines of the
+    extended delegation file.
+
+    The lines are consumed one by one and only assigned ASN records are
+    kept, so data can be a generator."""
     line_count = 0
     expected_record_counts = dict()
     record_counts = defaultdict(int)
@@ -36,8 +46,8 @@ def get_assigned_asns(data: list) -> list:
         if line.startswith('#'):
             # Comment line
             continue
-        line_split = line.strip().split('|')
         if line_count == 1:
+            line_split = line.strip().split(INPUT_DELIMITER)
             if len(line_split) != VERSION_LINE_FIELD_COUNT:
                 logging.error(f'Malformed version line: {line.strip()}')
                 continue
@@ -50,19 +60,23 @@ def get_assigned_asns(data: list) -> list:
             logging.info(f'  enddate: {parsed_line.enddate}')
             logging.info(f'UTCoffset: {parsed_line.UTCoffset}')
             logging.info('')
-        elif len(line_split) == SUMMARY_LINE_FIELD_COUNT:
+            continue
+        # Do not split extension fields since they are not used.
+        line_split = line.strip().split(INPUT_DELIMITER,
+                                        RECORD_LINE_MIN_FIELD_COUNT)
+        if len(line_split) == SUMMARY_LINE_FIELD_COUNT:
             parsed_line = parse_summary_line(line_split)
             expected_record_counts[parsed_line.type] = parsed_line.count
         elif len(line_split) >= RECORD_LINE_MIN_FIELD_COUNT:
-            parsed_line = RecordLine(*line_split[:RECORD_LINE_MIN_FIELD_COUNT])
-            record_counts[parsed_line.type] += 1
-            if parsed_line.type != 'asn' or parsed_line.status != 'assigned':
+            record_type = line_split[2]
+            record_counts[record_type] += 1
+            if record_type != 'asn' or line_split[6] != 'assigned':
                 continue
+            parsed_line = RecordLine(*line_split[:RECORD_LINE_MIN_FIELD_COUNT])
             start_asn = int(parsed_line.start)
             count = int(parsed_line.value)
-            ret += zip_longest([(parsed_line.registry, parsed_line.cc)],
-                               range(start_asn, start_asn + count),
-                               fillvalue=(parsed_line.registry, parsed_line.cc))
+            ret.append((parsed_line.registry, parsed_line.cc, start_asn,
+                        start_asn + count - 1))
     for record_type in expected_record_counts:
         if record_type not in record_counts \
                 or expected_record_counts[record_type] != record_counts[
@@ -75,15 +89,29 @@ def get_assigned_asns(data: list) -> list:
             else:
                 logging.error(
                     f'Records for {record_type} class are missing entirely.')
-    ret.sort(key=lambda t: t[1])
-    last_asn = ret[0][1]
-    for (registry, cc), asn in ret[1:]:
-        if asn == last_asn:
-            logging.error(f'AS {asn} was assigned twice?!')
-        last_asn = asn
-    ret = [(*e1, e2) for e1, e2 in ret]
-    ret.insert(0, ('registry', 'cc', 'asn'))
-    return ret
+    table = AsnRangeTable(ret)
+    for start, end in table.find_overlaps():
+        if start == end:
+            logging.error(f'AS {start} was assigned twice?!')
+        else:
+            logging.error(f'ASes {start}-{end} were assigned twice?!')
+    return table
+
+
+def get_assigned_asns(data: Iterable[str], ranges: bool = False) -> Iterable:
+    """Return the output lines (without header) with one line per
+    assigned ASN, or one line per assigned range if ranges is set. The
+    lines are generated lazily unless they need to be sorted. Return an
+    empty list if no ASNs were found."""
+    table = get_assigned_asn_ranges(data)
+    if not table:
+        logging.error('No assigned ASNs found.')
+        return list()
+    if ranges:
+        return table.iter_ranges()
+    if table.find_overlaps():
+        return sorted(table.iter_asns(), key=lambda t: t[2])
+    return table.iter_asns()
 
 
 def main() -> None:
@@ -97,13 +125,26 @@ def main() -> None:
                         default=DEFAULT_INPUT)
     parser.add_argument('-o', '--output',
                         help='Manually specify output file')
+    parser.add_argument('--ranges', action='store_true',
+                        help='write one line per assigned range instead of '
+                             'one line per ASN')
+    parser.add_argument('--force', action='store_true',
+                        help='recompute the output even if it is up to date')
+    add_output_format_argument(parser)
     args = parser.parse_args()
 
     file = Bz2FileHandler(input_=args.input, output=args.output,
                           output_name_suffix=OUTPUT_SUFFIX)
-    data = file.read()
-    lines = get_assigned_asns(data)
-    file.write(lines)
+    cache = ParseCache(get_outputs(file.output, args.output_format),
+                       [file.input],
+                       {'ranges': args.ranges, 'formats': args.output_format})
+    if cache.check(args.force):
+        return
+    lines = get_assigned_asns(file.iter_lines(), args.ranges)
+    if lines:
+        file.write(lines, RANGE_HEADER if args.ranges else ASN_HEADER,
+                   args.output_format, COLUMN_TYPES)
+        cache.record()
 
 
 if __name__ == '__main__':
@@ -2,11 +2,16 @@ import argparse
 import logging
 import sys
 
+from file_handlers.common import add_output_format_argument, get_outputs
+from file_handlers.parse_cache import ParseCache
 from file_handlers.pickle import PickleFileHandler
 
 
 DEFAULT_INPUT = 'raw/peeringdb/latest-peeringdb-ixp.pickle.bz2'
 OUTPUT_SUFFIX = '-info'
+HEADER = ('ix_id', 'name', 'name_long', 'country')
+COLUMN_TYPES = {'ix_id': 'int64', 'name': 'string', 'name_long': 'string',
+                'country': 'category'}
 
 
 def make_data_lines(ix_data: dict) -> None:
@@ -22,12 +27,10 @@ def make_data_lines(ix_data: dict) -> None:
         ix_data_dict[entry['id']] = entry
     for ix_id, ix_data in sorted(ix_data_dict.items()):
         line = (ix_id,
-                ix_data['name'].replace(',', ' '),
-                ix_data['name_long'].replace(',', ' '),
+                ix_data['name'],
+                ix_data['name_long'],
                 ix_data['country'])
         lines.append(line)
-    headers = ('ix_id', 'name', 'name_long', 'country')
-    lines.insert(0, headers)
     return lines
 
 
@@ -42,15 +45,23 @@ def main() -> None:
                         default=DEFAULT_INPUT)
     parser.add_argument('-o', '--output',
                         help='Manually specify output file')
+    parser.add_argument('--force', action='store_true',
+                        help='recompute the output even if it is up to date')
+    add_output_format_argument(parser)
     args = parser.parse_args()
     file = PickleFileHandler(input_=args.input, output=args.output,
                              output_name_suffix=OUTPUT_SUFFIX)
+    cache = ParseCache(get_outputs(file.output, args.output_format),
+                       [file.input], {'formats': args.output_format})
+    if cache.check(args.force):
+        return
     data = file.read()
     lines = make_data_lines(data['ix'])
-    if len(lines) <= 1:
+    if not lines:
         logging.error(f'No data written.')
         return
-    file.write(lines)
+    file.write(lines, HEADER, args.output_format, COLUMN_TYPES)
+    cache.record()
 
 
 if __name__ == '__main__':
@@ -2,11 +2,16 @@ import argparse
 import logging
 import sys
 
+from file_handlers.common import add_output_format_argument, get_outputs
+from file_handlers.parse_cache import ParseCache
 from file_handlers.pickle import PickleFileHandler
 
 
 DEFAULT_INPUT = 'raw/peeringdb/latest-peeringdb-ixp.pickle.bz2'
 OUTPUT_SUFFIX = '-prefixes'
+HEADER = ('ix_id', 'ixlan_id', 'proto', 'prefix')
+COLUMN_TYPES = {'ix_id': 'int64', 'ixlan_id': 'int64', 'proto': 'category',
+                'prefix': 'string'}
 
 
 def connect_pfx_data(raw_data: dict) -> None:
@@ -62,8 +67,6 @@ def connect_pfx_data(raw_data: dict) -> None:
                 entry['prefix'])
         lines.append(line)
     lines.sort()
-    headers = ('ix_id', 'ixlan_id', 'proto', 'prefix')
-    lines.insert(0, headers)
     return lines
 
 
@@ -78,15 +81,23 @@ def main() -> None:
                         default=DEFAULT_INPUT)
     parser.add_argument('-o', '--output',
                         help='Manually specify output file')
+    parser.add_argument('--force', action='store_true',
+                        help='recompute the output even if it is up to date')
+    add_output_format_argument(parser)
     args = parser.parse_args()
     file = PickleFileHandler(input_=args.input, output=args.output,
                              output_name_suffix=OUTPUT_SUFFIX)
+    cache = ParseCache(get_outputs(file.output, args.output_format),
+                       [file.input], {'formats': args.output_format})
+    if cache.check(args.force):
+        return
     data = file.read()
     lines = connect_pfx_data(data)
-    if len(lines) <= 1:
+    if not lines:
         logging.error(f'No data written.')
         return
-    file.write(lines)
+    file.write(lines, HEADER, args.output_format, COLUMN_TYPES)
+    cache.record()
 
 
 if __name__ == '__main__':
@@ -1,19 +1,19 @@
 import argparse
-import bz2
 import logging
 import pickle
 import sys
 from collections import defaultdict
 from datetime import datetime
 
-import msgpack
+from file_handlers.msgpack import MsgpackFileHandler
+from file_handlers.parallel_bz2 import open_bz2
 
 
 AS_MAP = 'raw/atlas/latest-asn-names.txt'
 PROBE_FILE = 'raw/atlas/latest-probes.msgpack.bz2'
 DATE_FMT = '%Y%m%d'
 OUTPUT_FILE_TEMPLATE = \
-    'parsed/{date}-top-{top}-probe-as-by-country.{type}.pickle.bz2'
+    'parsed/{date}-top-{top}-probe-as-by-country{af}.{type}.pickle.bz2'
 
 
 class Country:
@@ -37,9 +37,9 @@ class Country:
         return ret
 
 
-def read_as_map() -> dict:
+def read_as_map(file: str = AS_MAP) -> dict:
     ret = dict()
-    with open(AS_MAP, 'r') as f:
+    with open(file, 'r') as f:
         for line in f:
             line_split = line.split()
             asn = int(line_split[0])
@@ -48,33 +48,66 @@ def read_as_map() -> dict:
     return ret
 
 
-def read_probe_file(ipv6: bool, as_map: dict) -> dict:
-    ret = dict()
-    with bz2.open(PROBE_FILE, 'rb') as f:
-        probe_data = msgpack.load(f)
-    for probe in probe_data:
+class TopAsGrouper:
+    """Collect the probes per AS and country for the selected address
+    family."""
+
+    def __init__(self, ipv6: bool, as_map: dict) -> None:
         if ipv6:
-            asn = probe['asn_v6']
+            self.key = 'asn_v6'
         else:
-            asn = probe['asn_v4']
+            self.key = 'asn_v4'
+        self.as_map = as_map
+        self.countries = dict()
+
+    def add(self, probe: dict) -> None:
+        asn = probe[self.key]
         probe_id = probe['id']
         if asn is None or probe_id is None:
-            continue
+            return
         cc = probe['country_code']
         if cc is None:
             # Try inferring cc from AS map.
-            if asn not in as_map:
+            if asn not in self.as_map:
                 logging.warning(f'Skipping probe due to missing and '
                                 f'unmappable CC: {probe}')
-                continue
-            cc = as_map[asn]
-        if asn in as_map and cc != as_map[asn]:
+                return
+            cc = self.as_map[asn]
+        if asn in self.as_map and cc != self.as_map[asn]:
             logging.debug(f'Error: Probe CC "{cc}"" does not match map CC '
-                          f'"{as_map[asn]}"')
-        if cc not in ret:
-            ret[cc] = Country(cc)
-        ret[cc].add_probe(asn, probe_id)
-    return ret
+                          f'"{self.as_map[asn]}"')
+        if cc not in self.countries:
+            self.countries[cc] = Country(cc)
+        self.countries[cc].add_probe(asn, probe_id)
+
+    def get_output(self, top: int, as_set: bool):
+        """Return a flat set of the probe IDs in the TOP ASes of all
+        countries if as_set is specified, else a dict
+        cc -> asn -> probe IDs."""
+        if as_set:
+            return {prb_id for country in self.countries.values()
+                    for asn in country.get_top(top).values()
+                    for prb_id in asn}
+        return {cc: country.get_top(top)
+                for cc, country in self.countries.items()}
+
+
+def read_probe_file(ipv6: bool, as_map: dict) -> dict:
+    grouper = TopAsGrouper(ipv6, as_map)
+    for probe in MsgpackFileHandler(PROBE_FILE).iter_records():
+        grouper.add(probe)
+    return grouper.countries
+
+
+def write_output(output, top: int, as_set: bool, ipv6: bool) -> None:
+    output_file = \
+        OUTPUT_FILE_TEMPLATE.format(date=datetime.utcnow().strftime(DATE_FMT),
+                                    top=top,
+                                    af='-v6' if ipv6 else str(),
+                                    type='set' if as_set else 'dict')
+    logging.info(f'Writing {output_file}')
+    with open_bz2(output_file, 'wb') as f:
+        pickle.dump(output, f)
 
 
 def main() -> None:
@@ -92,30 +125,12 @@ def main() -> None:
         level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S'
     )
 
-    top = args.top
-
     as_map = read_as_map()
-    parsed_probe_file = read_probe_file(args.ipv6, as_map)
-    if args.set:
-        output = {prb_id for country in parsed_probe_file.values()
-                  for asn in country.get_top(top).values()
-                  for prb_id in asn}
-        output_file = \
-            OUTPUT_FILE_TEMPLATE.format(date=datetime.utcnow()
-                                                     .strftime(DATE_FMT),
-                                        top=top,
-                                        type='set')
-    else:
-        output = {cc: country.get_top(top)
-                for cc, country in parsed_probe_file.items()}
-        output_file = \
-            OUTPUT_FILE_TEMPLATE.format(date=datetime.utcnow()
-                                                     .strftime(DATE_FMT),
-                                        top=top,
-                                        type='dict')
-    logging.info(f'Writing {output_file}')
-    with bz2.open(output_file, 'wb') as f:
-        pickle.dump(output, f)
+    grouper = TopAsGrouper(args.ipv6, as_map)
+    for probe in MsgpackFileHandler(PROBE_FILE).iter_records():
+        grouper.add(probe)
+    write_output(grouper.get_output(args.top, args.set), args.top, args.set,
+                 args.ipv6)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,90 @@
+import argparse
+import logging
+import os
+import sys
+
+import get_top_probe_as_per_country as top_as
+from file_handlers.msgpack import MsgpackFileHandler
+from group_probes_by_as import AsGrouper
+from group_probes_by_country import CountryGrouper
+from group_probes_by_rir import RirGrouper, read_asn_mapping
+
+DEFAULT_INPUT = 'raw/atlas/latest-probes.msgpack.bz2'
+AS_OUTPUT_SUFFIX = '-by-as'
+COUNTRY_OUTPUT_SUFFIX = '-by-country'
+RIR_OUTPUT_SUFFIX = '-by-rir'
+IPV6_OUTPUT_SUFFIX = '-v6'
+
+
+def main() -> None:
+    log_format = '%(asctime)s %(levelname)s %(message)s'
+    logging.basicConfig(
+        format=log_format,
+        level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser(
+        description='Compute the outputs of the group_probes_by_* and '
+                    'get_top_probe_as_per_country scripts for IPv4 and IPv6 '
+                    'while reading the probe snapshot only once.')
+    parser.add_argument('-i', '--input',
+                        help='use this raw dump instead of latest',
+                        default=DEFAULT_INPUT)
+    parser.add_argument('-a', '--asn-file',
+                        help='CSV containing ASN -> RIR mapping as generated '
+                             'by get_assigned_as_numbers.py. RIR groupings '
+                             'are skipped if not specified')
+    parser.add_argument('-m', '--as-map', default=top_as.AS_MAP,
+                        help='AS name file used to infer missing probe '
+                             'countries. Top AS groupings are skipped if it '
+                             'does not exist')
+    parser.add_argument('-t', '--top', type=int, default=10,
+                        help='output TOP ASes per country')
+    args = parser.parse_args()
+
+    asn_map = dict()
+    if args.asn_file:
+        asn_map = read_asn_mapping(args.asn_file)
+        if not asn_map:
+            sys.exit(1)
+    as_map = None
+    if os.path.exists(args.as_map):
+        as_map = top_as.read_as_map(args.as_map)
+    else:
+        logging.warning(f'AS map {args.as_map} not found. Skipping top AS '
+                        f'groupings.')
+
+    # (output name suffix, grouper) for CSV outputs and
+    # (ipv6, grouper) for top AS outputs.
+    csv_groupers = list()
+    top_groupers = list()
+    for ipv6 in (False, True):
+        af_suffix = IPV6_OUTPUT_SUFFIX if ipv6 else str()
+        csv_groupers.append((AS_OUTPUT_SUFFIX + af_suffix, AsGrouper(ipv6)))
+        csv_groupers.append((COUNTRY_OUTPUT_SUFFIX + af_suffix,
+                             CountryGrouper(ipv6)))
+        if asn_map:
+            csv_groupers.append((RIR_OUTPUT_SUFFIX + af_suffix,
+                                 RirGrouper(asn_map, ipv6)))
+        if as_map is not None:
+            top_groupers.append((ipv6, top_as.TopAsGrouper(ipv6, as_map)))
+    groupers = [grouper for _, grouper in csv_groupers + top_groupers]
+
+    probe_count = 0
+    for probe in MsgpackFileHandler(args.input).iter_records():
+        probe_count += 1
+        for grouper in groupers:
+            grouper.add(probe)
+    logging.info(f'Processed {probe_count} probes')
+
+    for output_name_suffix, grouper in csv_groupers:
+        file = MsgpackFileHandler(input_=args.input,
+                                  output_name_suffix=output_name_suffix)
+        file.write(grouper.lines())
+    for ipv6, grouper in top_groupers:
+        for as_set in (False, True):
+            top_as.write_output(grouper.get_output(args.top, as_set),
+                                args.top, as_set, ipv6)
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
@@ -1,27 +1,53 @@
 import argparse
 import logging
 from collections import defaultdict
+from functools import partial
+from typing import Iterable
 
-from file_handlers.msgpack import MsgpackFileHandler
+from file_handlers.common import add_output_format_argument, get_outputs
+from file_handlers.msgpack import INPUT_SUFFIX, MsgpackFileHandler
+from file_handlers.parse_cache import ParseCache
+from file_handlers.time_series import (add_range_arguments, get_series_output,
+                                       process_range)
 
 DEFAULT_INPUT = 'raw/atlas/latest-probes.msgpack.bz2'
 OUTPUT_SUFFIX = '-by-as'
+COLUMN_TYPES = {'as': 'uint32', 'probe_count': 'int64'}
 
 
-def group_by_as(data: list, ipv6: bool) -> list:
-    if ipv6:
-        key = 'asn_v6'
-    else:
-        key = 'asn_v4'
-    as_probe_map = defaultdict(int)
+class AsGrouper:
+    """Count probes per AS for the selected address family."""
+
+    def __init__(self, ipv6: bool) -> None:
+        if ipv6:
+            self.key = 'asn_v6'
+        else:
+            self.key = 'asn_v4'
+        self.as_probe_map = defaultdict(int)
+
+    def add(self, probe: dict) -> None:
+        if self.key not in probe or not probe[self.key]:
+            return
+        self.as_probe_map[probe[self.key]] += 1
+
+    def lines(self) -> list:
+        if not self.as_probe_map:
+            return list()
+        return [('as', 'probe_count')] + \
+               sorted(self.as_probe_map.items(), key=lambda t: t[1],
+                      reverse=True)
+
+
+def group_by_as(data: Iterable, ipv6: bool) -> list:
+    grouper = AsGrouper(ipv6)
     for probe in data:
-        if key not in probe or not probe[key]:
-            continue
-        as_probe_map[probe[key]] += 1
-    if not as_probe_map:
-        return list()
-    return [('as', 'probe_count')] + \
-           sorted(as_probe_map.items(), key=lambda t: t[1], reverse=True)
+        grouper.add(probe)
+    return grouper.lines()
+
+
+def process_snapshot(file: str, ipv6: bool = False) -> list:
+    """Return the grouping of a single snapshot."""
+    return group_by_as(MsgpackFileHandler(file).iter_records(), ipv6)
 
 
 def main() -> None:
@@ -39,16 +65,33 @@ def main() -> None:
                         help=',anually specify output file')
     parser.add_argument('--ipv6', action='store_true',
                          help='use IPv6')
+    parser.add_argument('--force', action='store_true',
+                        help='recompute the output even if it is up to date')
+    add_output_format_argument(parser)
+    add_range_arguments(parser)
     args = parser.parse_args()
 
     ipv6 = args.ipv6
     if ipv6:
         OUTPUT_SUFFIX += '-v6'
+    if args.from_date:
+        output = args.output \
+            or get_series_output(args.input, INPUT_SUFFIX, OUTPUT_SUFFIX)
+        process_range(args.input, INPUT_SUFFIX, args.from_date, args.to_date,
+                      output, partial(process_snapshot, ipv6=ipv6),
+                      args.workers)
+        return
     file = MsgpackFileHandler(input_=args.input, output=args.output,
                               output_name_suffix=OUTPUT_SUFFIX)
-    data = file.read()
+    cache = ParseCache(get_outputs(file.output, args.output_format),
+                       [file.input],
+                       {'ipv6': ipv6, 'formats': args.output_format})
+    if cache.check(args.force):
+        return
+    data = file.iter_records()
     lines = group_by_as(data, ipv6)
-    file.write(lines)
+    file.write(lines, formats=args.output_format, column_types=COLUMN_TYPES)
+    cache.record()
 
 
 if __name__ == '__main__':
@@ -1,29 +1,56 @@
 import argparse
 import logging
 from collections import defaultdict
+from functools import partial
+from typing import Iterable
 
-from file_handlers.msgpack import MsgpackFileHandler
+from file_handlers.common import add_output_format_argument, get_outputs
+from file_handlers.msgpack import INPUT_SUFFIX, MsgpackFileHandler
+from file_handlers.parse_cache import ParseCache
+from file_handlers.time_series import (add_range_arguments, get_series_output,
+                                       process_range)
 
 DEFAULT_INPUT = 'raw/atlas/latest-probes.msgpack.bz2'
 OUTPUT_SUFFIX = '-by-country'
+COLUMN_TYPES = {'country': 'category', 'probe_count': 'int64'}
 
 
-def group_by_country(data: list, ipv6: bool) -> list:
-    as_probe_map = defaultdict(int)
-    for probe in data:
-        if 'country_code' not in probe or not probe['country_code']:
-            continue
+class CountryGrouper:
+    """Count probes per country, considering only probes with an AS
+    for the selected address family."""
+
+    def __init__(self, ipv6: bool) -> None:
         if ipv6:
-            if 'asn_v6' not in probe or not probe['asn_v6']:
-                continue
+            self.key = 'asn_v6'
         else:
-            if 'asn_v4' not in probe or not probe['asn_v4']:
-                continue
-        as_probe_map[probe['country_code']] += 1
-    if not as_probe_map:
-        return list()
-    return [('country', 'probe_count')] + \
-           sorted(as_probe_map.items(), key=lambda t: t[1], reverse=True)
+            self.key = 'asn_v4'
+        self.country_probe_map = defaultdict(int)
+
+    def add(self, probe: dict) -> None:
+        if 'country_code' not in probe or not probe['country_code']:
+            return
+        if self.key not in probe or not probe[self.key]:
+            return
+        self.country_probe_map[probe['country_code']] += 1
+
+    def lines(self) -> list:
+        if not self.country_probe_map:
+            return list()
+        return [('country', 'probe_count')] + \
+               sorted(self.country_probe_map.items(), key=lambda t: t[1],
+                      reverse=True)
+
+
+def group_by_country(data: Iterable, ipv6: bool) -> list:
+    grouper = CountryGrouper(ipv6)
+    for probe in data:
+        grouper.add(probe)
+    return grouper.lines()
+
+
+def process_snapshot(file: str, ipv6: bool = False) -> list:
+    """Return the grouping of a single snapshot."""
+    return group_by_country(MsgpackFileHandler(file).iter_records(), ipv6)
 
 
 def main() -> None:
@@ -39,17 +66,34 @@ def main() -> None:
     parser.add_argument('-o', '--output',
                         help='Manually specify output file')
     parser.add_argument('--ipv6', action='store_true', help='use IPv6')
+    parser.add_argument('--force', action='store_true',
+                        help='recompute the output even if it is up to date')
+    add_output_format_argument(parser)
+    add_range_arguments(parser)
     args = parser.parse_args()
 
     ipv6 = args.ipv6
     if ipv6:
         OUTPUT_SUFFIX += '-v6'
+    if args.from_date:
+        output = args.output \
+            or get_series_output(args.input, INPUT_SUFFIX, OUTPUT_SUFFIX)
+        process_range(args.input, INPUT_SUFFIX, args.from_date, args.to_date,
+                      output, partial(process_snapshot, ipv6=ipv6),
+                      args.workers)
+        return
 
     file = MsgpackFileHandler(input_=args.input, output=args.output,
                               output_name_suffix=OUTPUT_SUFFIX)
-    data = file.read()
+    cache = ParseCache(get_outputs(file.output, args.output_format),
+                       [file.input],
+                       {'ipv6': ipv6, 'formats': args.output_format})
+    if cache.check(args.force):
+        return
+    data = file.iter_records()
     lines = group_by_country(data, ipv6)
-    file.write(lines)
+    file.write(lines, formats=args.output_format, column_types=COLUMN_TYPES)
+    cache.record()
 
 
 if __name__ == '__main__':
@@ -1,58 +1,76 @@
 import argparse
 import logging
-import os
 import sys
 from collections import defaultdict
+from functools import partial
+from typing import Iterable
 
-from file_handlers.msgpack import MsgpackFileHandler
+from file_handlers.asn_ranges import AsnRangeTable
+from file_handlers.common import add_output_format_argument, get_outputs
+from file_handlers.msgpack import INPUT_SUFFIX, MsgpackFileHandler
+from file_handlers.parse_cache import ParseCache
+from file_handlers.time_series import (add_range_arguments, get_series_output,
+                                       process_range)
 
 
 DEFAULT_INPUT = 'raw/atlas/latest-probes.msgpack.bz2'
-ASN_FILE_DELIMITER = ','
 OUTPUT_SUFFIX = '-by-rir'
+COLUMN_TYPES = {'rir': 'category', 'probe_count': 'int64'}
 
 
-def read_asn_mapping(input_file: str) -> dict:
-    if not os.path.exists(input_file):
-        logging.error(f'Failed to find AS map file: {input_file}')
-        return dict()
-
-    logging.info(f'Reading AS map file: {input_file}')
-    ret = dict()
-    with open(input_file, 'r') as f:
-        f.readline()
-        for line in f:
-            line_split = line.strip().split(ASN_FILE_DELIMITER)
-            if len(line_split) != 3 or not line_split[2].isdigit():
-                logging.error(f'AS map file has invalid line format: '
-                              f'{line.strip()}')
-                return dict()
-            rir = line_split[0]
-            asn = int(line_split[2])
-            ret[asn] = rir
-    logging.info(f'Found mapping for {len(ret)} ASes')
+def read_asn_mapping(input_file: str) -> AsnRangeTable:
+    """Read the ASN -> RIR mapping in either output format of
+    get_assigned_as_numbers.py."""
+    ret = AsnRangeTable.load(input_file)
+    if ret:
+        logging.info(f'Found mapping for {ret.asn_count()} ASes in '
+                     f'{len(ret)} ranges')
     return ret
 
 
-def group_by_rir(data: list, asn_map: dict, ipv6: bool) -> list:
-    if ipv6:
-        key = 'asn_v6'
-    else:
-        key = 'asn_v4'
-    rir_probe_map = defaultdict(int)
-    for probe in data:
-        if key not in probe or not probe[key]:
-            continue
-        asn = probe[key]
-        if asn not in asn_map:
+class RirGrouper:
+    """Count probes per RIR that assigned the AS of the selected
+    address family."""
+
+    def __init__(self, asn_map: AsnRangeTable, ipv6: bool) -> None:
+        if ipv6:
+            self.key = 'asn_v6'
+        else:
+            self.key = 'asn_v4'
+        self.asn_map = asn_map
+        self.rir_probe_map = defaultdict(int)
+
+    def add(self, probe: dict) -> None:
+        if self.key not in probe or not probe[self.key]:
+            return
+        asn = probe[self.key]
+        if asn not in self.asn_map:
             logging.warning(f'Failed to find assigned RIR for ASN {asn}. This '
                             f'should not happen.')
-            continue
-        rir_probe_map[asn_map[asn]] += 1
-    if not rir_probe_map:
-        return list()
-    return [('rir', 'probe_count')] + \
-           sorted(rir_probe_map.items(), key=lambda t: t[1], reverse=True)
+            return
+        self.rir_probe_map[self.asn_map[asn]] += 1
+
+    def lines(self) -> list:
+        if not self.rir_probe_map:
+            return list()
+        return [('rir', 'probe_count')] + \
+               sorted(self.rir_probe_map.items(), key=lambda t: t[1],
+                      reverse=True)
+
+
+def group_by_rir(data: Iterable, asn_map: AsnRangeTable, ipv6: bool) -> list:
+    grouper = RirGrouper(asn_map, ipv6)
+    for probe in data:
+        grouper.add(probe)
+    return grouper.lines()
+
+
+def process_snapshot(file: str,
+                     asn_map: AsnRangeTable,
+                     ipv6: bool = False) -> list:
+    """Return the grouping of a single snapshot."""
+    return group_by_rir(MsgpackFileHandler(file).iter_records(), asn_map,
+                        ipv6)
 
 
 def main() -> None:
@@ -72,20 +90,41 @@ def main() -> None:
                         help=',anually specify output file')
     parser.add_argument('--ipv6', action='store_true',
                          help='use IPv6')
+    parser.add_argument('--force', action='store_true',
+                        help='recompute the output even if it is up to date')
+    add_output_format_argument(parser)
+    add_range_arguments(parser)
     args = parser.parse_args()
 
-    asn_map = read_asn_mapping(args.asn_file)
-    if not asn_map:
-        sys.exit(1)
-
     ipv6 = args.ipv6
     if ipv6:
         OUTPUT_SUFFIX += '-v6'
+    if args.from_date:
+        asn_map = read_asn_mapping(args.asn_file)
+        if not asn_map:
+            sys.exit(1)
+        output = args.output \
+            or get_series_output(args.input, INPUT_SUFFIX, OUTPUT_SUFFIX)
+        process_range(args.input, INPUT_SUFFIX, args.from_date, args.to_date,
+                      output,
+                      partial(process_snapshot, asn_map=asn_map, ipv6=ipv6),
+                      args.workers)
+        return
     file = MsgpackFileHandler(input_=args.input, output=args.output,
                               output_name_suffix=OUTPUT_SUFFIX)
-    data = file.read()
+    cache = ParseCache(get_outputs(file.output, args.output_format),
+                       [file.input, args.asn_file],
+                       {'ipv6': ipv6, 'formats': args.output_format})
+    if cache.check(args.force):
+        return
+
+    asn_map = read_asn_mapping(args.asn_file)
+    if not asn_map:
+        sys.exit(1)
+    data = file.iter_records()
     lines = group_by_rir(data, asn_map, ipv6)
-    file.write(lines)
+    file.write(lines, formats=args.output_format, column_types=COLUMN_TYPES)
+    cache.record()
 
 
 if __name__ == '__main__':
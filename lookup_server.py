@@ -0,0 +1,312 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Tuple
+
+import radix
+
+from file_handlers.asn_ranges import AsnRangeTable
+from file_handlers.bz2 import Bz2FileHandler
+from file_handlers.compression import find_file
+from file_handlers.msgpack import MsgpackFileHandler
+from file_handlers.pickle import PickleFileHandler
+from file_handlers.prefix_table import INPUT_SUFFIX as TABLE_SUFFIX
+from file_handlers.prefix_table import NO_MATCH, PrefixTable
+from get_assigned_as_numbers import get_assigned_asn_ranges
+from get_ixp_prefixes import connect_pfx_data
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8787
+# Seconds between checks for new snapshots.
+RELOAD_INTERVAL = 60
+DEFAULT_RIB = 'raw/routeviews/latest-rib.pfx2as'
+FALLBACK_RIB = 'raw/routeviews/latest-rib.pickle.bz2'
+DEFAULT_ASN_INPUT = 'raw/nro/latest-delegated-stats.bz2'
+DEFAULT_IXP_INPUT = 'raw/peeringdb/latest-peeringdb-ixp.pickle.bz2'
+DEFAULT_PROBE_INPUT = 'raw/atlas/latest-probes.msgpack.bz2'
+# Maximum number of addresses per batch request.
+MAX_BATCH_SIZE = 1000000
+
+
+def load_rib(file: str) -> PrefixTable:
+    if file.endswith(TABLE_SUFFIX):
+        table = PrefixTable.load(file)
+    else:
+        table = PrefixTable.from_rtree(PickleFileHandler(file).read())
+    # Build the lookup structures before the table is used.
+    table.v4_intervals
+    table.v6_intervals
+    return table
+
+
+def load_asns(file: str) -> AsnRangeTable:
+    """Load the ASN assignments from a CSV file written by
+    get_assigned_as_numbers.py or from the raw NRO delegation file."""
+    if file.endswith('.csv'):
+        return AsnRangeTable.load(file)
+    return get_assigned_asn_ranges(Bz2FileHandler(file).iter_lines())
+
+
+def load_ixps(file: str) -> radix.Radix:
+    """Build a radix tree of IXP peering LAN prefixes from a PeeringDB
+    snapshot."""
+    data = PickleFileHandler(file).read()
+    ix_names = {entry['id']: entry['name'] for entry in data['ix']}
+    rtree = radix.Radix()
+    for ix_id, ixlan_id, _, prefix in connect_pfx_data(data):
+        try:
+            node = rtree.add(prefix)
+        except ValueError as e:
+            logging.warning(f'Invalid IXP prefix {prefix}: {e}')
+            continue
+        node.data['ix_id'] = ix_id
+        node.data['ixlan_id'] = ixlan_id
+        node.data['name'] = ix_names.get(ix_id)
+    return rtree
+
+
+def load_probes(file: str) -> dict:
+    """Return a map of ASN to the IDs of the probes in the AS per
+    address family."""
+    ret = defaultdict(lambda: {'v4': list(), 'v6': list()})
+    for probe in MsgpackFileHandler(file).iter_records():
+        for af in ('v4', 'v6'):
+            asn = probe.get('asn_' + af)
+            if asn:
+                ret[asn][af].append(probe['id'])
+    return dict(ret)
+
+
+class Dataset:
+    """Snapshot loaded from a file that is reloaded if the file (or the
+    destination of the symlink) changes.
+
+    The data is replaced with a single assignment after the new snapshot
+    is fully loaded, so readers see either the old or the new snapshot.
+    """
+
+    def __init__(self, name: str, file: str, loader: Callable) -> None:
+        self.name = name
+        self.file = file
+        self.loader = loader
+        self.data = None
+        self.version = None
+        self.failed_version = None
+        self.loaded_at = None
+
+    def get_version(self) -> Tuple[str, float]:
+        target = os.path.realpath(find_file(self.file))
+        return target, os.path.getmtime(target)
+
+    def reload(self) -> bool:
+        """Load the snapshot if it changed. Return True if new data was
+        loaded."""
+        try:
+            version = self.get_version()
+        except OSError as e:
+            if self.failed_version is None:
+                logging.warning(f'Snapshot for {self.name} not available: '
+                                f'{e}')
+                self.failed_version = tuple()
+            return False
+        if version == self.version or version == self.failed_version:
+            return False
+        logging.info(f'Loading {self.name} from {version[0]}')
+        start = time.time()
+        try:
+            data = self.loader(version[0])
+        except Exception as e:
+            # Keep serving the previous snapshot.
+            logging.error(f'Failed to load {self.name} from {version[0]}: '
+                          f'{e}')
+            self.failed_version = version
+            return False
+        self.data = data
+        self.version = version
+        self.loaded_at = time.time()
+        logging.info(f'Loaded {self.name} in {self.loaded_at - start:.2f}s')
+        return True
+
+    def status(self) -> dict:
+        return {'file': self.version[0] if self.version else None,
+                'loaded_at': self.loaded_at}
+
+
+def watch_datasets(datasets: dict,
+                   interval: float,
+                   stop: threading.Event) -> None:
+    while not stop.wait(interval):
+        for dataset in datasets.values():
+            dataset.reload()
+
+
+def lookup_addresses(datasets: dict, addresses: list) -> list:
+    """Return the origin AS and IXP (if any) of each address."""
+    table = datasets['rib'].data
+    ixps = datasets['ixp'].data
+    ret = [{'address': address,
+            'prefix': None,
+            'origin_as': None,
+            'ixp': None} for address in addresses]
+    if table is not None:
+        indices = table.lookup(addresses)
+        origins = table.get_origins(indices)
+        for res, idx, origin in zip(ret, indices.tolist(), origins):
+            if idx == NO_MATCH:
+                continue
+            res['prefix'] = table.get_prefix(idx)
+            res['origin_as'] = origin
+    if ixps is not None:
+        for res in ret:
+            try:
+                node = ixps.search_best(res['address'])
+            except (ValueError, TypeError):
+                continue
+            if node is not None:
+                res['ixp'] = {'prefix': node.prefix, **node.data}
+    return ret
+
+
+def lookup_asn(datasets: dict, asn: int) -> dict:
+    """Return the registry, country, and probes of the AS."""
+    ret = {'asn': asn,
+           'registry': None,
+           'cc': None,
+           'probes_v4': list(),
+           'probes_v6': list()}
+    asns = datasets['asn'].data
+    if asns is not None and asn in asns:
+        ret['registry'] = asns[asn]
+        ret['cc'] = asns.get_cc(asn)
+    probes = datasets['probe'].data
+    if probes is not None and asn in probes:
+        ret['probes_v4'] = probes[asn]['v4']
+        ret['probes_v6'] = probes[asn]['v6']
+    return ret
+
+
+class LookupHandler(BaseHTTPRequestHandler):
+    """JSON API:
+
+    GET /ip/<address>   origin AS and IXP of the address
+    POST /ip            same for {"addresses": [...]}
+    GET /asn/<asn>      registry, country, and probes of the AS
+    GET /status         loaded snapshots
+    """
+
+    def send_json(self, data, status: int = 200) -> None:
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status: int, message: str) -> None:
+        self.send_json({'error': message}, status)
+
+    def do_GET(self) -> None:
+        datasets = self.server.datasets
+        path = self.path.split('?', 1)[0].strip('/').split('/')
+        if path == ['status']:
+            self.send_json({name: dataset.status()
+                            for name, dataset in datasets.items()})
+        elif len(path) == 2 and path[0] == 'ip':
+            self.send_json(lookup_addresses(datasets, [path[1]])[0])
+        elif len(path) == 2 and path[0] == 'asn':
+            asn = path[1].upper().removeprefix('AS')
+            if not asn.isdigit():
+                self.send_error_json(400, f'Invalid ASN: {path[1]}')
+                return
+            self.send_json(lookup_asn(datasets, int(asn)))
+        else:
+            self.send_error_json(404, f'Unknown path: {self.path}')
+
+    def do_POST(self) -> None:
+        if self.path.strip('/') != 'ip':
+            self.send_error_json(404, f'Unknown path: {self.path}')
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            addresses = json.loads(self.rfile.read(length))['addresses']
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_error_json(400, f'Invalid request: {e}')
+            return
+        if not isinstance(addresses, list) \
+                or not all(isinstance(a, str) for a in addresses):
+            self.send_error_json(400, 'addresses must be a list of strings')
+            return
+        if len(addresses) > MAX_BATCH_SIZE:
+            self.send_error_json(413, f'At most {MAX_BATCH_SIZE} addresses '
+                                      f'per request')
+            return
+        self.send_json(lookup_addresses(self.server.datasets, addresses))
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug(f'{self.address_string()} {format % args}')
+
+
+def main() -> None:
+    log_format = '%(asctime)s %(levelname)s %(message)s'
+    logging.basicConfig(
+        format=log_format,
+        level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser(
+        description='Serve IP and AS lookups from the latest snapshots, '
+                    'which are reloaded when they change.')
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help='address to listen on')
+    parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT,
+                        help='port to listen on')
+    parser.add_argument('--rib',
+                        help='prefix table or pickled radix tree. Defaults '
+                             f'to {DEFAULT_RIB} or {FALLBACK_RIB}')
+    parser.add_argument('--asn-file', default=DEFAULT_ASN_INPUT,
+                        help='NRO delegation file or CSV generated by '
+                             'get_assigned_as_numbers.py')
+    parser.add_argument('--ixp-file', default=DEFAULT_IXP_INPUT,
+                        help='PeeringDB IXP snapshot')
+    parser.add_argument('--probe-file', default=DEFAULT_PROBE_INPUT,
+                        help='Atlas probe snapshot')
+    parser.add_argument('--reload-interval', type=float,
+                        default=RELOAD_INTERVAL,
+                        help='seconds between checks for new snapshots')
+    args = parser.parse_args()
+
+    rib = args.rib
+    if not rib:
+        rib = DEFAULT_RIB if os.path.exists(DEFAULT_RIB) else FALLBACK_RIB
+    datasets = {'rib': Dataset('RIB', rib, load_rib),
+                'asn': Dataset('ASN assignments', args.asn_file, load_asns),
+                'ixp': Dataset('IXP prefixes', args.ixp_file, load_ixps),
+                'probe': Dataset('probes', args.probe_file, load_probes)}
+    for dataset in datasets.values():
+        dataset.reload()
+
+    stop = threading.Event()
+    watcher = threading.Thread(target=watch_datasets,
+                               args=(datasets, args.reload_interval, stop),
+                               daemon=True)
+    watcher.start()
+    server = ThreadingHTTPServer((args.host, args.port), LookupHandler)
+    server.daemon_threads = True
+    server.datasets = datasets
+    logging.info(f'Listening on {args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
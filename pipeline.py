@@ -0,0 +1,262 @@
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, List, Union
+
+from file_handlers.bz2 import Bz2FileHandler
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+DOWNLOADER_DIR = os.path.join(ROOT_DIR, 'downloaders')
+LOG_DIR = os.path.join(ROOT_DIR, 'logs', 'pipeline')
+MAX_WORKERS = 4
+# Downloads are skipped if the latest snapshot was updated less than
+# this many hours ago.
+DOWNLOAD_MAX_AGE = 20
+# Stage results.
+OK = 'ok'
+SKIPPED = 'skipped'
+FAILED = 'failed'
+BLOCKED = 'blocked'
+
+
+def get_assigned_asn_file() -> str:
+    """Return the output of get_assigned_as_numbers.py for the latest
+    NRO snapshot."""
+    import get_assigned_as_numbers
+    return Bz2FileHandler(
+        get_assigned_as_numbers.DEFAULT_INPUT,
+        output_name_suffix=get_assigned_as_numbers.OUTPUT_SUFFIX).output
+
+
+class Stage:
+    """A script of the pipeline.
+
+    Download stages run in the downloaders directory and are skipped if
+    the latest snapshot is recent. Parse stages run in the root directory.
+    If parse_cache is set, the script skips itself if its output is up
+    to date (see file_handlers.parse_cache) and accepts --force, which
+    is passed through if the pipeline is forced. Other scripts always
+    recompute their output. Arguments can be callables, which are
+    evaluated when the stage starts, so that they can refer to outputs
+    of previous stages.
+    """
+
+    def __init__(self,
+                 name: str,
+                 command: List[Union[str, Callable]],
+                 deps: Iterable[str] = tuple(),
+                 latest: str = None,
+                 parse_cache: bool = True) -> None:
+        self.name = name
+        self.command = command
+        self.deps = tuple(deps)
+        self.latest = latest
+        self.parse_cache = parse_cache
+
+    @property
+    def is_download(self) -> bool:
+        return self.latest is not None
+
+    def is_up_to_date(self, max_age: float) -> bool:
+        if not self.is_download:
+            return False
+        latest = os.path.join(ROOT_DIR, self.latest)
+        # The symlink is replaced by every download, even if the content
+        # did not change.
+        if not os.path.lexists(latest):
+            return False
+        return time.time() - os.lstat(latest).st_mtime < max_age
+
+    def get_args(self, force: bool) -> list:
+        args = [arg() if callable(arg) else arg for arg in self.command]
+        if args[0].endswith('.py'):
+            args.insert(0, sys.executable)
+            if force and not self.is_download and self.parse_cache:
+                args.append('--force')
+        else:
+            args.insert(0, 'bash')
+        return args
+
+    def run(self, force: bool, max_age: float) -> str:
+        if not force and self.is_up_to_date(max_age):
+            logging.info(f'{self.name}: latest snapshot is up to date')
+            return SKIPPED
+        try:
+            args = self.get_args(force)
+        except (OSError, ValueError) as e:
+            logging.error(f'{self.name}: failed to prepare command: {e}')
+            return FAILED
+        cwd = DOWNLOADER_DIR if self.is_download else ROOT_DIR
+        log_file = os.path.join(LOG_DIR, self.name + '.log')
+        logging.info(f'{self.name}: running {" ".join(args[1:])}')
+        with open(log_file, 'a') as f:
+            ret = subprocess.run(args, cwd=cwd, stdout=f,
+                                 stderr=subprocess.STDOUT)
+        if ret.returncode != 0:
+            logging.error(f'{self.name}: failed with exit code '
+                          f'{ret.returncode}. See {log_file}')
+            return FAILED
+        return OK
+
+
+STAGES = [
+    Stage('nro', ['get_nro_assignment_report_snapshot.py'],
+          latest='raw/nro/latest-delegated-stats.bz2'),
+    Stage('peeringdb-ixp', ['get_peeringdb_ixp_snapshot.py'],
+          latest='raw/peeringdb/latest-peeringdb-ixp.pickle.bz2'),
+    Stage('peeringdb-netixlan', ['get_peeringdb_netixlan_snapshot.py'],
+          latest='raw/peeringdb/latest-peeringdb-netixlan.pickle.bz2'),
+    Stage('probes', ['get_probe_snapshot.py'],
+          latest='raw/atlas/latest-probes.msgpack.bz2'),
+    Stage('rib', ['get_rib_snapshot.py'],
+          latest='raw/routeviews/latest-rib.pickle.bz2'),
+    Stage('apnic-aspop', ['get_apnic_aspop_estimate.py'],
+          latest='raw/apnic/latest-aspop-estimate.csv'),
+    Stage('as-names', ['get_as_names.sh'],
+          latest='raw/atlas/latest-asn-names.txt'),
+    Stage('bgp-analysis', ['get_bgp_analysis.sh'],
+          latest='raw/thyme/latest-bgp-analysis-current.txt'),
+    Stage('assigned-asns', ['get_assigned_as_numbers.py'], deps=['nro']),
+    Stage('ixp-info', ['get_ixp_info.py'], deps=['peeringdb-ixp']),
+    Stage('ixp-prefixes', ['get_ixp_prefixes.py'], deps=['peeringdb-ixp']),
+    Stage('ixp-participants', ['get_ixp_participants.py'],
+          deps=['peeringdb-netixlan']),
+    Stage('as-prefix-count', ['get_as_prefix_count.py'], deps=['rib']),
+    Stage('group-probes', ['group_probes.py', '-a', get_assigned_asn_file],
+          deps=['probes', 'assigned-asns', 'as-names'], parse_cache=False),
+    Stage('as-stats', ['get_as_stats.py'], deps=['bgp-analysis'],
+          parse_cache=False),
+]
+
+
+def select_stages(stages: list, targets: list) -> dict:
+    """Return the target stages and all their dependencies as a map of
+    name to stage. Raise a ValueError if a stage is unknown or the
+    dependencies contain a cycle."""
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        for dep in stage.deps:
+            if dep not in by_name:
+                raise ValueError(f'Unknown dependency {dep} of {stage.name}')
+    selected = dict()
+    visiting = set()
+
+    def visit(name: str) -> None:
+        if name in selected:
+            return
+        if name not in by_name:
+            raise ValueError(f'Unknown stage: {name}')
+        if name in visiting:
+            raise ValueError(f'Dependency cycle at stage {name}')
+        visiting.add(name)
+        for dep in by_name[name].deps:
+            visit(dep)
+        visiting.remove(name)
+        selected[name] = by_name[name]
+
+    for name in targets or by_name:
+        visit(name)
+    return selected
+
+
+def run_stages(stages: dict,
+               workers: int,
+               force: bool,
+               max_age: float) -> dict:
+    """Run the stages on a pool of workers. A stage starts as soon as
+    all its dependencies succeeded or were skipped. Stages depending on
+    a failed stage are not run.
+
+    Return a map of stage name to (result, duration in seconds).
+    """
+    results = dict()
+    pending = dict(stages)
+    running = dict()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                dep_results = [results.get(dep, (None,))[0]
+                               for dep in stage.deps]
+                if any(res in (FAILED, BLOCKED) for res in dep_results):
+                    logging.warning(f'{name}: not run because a dependency '
+                                    f'failed')
+                    results[name] = (BLOCKED, 0)
+                    del pending[name]
+                elif all(res in (OK, SKIPPED) for res in dep_results):
+                    future = executor.submit(stage.run, force, max_age)
+                    running[future] = (name, time.time())
+                    del pending[name]
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, start = running.pop(future)
+                try:
+                    res = future.result()
+                except Exception as e:
+                    logging.error(f'{name}: {e}')
+                    res = FAILED
+                results[name] = (res, time.time() - start)
+                logging.info(f'{name}: {res} after '
+                             f'{results[name][1]:.2f}s')
+    return results
+
+
+def print_timings(results: dict, total: float) -> None:
+    name_width = max(len(name) for name in results)
+    print(f'{"stage":<{name_width}}  {"result":<7}  seconds')
+    for name, (res, duration) in sorted(results.items(),
+                                        key=lambda item: -item[1][1]):
+        print(f'{name:<{name_width}}  {res:<7}  {duration:.2f}')
+    print(f'{"total":<{name_width}}  {"":<7}  {total:.2f}')
+
+
+def main() -> None:
+    log_format = '%(asctime)s %(levelname)s %(message)s'
+    logging.basicConfig(
+        format=log_format,
+        level=logging.INFO, datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser(
+        description='Run the downloaders and parsers in dependency order. '
+                    'Independent stages run concurrently. The output of '
+                    f'each stage is appended to {LOG_DIR}/<stage>.log.')
+    parser.add_argument('stages', nargs='*',
+                        help='run only these stages and their dependencies')
+    parser.add_argument('-w', '--workers', type=int, default=MAX_WORKERS,
+                        help='maximum number of concurrent stages')
+    parser.add_argument('--force', action='store_true',
+                        help='run all stages even if they are up to date')
+    parser.add_argument('--max-age', type=float, default=DOWNLOAD_MAX_AGE,
+                        help='skip downloads if the latest snapshot is '
+                             'younger than this many hours')
+    parser.add_argument('-l', '--list', action='store_true',
+                        help='list the stages and exit')
+    args = parser.parse_args()
+
+    try:
+        stages = select_stages(STAGES, args.stages)
+    except ValueError as e:
+        logging.error(e)
+        sys.exit(1)
+    if args.list:
+        for stage in stages.values():
+            deps = f' (after {", ".join(stage.deps)})' if stage.deps else ''
+            print(f'{stage.name}{deps}')
+        return
+
+    os.makedirs(LOG_DIR, exist_ok=True)
+    start = time.time()
+    results = run_stages(stages, args.workers, args.force,
+                         args.max_age * 60 * 60)
+    print_timings(results, time.time() - start)
+    if any(res in (FAILED, BLOCKED) for res, _ in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
+    sys.exit(0)
@@ -0,0 +1,50 @@
+import unittest
+
+from file_handlers.asn_ranges import AsnRangeTable
+
+
+class TestAsnRangeTable(unittest.TestCase):
+    def test_disjoint_ranges(self):
+        table = AsnRangeTable([('arin', 'US', 1, 10),
+                               ('ripencc', 'DE', 20, 30)])
+        self.assertEqual(table[5], 'arin')
+        self.assertEqual(table.get_cc(20), 'DE')
+        self.assertNotIn(15, table)
+        self.assertNotIn(31, table)
+        self.assertEqual(table.find(0), -1)
+
+    def test_nested_ranges(self):
+        table = AsnRangeTable([('arin', 'US', 1, 100),
+                               ('ripencc', 'DE', 5, 6)])
+        self.assertEqual(table[50], 'arin')
+        self.assertIn(50, table)
+        self.assertEqual(table.get_cc(100), 'US')
+        # The innermost range wins.
+        self.assertEqual(table[5], 'ripencc')
+        self.assertEqual(table.get_cc(6), 'DE')
+        self.assertNotIn(101, table)
+        self.assertEqual(table.find_overlaps(), [(5, 6)])
+
+    def test_multiple_nested_ranges(self):
+        table = AsnRangeTable([('arin', 'US', 1, 100),
+                               ('apnic', 'AU', 10, 20),
+                               ('lacnic', 'BR', 12, 13),
+                               ('afrinic', 'ZA', 30, 40)])
+        self.assertEqual(table[15], 'apnic')
+        self.assertEqual(table[12], 'lacnic')
+        self.assertEqual(table[25], 'arin')
+        self.assertEqual(table[35], 'afrinic')
+        self.assertEqual(table[99], 'arin')
+
+    def test_overlapping_ranges(self):
+        table = AsnRangeTable([('arin', 'US', 1, 10),
+                               ('ripencc', 'DE', 8, 15)])
+        self.assertEqual(table[5], 'arin')
+        self.assertEqual(table[9], 'ripencc')
+        self.assertEqual(table[15], 'ripencc')
+        self.assertNotIn(16, table)
+        self.assertEqual(table.find_overlaps(), [(8, 10)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from clients.atlas import iter_pages, iter_queries
+from clients.session import make_session
+
+RESULT_COUNT = 23
+PAGE_SIZE = 5
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """Serve RESULT_COUNT results of a paginated endpoint at /probes/.
+    Later pages are answered faster, so concurrent replies arrive out of
+    order."""
+    # Number of 503 replies per page before it succeeds.
+    failures = None
+    requested_pages = None
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if url.path != '/probes/':
+            self.send_error(404)
+            return
+        query = parse_qs(url.query)
+        page = int(query['page'][0])
+        page_size = int(query['page_size'][0])
+        self.requested_pages.append(page)
+        if self.failures.get(page, 0):
+            self.failures[page] -= 1
+            self.send_error(503)
+            return
+        time.sleep(0.05 / page)
+        start = (page - 1) * page_size
+        results = [{'id': idx, 'tag': query.get('tag', [None])[0]}
+                   for idx in range(start,
+                                    min(start + page_size, RESULT_COUNT))]
+        body = json.dumps({'count': RESULT_COUNT,
+                           'results': results}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class TestAtlasClient(unittest.TestCase):
+    def setUp(self):
+        self.handler = type('Handler', (ApiHandler,),
+                            {'failures': dict(), 'requested_pages': list()})
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.endpoint = f'http://127.0.0.1:{self.server.server_port}/probes/'
+        self.session = make_session(4, retries=2, backoff_factor=0)
+
+    def get_pages(self) -> list:
+        return list(iter_pages(self.session, self.endpoint, {'tag': 'x'},
+                               page_size=PAGE_SIZE, max_workers=4))
+
+    def test_page_order(self):
+        pages = self.get_pages()
+        self.assertEqual(len(pages), 5)
+        self.assertEqual([result['id'] for page in pages for result in page],
+                         list(range(RESULT_COUNT)))
+        self.assertTrue(all(result['tag'] == 'x'
+                            for page in pages for result in page))
+        self.assertEqual(sorted(self.handler.requested_pages),
+                         [1, 2, 3, 4, 5])
+
+    def test_retry_failed_page(self):
+        self.handler.failures[3] = 1
+        pages = self.get_pages()
+        self.assertEqual([result['id'] for page in pages for result in page],
+                         list(range(RESULT_COUNT)))
+        self.assertEqual(self.handler.requested_pages.count(3), 2)
+
+    def test_page_fails_after_retries(self):
+        self.handler.failures[3] = 3
+        with self.assertRaises(requests.RequestException):
+            self.get_pages()
+
+    def test_query_order(self):
+        queries = [(self.endpoint, {'page': page, 'page_size': 1})
+                   for page in range(1, 11)]
+        replies = list(iter_queries(self.session, queries, max_workers=2))
+        self.assertEqual([reply['results'][0]['id'] for reply in replies],
+                         list(range(10)))
+
+
+if __name__ == '__main__':
+    unittest.main()
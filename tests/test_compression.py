@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+from file_handlers.compression import find_file
+
+
+class TestFindFile(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.dir = tmp_dir.name
+        os.mkdir(os.path.join(self.dir, 'objects'))
+
+    def make_snapshot(self, name: str, mtime: int) -> str:
+        """Create name as a symlink into the object store with the
+        specified modification time."""
+        object_file = os.path.join(self.dir, 'objects', name)
+        open(object_file, 'w').close()
+        path = os.path.join(self.dir, name)
+        os.symlink(os.path.join('objects', name), path)
+        os.utime(path, (mtime, mtime), follow_symlinks=False)
+        return path
+
+    def test_latest_uses_most_recent_codec(self):
+        bz2_latest = self.make_snapshot('latest-rib.pickle.bz2', 100)
+        zst_latest = self.make_snapshot('latest-rib.pickle.zst', 200)
+        # The object keeps its old mtime if the content did not change.
+        os.utime(os.path.join(self.dir, 'objects', 'latest-rib.pickle.zst'),
+                 (0, 0))
+        self.assertEqual(find_file(bz2_latest), zst_latest)
+        self.assertEqual(find_file(zst_latest), zst_latest)
+
+    def test_existing_dated_file_is_kept(self):
+        bz2_file = self.make_snapshot('20210416-rib.pickle.bz2', 100)
+        self.make_snapshot('20210416-rib.pickle.zst', 200)
+        self.assertEqual(find_file(bz2_file), bz2_file)
+
+    def test_missing_file_uses_variant(self):
+        zst_file = self.make_snapshot('20210416-rib.pickle.zst', 100)
+        bz2_file = os.path.join(self.dir, '20210416-rib.pickle.bz2')
+        self.assertEqual(find_file(bz2_file), zst_file)
+
+    def test_no_variant(self):
+        missing = os.path.join(self.dir, 'latest-rib.pickle.bz2')
+        self.assertEqual(find_file(missing), missing)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+import os
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+from unittest import mock
+
+import radix
+import requests
+
+import lookup_server
+from file_handlers.asn_ranges import RANGE_HEADER
+from file_handlers.common import write_csv
+from file_handlers.msgpack import write_records
+from file_handlers.prefix_table import PrefixTable
+from lookup_server import (Dataset, LookupHandler, load_asns, load_probes,
+                           load_rib)
+
+RIB_ENTRIES = [('10.0.0.0/8', '64500'),
+               ('10.1.0.0/16', '64501'),
+               ('2001:db8::/32', '64502')]
+ASN_RANGES = [('ripencc', 'DE', 64500, 64509),
+              ('arin', 'US', 64510, 64519)]
+PROBES = [{'id': 1, 'asn_v4': 64500, 'asn_v6': 64500},
+          {'id': 2, 'asn_v4': 64500, 'asn_v6': None},
+          {'id': 3, 'asn_v4': None, 'asn_v6': 64510}]
+
+
+def load_ixps(file: str) -> radix.Radix:
+    rtree = radix.Radix()
+    node = rtree.add('192.0.2.0/24')
+    node.data.update({'ix_id': 1, 'ixlan_id': 2, 'name': 'Test-IX'})
+    return rtree
+
+
+class TestLookupServer(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.dir = tmp_dir.name
+        self.rib = os.path.join(self.dir, 'latest-rib.pfx2as')
+        self.link_rib('20210416-rib.pfx2as', RIB_ENTRIES)
+        asn_file = os.path.join(self.dir, 'assigned-asns.csv')
+        write_csv(asn_file, ASN_RANGES, RANGE_HEADER)
+        probe_file = os.path.join(self.dir, 'probes.msgpack')
+        write_records(probe_file, PROBES)
+        ixp_file = os.path.join(self.dir, 'ixp.pickle')
+        open(ixp_file, 'w').close()
+        self.datasets = {'rib': Dataset('RIB', self.rib, load_rib),
+                         'asn': Dataset('ASN assignments', asn_file,
+                                        load_asns),
+                         'ixp': Dataset('IXP prefixes', ixp_file, load_ixps),
+                         'probe': Dataset('probes', probe_file, load_probes)}
+        for dataset in self.datasets.values():
+            self.assertTrue(dataset.reload())
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), LookupHandler)
+        self.server.datasets = self.datasets
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+
+    def link_rib(self, name: str, entries: list = None) -> None:
+        """Write a prefix table (or an invalid file if entries is None)
+        and point the latest symlink to it."""
+        file = os.path.join(self.dir, name)
+        if entries is None:
+            with open(file, 'wb') as f:
+                f.write(b'not a prefix table')
+        else:
+            PrefixTable.from_entries(entries).save(file)
+        tmp_link = self.rib + '.tmp'
+        os.symlink(name, tmp_link)
+        os.replace(tmp_link, self.rib)
+
+    def get(self, path: str) -> requests.Response:
+        return requests.get(self.url + path, timeout=10)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return requests.post(self.url + path, timeout=10, **kwargs)
+
+    def test_ip(self):
+        r = self.get('ip/10.1.2.3')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json(), {'address': '10.1.2.3',
+                                    'prefix': '10.1.0.0/16',
+                                    'origin_as': '64501',
+                                    'ixp': None})
+        self.assertEqual(self.get('ip/2001:db8::1').json()['origin_as'],
+                         '64502')
+
+    def test_ip_without_match(self):
+        self.assertEqual(self.get('ip/198.51.100.1').json(),
+                         {'address': '198.51.100.1',
+                          'prefix': None,
+                          'origin_as': None,
+                          'ixp': None})
+
+    def test_ip_in_ixp(self):
+        ixp = self.get('ip/192.0.2.10').json()['ixp']
+        self.assertEqual(ixp, {'prefix': '192.0.2.0/24', 'ix_id': 1,
+                               'ixlan_id': 2, 'name': 'Test-IX'})
+
+    def test_batch(self):
+        r = self.post('ip', json={'addresses': ['10.0.0.1', '10.1.0.1',
+                                                'invalid']})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([res['origin_as'] for res in r.json()],
+                         ['64500', '64501', None])
+
+    def test_batch_invalid_request(self):
+        for kwargs in ({'data': b'not json'},
+                       {'json': {'ips': ['10.0.0.1']}},
+                       {'json': {'addresses': '10.0.0.1'}},
+                       {'json': {'addresses': [167772161]}}):
+            r = self.post('ip', **kwargs)
+            self.assertEqual(r.status_code, 400, kwargs)
+            self.assertIn('error', r.json())
+
+    def test_batch_too_large(self):
+        with mock.patch.object(lookup_server, 'MAX_BATCH_SIZE', 2):
+            r = self.post('ip', json={'addresses': ['10.0.0.1'] * 3})
+        self.assertEqual(r.status_code, 413)
+        self.assertIn('error', r.json())
+
+    def test_asn(self):
+        r = self.get('asn/AS64500')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json(), {'asn': 64500,
+                                    'registry': 'ripencc',
+                                    'cc': 'DE',
+                                    'probes_v4': [1, 2],
+                                    'probes_v6': [1]})
+        self.assertEqual(self.get('asn/64510').json()['probes_v6'], [3])
+
+    def test_unknown_asn(self):
+        self.assertEqual(self.get('asn/65000').json(),
+                         {'asn': 65000, 'registry': None, 'cc': None,
+                          'probes_v4': list(), 'probes_v6': list()})
+
+    def test_invalid_asn(self):
+        self.assertEqual(self.get('asn/ASfoo').status_code, 400)
+
+    def test_unknown_path(self):
+        self.assertEqual(self.get('prefix/10.0.0.0').status_code, 404)
+        self.assertEqual(self.post('asn', json={}).status_code, 404)
+
+    def test_status(self):
+        status = self.get('status').json()
+        self.assertEqual(set(status), {'rib', 'asn', 'ixp', 'probe'})
+        self.assertEqual(status['rib']['file'],
+                         os.path.realpath(os.path.join(
+                             self.dir, '20210416-rib.pfx2as')))
+        self.assertIsNotNone(status['rib']['loaded_at'])
+
+    def test_reload(self):
+        rib = self.datasets['rib']
+        self.assertFalse(rib.reload())
+        self.link_rib('20210417-rib.pfx2as', [('10.0.0.0/8', '64505')])
+        self.assertTrue(rib.reload())
+        self.assertEqual(self.get('ip/10.1.2.3').json()['origin_as'],
+                         '64505')
+
+    def test_failed_reload_keeps_snapshot(self):
+        rib = self.datasets['rib']
+        self.link_rib('20210417-rib.pfx2as')
+        self.assertFalse(rib.reload())
+        self.assertEqual(self.get('ip/10.1.2.3').json()['origin_as'],
+                         '64501')
+        self.assertTrue(self.get('status').json()['rib']['file']
+                        .endswith('20210416-rib.pfx2as'))
+        # The broken snapshot is not loaded again until it changes.
+        with mock.patch.object(rib, 'loader') as loader:
+            self.assertFalse(rib.reload())
+            loader.assert_not_called()
+        self.link_rib('20210418-rib.pfx2as', [('10.0.0.0/8', '64505')])
+        self.assertTrue(rib.reload())
+        self.assertEqual(self.get('ip/10.1.2.3').json()['origin_as'],
+                         '64505')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from clients import peeringdb
+from clients.session import make_session
+
+ENDPOINT = 'ix'
+
+
+class PeeringDbHandler(BaseHTTPRequestHandler):
+    """Serve the objects of ENDPOINT like the PeeringDB API. Objects
+    have an 'updated' Unix timestamp, which is compared to since
+    queries. Deleted objects keep their status."""
+    objects = None
+    queries = None
+    # Kinds of queries ('since', 'ids', or 'full') that fail with 503.
+    failing = frozenset()
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if url.path != f'/api/{ENDPOINT}':
+            self.send_error(404)
+            return
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self.queries.append(params)
+        if 'since' in params:
+            kind = 'since'
+        elif params.get('fields') == 'id':
+            kind = 'ids'
+        else:
+            kind = 'full'
+        if kind in self.failing:
+            self.send_error(503)
+            return
+        if kind == 'since':
+            data = [obj for obj in self.objects.values()
+                    if obj['updated'] >= int(params['since'])]
+        else:
+            data = [obj for obj in self.objects.values()
+                    if obj['status'] == params.get('status')]
+            if params.get('fields') == 'id':
+                data = [{'id': obj['id']} for obj in data]
+        body = json.dumps({'data': data}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def make_object(obj_id: int, name: str, status: str = 'ok',
+                updated: float = None) -> dict:
+    if updated is None:
+        updated = time.time()
+    return {'id': obj_id, 'name': name, 'status': status,
+            'updated': int(updated)}
+
+
+class TestSync(unittest.TestCase):
+    def setUp(self):
+        # Objects that were last changed well before the first sync.
+        before = time.time() - 2 * peeringdb.SINCE_OVERLAP
+        objects = {obj_id: make_object(obj_id, f'IX {obj_id}',
+                                       updated=before)
+                   for obj_id in (3, 1, 2)}
+        self.handler = type('Handler', (PeeringDbHandler,),
+                            {'objects': objects, 'queries': list()})
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.api_base = f'http://127.0.0.1:{self.server.server_port}/api/'
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.state_file = os.path.join(tmp_dir.name, 'state',
+                                       'peeringdb.pickle.bz2')
+        self.session = make_session(1, retries=0)
+
+    def sync(self, full: bool = False) -> list:
+        self.handler.queries.clear()
+        return peeringdb.sync(self.session, self.api_base, [ENDPOINT],
+                              self.state_file, full)[ENDPOINT]
+
+    def assert_synced(self, data: list) -> None:
+        expected = [obj for _, obj in sorted(self.handler.objects.items())
+                    if obj['status'] == 'ok']
+        self.assertEqual(data, expected)
+
+    def assert_full_sync(self) -> None:
+        self.assertIn({'status': 'ok'}, self.handler.queries)
+
+    def assert_incremental_sync(self) -> None:
+        self.assertTrue(any('since' in params
+                            for params in self.handler.queries))
+        self.assertNotIn({'status': 'ok'}, self.handler.queries)
+
+    def test_initial_sync(self):
+        data = self.sync()
+        self.assert_synced(data)
+        self.assertEqual([obj['id'] for obj in data], [1, 2, 3])
+        self.assertEqual(self.handler.queries, [{'status': 'ok'}])
+        self.assertTrue(os.path.exists(self.state_file))
+
+    def test_delta_merge(self):
+        self.sync()
+        last_sync = peeringdb.load_state(self.state_file)['timestamp']
+        self.handler.objects[2] = make_object(2, 'Renamed IX')
+        self.handler.objects[4] = make_object(4, 'New IX')
+        data = self.sync()
+        self.assert_incremental_sync()
+        self.assert_synced(data)
+        self.assertEqual(data[1]['name'], 'Renamed IX')
+        # Changes are requested from a bit before the previous sync.
+        since = [params['since'] for params in self.handler.queries
+                 if 'since' in params]
+        self.assertEqual(since,
+                         [str(int(last_sync - peeringdb.SINCE_OVERLAP))])
+
+    def test_deletion(self):
+        self.sync()
+        self.handler.objects[1] = make_object(1, 'IX 1', status='deleted')
+        data = self.sync()
+        self.assert_incremental_sync()
+        self.assert_synced(data)
+        self.assertEqual([obj['id'] for obj in data], [2, 3])
+
+    def test_inconsistent_state_falls_back_to_full_sync(self):
+        self.sync()
+        # Removed without being visible to since queries.
+        del self.handler.objects[3]
+        data = self.sync()
+        self.assert_full_sync()
+        self.assert_synced(data)
+        self.assertEqual([obj['id'] for obj in data], [1, 2])
+
+    def test_failed_since_query_falls_back_to_full_sync(self):
+        self.sync()
+        self.handler.objects[2] = make_object(2, 'Renamed IX')
+        self.handler.failing = {'since'}
+        data = self.sync()
+        self.assert_full_sync()
+        self.assert_synced(data)
+
+    def test_old_state_falls_back_to_full_sync(self):
+        self.sync()
+        state = peeringdb.load_state(self.state_file)
+        state['timestamp'] -= peeringdb.MAX_STATE_AGE + 1
+        peeringdb.save_state(self.state_file, state)
+        self.assert_synced(self.sync())
+        self.assert_full_sync()
+
+    def test_forced_full_sync(self):
+        self.sync()
+        self.assert_synced(self.sync(full=True))
+        self.assertEqual(self.handler.queries, [{'status': 'ok'}])
+
+    def test_failed_full_sync_raises(self):
+        self.handler.failing = {'full'}
+        with self.assertRaises(requests.RequestException):
+            self.sync()
+
+
+if __name__ == '__main__':
+    unittest.main()
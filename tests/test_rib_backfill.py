@@ -0,0 +1,149 @@
+import os
+import re
+import sys
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'downloaders'))
+import get_rib_backfill  # noqa: E402
+from clients.session import make_session  # noqa: E402
+
+COLLECTOR = 'route-views.linx'
+DATE = datetime(2021, 4, 16)
+DUMP_PATH = '/route-views.linx/bgpdata/2021.04/RIBS/rib.20210416.0000.bz2'
+CONTENT = bytes(range(256)) * 1024
+
+
+class DumpHandler(BaseHTTPRequestHandler):
+    """Serve CONTENT at DUMP_PATH and record the Range header of each
+    request."""
+    honor_range = True
+    # Number of responses that are cut off after half of the body.
+    truncate = 0
+    # Full size announced in the Content-Range of 206 responses.
+    announced_size = None
+    ranges = None
+
+    def do_GET(self) -> None:
+        if self.path != DUMP_PATH:
+            self.send_error(404)
+            return
+        self.ranges.append(self.headers.get('Range'))
+        m = re.match(r'^bytes=(\d+)-$', self.headers.get('Range') or '')
+        start = int(m.group(1)) if m and self.honor_range else 0
+        if start >= len(CONTENT):
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{len(CONTENT)}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = CONTENT[start:]
+        if start:
+            size = self.announced_size or len(CONTENT)
+            self.send_response(206)
+            self.send_header('Content-Range',
+                             f'bytes {start}-{len(CONTENT) - 1}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.truncate:
+            type(self).truncate -= 1
+            body = body[:len(body) // 2]
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class TestDownload(unittest.TestCase):
+    def setUp(self):
+        self.handler = type('Handler', (DumpHandler,), {'ranges': list()})
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.output = os.path.join(tmp_dir.name, 'rib.bz2')
+        self.part = self.output + get_rib_backfill.PART_SUFFIX
+        base_url = f'http://127.0.0.1:{self.server.server_port}/'
+        self.url = get_rib_backfill.get_url(base_url, COLLECTOR, DATE)
+        patcher = mock.patch.object(get_rib_backfill, 'RETRY_DELAY', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def download(self) -> bool:
+        return get_rib_backfill.download(make_session(1), self.url,
+                                         self.output)
+
+    def write_part(self, data: bytes) -> None:
+        with open(self.part, 'wb') as f:
+            f.write(data)
+
+    def assert_downloaded(self):
+        with open(self.output, 'rb') as f:
+            self.assertEqual(f.read(), CONTENT)
+        self.assertFalse(os.path.exists(self.part))
+
+    def test_download(self):
+        self.assertTrue(self.download())
+        self.assert_downloaded()
+        self.assertEqual(self.handler.ranges, [None])
+
+    def test_missing_dump(self):
+        self.url += '.missing'
+        self.assertFalse(self.download())
+        self.assertFalse(os.path.exists(self.output))
+
+    def test_resume_interrupted_download(self):
+        self.handler.truncate = 1
+        self.assertTrue(self.download())
+        self.assert_downloaded()
+        # Only complete chunks are written before the connection drops.
+        chunk_size = get_rib_backfill.DOWNLOAD_CHUNK_SIZE
+        offset = len(CONTENT) // 2 // chunk_size * chunk_size
+        self.assertEqual(self.handler.ranges, [None, f'bytes={offset}-'])
+
+    def test_resume_across_runs(self):
+        self.write_part(CONTENT[:100])
+        self.assertTrue(self.download())
+        self.assert_downloaded()
+        self.assertEqual(self.handler.ranges, ['bytes=100-'])
+
+    def test_range_ignored(self):
+        self.handler.honor_range = False
+        self.write_part(b'x' * 100)
+        self.assertTrue(self.download())
+        self.assert_downloaded()
+        self.assertEqual(self.handler.ranges, ['bytes=100-'])
+
+    def test_complete_partial_download(self):
+        self.write_part(CONTENT)
+        self.assertTrue(self.download())
+        self.assert_downloaded()
+        self.assertEqual(self.handler.ranges, [f'bytes={len(CONTENT)}-'])
+
+    def test_partial_download_too_large(self):
+        self.write_part(CONTENT + b'x')
+        self.assertTrue(self.download())
+        self.assert_downloaded()
+        self.assertEqual(self.handler.ranges,
+                         [f'bytes={len(CONTENT) + 1}-', None])
+
+    def test_size_mismatch(self):
+        # The download ends up larger than announced, so it is restarted.
+        self.handler.announced_size = len(CONTENT) - 1
+        self.write_part(CONTENT[:100])
+        self.assertTrue(self.download())
+        self.assert_downloaded()
+        self.assertEqual(self.handler.ranges, ['bytes=100-', None])
+
+
+if __name__ == '__main__':
+    unittest.main()